@@ -121,6 +121,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # SQLite ignores SELECT ... FOR UPDATE; taking the write lock when a
+            # transaction starts makes parallel limit checks queue up instead
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file, not the in-memory default: the threaded tests need SQLite's
+        # lock waiting, which shared in-memory databases don't do
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -189,3 +198,66 @@ if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM]):
         "Set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, and TWILIO_WHATSAPP_FROM in .env file. "
         "For sandbox testing, use: whatsapp:+14155238886"
     )
+
+# Loan schedule template cache: number of distinct (amount, tenure, rate)
+# schedules kept in memory. Set to 0 to turn the cache off.
+LOANS_SCHEDULE_CACHE_SIZE = int(os.getenv('LOANS_SCHEDULE_CACHE_SIZE', '4096'))
+
+# EMI due dates: set LOANS_DUE_DATE_ROLL=following to move due dates that
+# fall on a weekend or a listed holiday to the next business day.
+LOANS_DUE_DATE_ROLL = os.getenv('LOANS_DUE_DATE_ROLL') or None
+LOANS_HOLIDAYS = [day for day in os.getenv('LOANS_HOLIDAYS', '').split(',') if day]
+
+# What-if simulations (loans.simulation): worker processes (default: one
+# per CPU), loans per chunk sent to each worker, and seconds before a run
+# is abandoned.
+LOANS_SIMULATION_WORKERS = int(os.getenv('LOANS_SIMULATION_WORKERS', '0')) or None
+LOANS_SIMULATION_CHUNK_SIZE = int(os.getenv('LOANS_SIMULATION_CHUNK_SIZE', '5000'))
+LOANS_SIMULATION_TIMEOUT = int(os.getenv('LOANS_SIMULATION_TIMEOUT', '300'))
+
+# Closed loans older than this many days are moved to the archive tables
+# by `python manage.py archive_closed_loans`.
+LOANS_ARCHIVE_AFTER_DAYS = int(os.getenv('LOANS_ARCHIVE_AFTER_DAYS', '365'))
+
+# Opt-in cursor pagination for loan/payment listings (?paginate=cursor):
+# default rows per page and the largest ?page_size= a client may ask for.
+LOANS_PAGE_SIZE = int(os.getenv('LOANS_PAGE_SIZE', '50'))
+LOANS_MAX_PAGE_SIZE = int(os.getenv('LOANS_MAX_PAGE_SIZE', '500'))
+
+# Cache framework: in-process locmem by default. Point CACHES at Redis or
+# Memcached to share cached responses between worker processes (the loan
+# response cache below needs a shared backend).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'loans'),
+    }
+}
+
+# Response cache for the loan read endpoints (loans.response_cache): set
+# LOANS_RESPONSE_CACHE=False to turn it off while debugging.
+LOANS_RESPONSE_CACHE = os.getenv('LOANS_RESPONSE_CACHE', 'True') == 'True'
+LOANS_RESPONSE_CACHE_ALIAS = 'default'
+LOANS_RESPONSE_CACHE_TIMEOUT = int(os.getenv('LOANS_RESPONSE_CACHE_TIMEOUT', '300'))
+# The response cache stays off with a per-process backend (locmem), whose
+# invalidations never reach the other workers; set this when the app runs
+# as one process (runserver, a single worker) to use it anyway.
+LOANS_RESPONSE_CACHE_SINGLE_PROCESS = os.getenv('LOANS_RESPONSE_CACHE_SINGLE_PROCESS', 'False') == 'True'
+
+# Idempotency-Key header on /pay/ and /foreclose/: how long a key's stored
+# response is replayed (expired keys: `python manage.py purge_idempotency_keys`).
+LOANS_IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('LOANS_IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+# An in-progress key older than this was left by a worker that died
+# mid-request; the next retry with it runs the request again.
+LOANS_IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('LOANS_IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+# POST /api/loans/bulk-decision/: decisions per request, and loans per
+# transaction while applying them.
+LOANS_BULK_DECISION_MAX = int(os.getenv('LOANS_BULK_DECISION_MAX', '1000'))
+LOANS_BULK_DECISION_BATCH_SIZE = int(os.getenv('LOANS_BULK_DECISION_BATCH_SIZE', '200'))
+
+# Settlement file ingestion (POST /api/loans/settlements/ and
+# `python manage.py ingest_settlements`): rows per transaction, and how many
+# failed rows the endpoint lists in its response.
+LOANS_SETTLEMENT_BATCH_SIZE = int(os.getenv('LOANS_SETTLEMENT_BATCH_SIZE', '500'))
+LOANS_SETTLEMENT_MAX_ERRORS = int(os.getenv('LOANS_SETTLEMENT_MAX_ERRORS', '1000'))
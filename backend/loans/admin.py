@@ -1,7 +1,10 @@
 from django.contrib import admin
-from .models import Loan,Payment
+from .models import ArchivedLoan, ArchivedPayment, IdempotencyKey, Loan, Payment
 
 # Register your models here.
 
 admin.site.register(Loan)
-admin.site.register(Payment)
\ No newline at end of file
+admin.site.register(Payment)
+admin.site.register(ArchivedLoan)
+admin.site.register(ArchivedPayment)
+admin.site.register(IdempotencyKey)
@@ -0,0 +1,93 @@
+"""
+Cold-storage archival of closed loans.
+
+Loans that were closed (REPAID, FORECLOSED, REJECTED, REJECTED_LIMIT)
+longer ago than LOANS_ARCHIVE_AFTER_DAYS are moved, with their payments,
+into ArchivedLoan / ArchivedPayment. Ids are kept, so
+GET /api/loans/<id>/ and /api/loans/<id>/payments/ still find them,
+while list, approval and payment queries only ever read the hot tables.
+
+Each batch is copied and deleted in its own transaction: an interrupted
+run leaves every loan either fully hot or fully archived, and simply
+running it again carries on where it stopped.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ArchivedLoan, ArchivedPayment, Loan, Payment
+
+CLOSED_STATUSES = ("REPAID", "FORECLOSED", "REJECTED", "REJECTED_LIMIT")
+
+
+def archivable_loans(older_than_days=None):
+    """
+    Closed loans whose closing date is older than the cut-off.
+
+    The closing date is the foreclosure date, else the last payment, else
+    the approval or application date (for rejections).
+    """
+    if older_than_days is None:
+        older_than_days = getattr(settings, "LOANS_ARCHIVE_AFTER_DAYS", 365)
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+
+    return (
+        Loan.objects.filter(status__in=CLOSED_STATUSES)
+        .annotate(closed_on=Coalesce("foreclosure_date", "last_paid_date", "approved_date", "applied_date"))
+        .filter(closed_on__lt=cutoff)
+        .order_by("pk")
+    )
+
+
+def archive_closed_loans(older_than_days=None, batch_size=500, max_batches=None, dry_run=False):
+    """
+    Move archivable loans and their payments into the archive tables,
+    `batch_size` loans per transaction (at most `max_batches` batches).
+
+    Returns: (loans archived, payments archived); with dry_run, what would
+    be archived, and nothing is written.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if dry_run:
+        loan_ids = archivable_loans(older_than_days).values("id")
+        if max_batches is not None:
+            loan_ids = loan_ids[:batch_size * max_batches]
+        loan_ids = list(loan_ids.values_list("id", flat=True))
+        return len(loan_ids), Payment.objects.filter(loan_id__in=loan_ids).count()
+
+    loan_fields = _shared_attnames(Loan, ArchivedLoan)
+    payment_fields = _shared_attnames(Payment, ArchivedPayment)
+    queryset = archivable_loans(older_than_days)
+
+    loans_archived = payments_archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            loan_ids = list(queryset.values_list("id", flat=True)[:batch_size])
+            if not loan_ids:
+                break
+
+            loans = Loan.objects.filter(id__in=loan_ids).values(*loan_fields)
+            payments = Payment.objects.filter(loan_id__in=loan_ids).values(*payment_fields)
+            ArchivedLoan.objects.bulk_create([ArchivedLoan(**row) for row in loans])
+            archived_payments = ArchivedPayment.objects.bulk_create([ArchivedPayment(**row) for row in payments])
+
+            # Payments go with the loans' cascade, which the payment receivers
+            # leave alone (no per-payment counter UPDATE on a loan being
+            # deleted); closed loans hold no exposure, so the ledger does not move
+            Loan.objects.filter(id__in=loan_ids).delete()
+
+        loans_archived += len(loan_ids)
+        payments_archived += len(archived_payments)
+        batches += 1
+
+    return loans_archived, payments_archived
+
+
+def _shared_attnames(source, target):
+    """Column names (attnames) both models have, e.g. "id", "user_id", "amount" """
+    target_attnames = {field.attname for field in target._meta.concrete_fields}
+    return [field.attname for field in source._meta.concrete_fields if field.attname in target_attnames]
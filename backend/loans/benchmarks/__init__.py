@@ -0,0 +1,152 @@
+"""
+Microbenchmarks for the loans.services financial core.
+
+Everything runs offline on generated data from a fixed seed, so two runs
+on the same machine time exactly the same work. Run it with:
+
+    python manage.py benchmark_services
+
+Results are compared against baseline.json in this folder; a case that
+got slower than the allowed tolerance fails the run. Timings only mean
+something on the machine that recorded them, so the baseline is not
+committed: record one locally before changing the code with
+
+    python manage.py benchmark_services --update-baseline
+"""
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from loans import services
+
+SEED = 20251016
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+
+def _random_terms(rng, count):
+    """(amount, tenure, start_date) tuples across the valid loan range"""
+    first_day = date(2024, 1, 1)
+    return [
+        (
+            Decimal(rng.randint(100000, 10000000)) / 100,  # ₹1,000.00 - ₹100,000.00
+            rng.randint(3, 24),
+            first_day + timedelta(days=rng.randint(0, 730)),
+        )
+        for _ in range(count)
+    ]
+
+
+def _month_end_dates():
+    """Start dates on the 28th-31st of every month, leap and non-leap years"""
+    starts = []
+    for year in (2023, 2024):
+        for month in range(1, 13):
+            for day in (28, 29, 30, 31):
+                try:
+                    starts.append(date(year, month, day))
+                except ValueError:
+                    continue
+    return starts
+
+
+def _time(function, repeat):
+    """Best wall-clock time of `repeat` runs (the least noisy estimate)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(batch_size=100000, repeat=5):
+    """
+    Run every benchmark case.
+
+    Returns: {case_name: {"ops": n, "seconds": best_total, "us_per_op": ...}}
+    """
+    rng = random.Random(SEED)
+    rate = services.DEFAULT_YEARLY_INTEREST
+    single = _random_terms(rng, 2000)
+    batch = _random_terms(rng, batch_size)
+    month_ends = _month_end_dates()
+    packed = [
+        services.pack_schedule(services.generate_amortization_schedule(amount, tenure, rate, start))
+        for amount, tenure, start in single
+    ]
+
+    def emi_uncached():
+        for amount, tenure, _ in single:
+            services._build_schedule_template(amount, tenure, rate)
+
+    def emi_cached():
+        for amount, tenure, _ in single:
+            services.calculate_emi(amount, tenure, rate)
+
+    def schedule_single():
+        for amount, tenure, start in single:
+            services.generate_amortization_schedule(amount, tenure, rate, start)
+
+    def schedule_batch():
+        services.generate_amortization_schedules(
+            [amount for amount, _, _ in batch],
+            [tenure for _, tenure, _ in batch],
+            [rate] * len(batch),
+            [start for _, _, start in batch],
+        )
+
+    def month_end_dates():
+        for start in month_ends:
+            for offset in range(1, 25):
+                services._add_months_safe(start, offset)
+
+    def outstanding():
+        for amount, tenure, _ in single:
+            services.calculate_outstanding_principal(amount, tenure, rate, tenure // 2)
+
+    def unpack():
+        for data in packed:
+            services.unpack_schedule(data)
+
+    # Warm the template cache so "cached" cases measure the hit path
+    emi_cached()
+
+    cases = [
+        ("emi_uncached", emi_uncached, len(single), repeat),
+        ("emi_cached", emi_cached, len(single), repeat),
+        ("schedule_single", schedule_single, len(single), repeat),
+        ("schedule_batch", schedule_batch, len(batch), max(1, repeat // 3)),
+        ("month_end_dates", month_end_dates, len(month_ends) * 24, repeat),
+        ("outstanding_principal", outstanding, len(single), repeat),
+        ("unpack_schedule", unpack, len(packed), repeat),
+    ]
+
+    results = {}
+    for name, function, ops, case_repeat in cases:
+        seconds = _time(function, case_repeat)
+        results[name] = {
+            "ops": ops,
+            "seconds": round(seconds, 6),
+            "us_per_op": round(seconds / ops * 1e6, 3),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare per-op timings with the baseline.
+
+    Returns a list of (case, baseline_us, current_us, ratio, regressed)
+    rows; a case regresses when it is more than `tolerance` times slower.
+    """
+    rows = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        baseline_us = baseline[name]["us_per_op"]
+        ratio = current["us_per_op"] / baseline_us if baseline_us else 1.0
+        rows.append((name, baseline_us, current["us_per_op"], ratio, ratio > tolerance))
+    return rows
@@ -0,0 +1,144 @@
+"""
+Approve / reject many pending loans in one request.
+
+decide_loans() works through the decisions in batches of
+LOANS_BULK_DECISION_BATCH_SIZE, one transaction per batch:
+
+1. lock the owners' exposure ledger rows (one query, in user_id order),
+   then the batch's pending loans (one SELECT ... FOR UPDATE);
+2. run the ₹100,000 approval limit per owner from the ledger's approved
+   total, adding each approval in request order (over the limit becomes
+   REJECTED_LIMIT, as on /approve/);
+3. move the loans with loans.state.transition_many(): the approved
+   loans' schedules come from one generate_amortization_schedules()
+   call, the loans are written with one UPDATE guarded on
+   status = 'PENDING', the ledger moves with one UPDATE per owner, and
+   the cached responses of every loan touched are invalidated.
+
+A decision that cannot be applied (unknown loan, not pending, duplicate)
+is reported in its result and does not affect the others.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .exposure import EXPOSURE_LIMIT, lock_exposures
+from .models import Loan
+from .state import transition_many
+
+DECISIONS = ("approve", "reject")
+
+
+def batch_size() -> int:
+    return getattr(settings, "LOANS_BULK_DECISION_BATCH_SIZE", 200)
+
+
+def max_decisions() -> int:
+    return getattr(settings, "LOANS_BULK_DECISION_MAX", 1000)
+
+
+def decide_loans(decisions, admin, size=None) -> list:
+    """
+    Apply [{"loan_id": 1, "decision": "approve"},
+           {"loan_id": 2, "decision": "reject", "reason": "..."}, ...] as `admin`.
+
+    Returns: one result per decision, in the same order, e.g.
+    {"loan_id": 1, "status": "APPROVED"} or
+    {"loan_id": 3, "error": "Only pending loans can be approved", "status": "REPAID"}
+    """
+    size = size or batch_size()
+    results = [None] * len(decisions)
+    todo = []
+    seen = set()
+    for index, item in enumerate(decisions):
+        error = _check_item(item, seen)
+        if error:
+            results[index] = {"loan_id": item.get("loan_id") if isinstance(item, dict) else None, "error": error}
+        else:
+            todo.append((index, item))
+
+    for start in range(0, len(todo), size):
+        batch = todo[start:start + size]
+        batch_results = _decide_batch([item for _index, item in batch], admin)
+        for (index, _item), result in zip(batch, batch_results):
+            results[index] = result
+    return results
+
+
+def _check_item(item, seen):
+    """Error message for a malformed or repeated decision (None if it is fine)"""
+    if not isinstance(item, dict):
+        return "Each decision must be an object"
+    loan_id = item.get("loan_id")
+    if not isinstance(loan_id, int) or isinstance(loan_id, bool):
+        return "loan_id must be an integer"
+    if item.get("decision") not in DECISIONS:
+        return 'decision must be "approve" or "reject"'
+    if item["decision"] == "reject":
+        reason = item.get("reason", "Application rejected")
+        if not reason or not isinstance(reason, str):
+            return "Rejection reason is required"
+    if loan_id in seen:
+        return "Duplicate loan_id in this request"
+    seen.add(loan_id)
+    return None
+
+
+def _decide_batch(batch, admin) -> list:
+    """Apply one batch of checked decisions in one transaction"""
+    loan_ids = [item["loan_id"] for item in batch]
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Ledger rows before loan rows: the same lock order as approve_loan
+        current = {
+            loan_id: (user_id, loan_status)
+            for loan_id, user_id, loan_status in Loan.objects.filter(pk__in=loan_ids).values_list("id", "user_id", "status")
+        }
+        approved_totals = {
+            user_id: row.approved_amount
+            for user_id, row in lock_exposures(user_id for user_id, _status in current.values()).items()
+        }
+        loans = Loan.objects.select_for_update().filter(pk__in=loan_ids, status="PENDING").in_bulk()
+
+        results = []
+        moves = []
+        for item in batch:
+            loan = loans.get(item["loan_id"])
+            if loan is None:
+                results.append(_not_pending(item, current))
+                continue
+            if loan.user_id not in approved_totals:
+                # Moved to another owner after the ledger rows were locked
+                results.append({"loan_id": loan.pk, "error": "Loan changed while it was processed, please retry"})
+                continue
+
+            if item["decision"] == "reject":
+                to_status, changes = "REJECTED", {"rejection_reason": item.get("reason", "Application rejected")}
+            elif approved_totals[loan.user_id] + loan.amount > EXPOSURE_LIMIT:
+                to_status, changes = "REJECTED_LIMIT", {
+                    "rejection_reason": (
+                        f"Loan limit exceeded. User already has ₹{approved_totals[loan.user_id]} in approved loans."
+                    ),
+                }
+            else:
+                to_status, changes = "APPROVED", {"approved_by": admin, "approved_date": now}
+                approved_totals[loan.user_id] += loan.amount
+            moves.append((loan, to_status, changes))
+
+            result = {"loan_id": loan.pk, "status": to_status}
+            if to_status != "APPROVED":
+                result["reason"] = changes["rejection_reason"]
+            results.append(result)
+
+        transition_many(moves)
+    return results
+
+
+def _not_pending(item, current):
+    """Result for a loan that is missing or no longer pending"""
+    if item["loan_id"] not in current:
+        return {"loan_id": item["loan_id"], "error": "Loan not found"}
+    verb = "approved" if item["decision"] == "approve" else "rejected"
+    _user_id, loan_status = current[item["loan_id"]]
+    return {"loan_id": item["loan_id"], "error": f"Only pending loans can be {verb}", "status": loan_status}
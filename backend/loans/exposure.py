@@ -0,0 +1,136 @@
+"""
+Per-user credit-exposure ledger.
+
+Every user may hold at most ₹100,000 in PENDING + APPROVED loans. Instead
+of summing the user's loans on each check, CreditExposure keeps the two
+running totals. Loan.save() moves them in the same transaction as the
+loan row, and so does the Loan post_delete receiver in loans.signals
+for every delete (Loan.delete(), queryset and admin "delete selected",
+cascades). queryset.update() and raw SQL bypass both; run
+repair_credit_exposure after those.
+
+To make a check-then-act decision (apply, approve), open a transaction
+and take the row lock first:
+
+    with transaction.atomic():
+        exposure = lock_exposure(user.pk)
+        if exposure.total + amount > EXPOSURE_LIMIT:
+            ...
+        loan.save()  # moves the locked row
+
+Parallel requests for the same user then queue on that row instead of
+all passing the check on stale totals.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+
+from .models import CreditExposure, Loan
+
+EXPOSURE_LIMIT = Decimal("100000")
+
+
+def lock_exposure(user_id) -> CreditExposure:
+    """
+    The user's ledger row, locked with SELECT ... FOR UPDATE until the
+    surrounding transaction ends. A missing row is built from the loans
+    table first (loans loaded from fixtures or written without save()).
+    """
+    if not CreditExposure.objects.filter(user_id=user_id).exists():
+        rebuild_exposure([user_id])
+        CreditExposure.objects.get_or_create(user_id=user_id)  # A user without loans
+    return CreditExposure.objects.select_for_update().get(user_id=user_id)
+
+
+def lock_exposures(user_ids) -> dict:
+    """
+    lock_exposure for several users: {user_id: locked ledger row}. Rows are
+    locked in user_id order, so two batches over overlapping users cannot
+    deadlock. Missing rows are built from the loans table first.
+    """
+    user_ids = sorted(set(user_ids))
+    existing = set(CreditExposure.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True))
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        rebuild_exposure(missing)
+    rows = CreditExposure.objects.select_for_update().filter(user_id__in=user_ids).order_by("user_id")
+    return {row.user_id: row for row in rows}
+
+
+def current_exposure(user_id) -> CreditExposure:
+    """The user's ledger row without a lock (an empty one if none exists yet)"""
+    return CreditExposure.objects.filter(user_id=user_id).first() or CreditExposure(user_id=user_id)
+
+
+def apply_exposure_change(old_share, new_share):
+    """
+    Move the ledger from one loan state to another.
+
+    Shares are (user_id, pending amount, approved amount) as returned by
+    Loan._exposure_share(), or None for "no loan" (created / deleted).
+    Uses F() updates, so it is safe next to other writers of the row.
+    """
+    apply_exposure_changes([(old_share, new_share)])
+
+
+def apply_exposure_changes(changes):
+    """
+    apply_exposure_change for many loans at once: takes (old share, new
+    share) pairs and writes one UPDATE per affected user.
+    """
+    deltas = defaultdict(lambda: [Decimal("0"), Decimal("0")])
+    for old_share, new_share in changes:
+        for share, sign in ((old_share, -1), (new_share, 1)):
+            if share is None or share[0] is None:
+                continue
+            user_id, pending, approved = share
+            deltas[user_id][0] += sign * pending
+            deltas[user_id][1] += sign * approved
+
+    for user_id, (pending_delta, approved_delta) in deltas.items():
+        if not pending_delta and not approved_delta:
+            continue
+        updated = CreditExposure.objects.filter(user_id=user_id).update(
+            pending_amount=F("pending_amount") + pending_delta,
+            approved_amount=F("approved_amount") + approved_delta,
+        )
+        if not updated:
+            # First loan for this user: start the row from the loans table
+            rebuild_exposure([user_id])
+
+
+def rebuild_exposure(user_ids=None):
+    """
+    Recompute ledger rows from the loans table (all users with loans or
+    a ledger row if user_ids is None).
+
+    Returns: list of (user_id, stored total, actual total) that were wrong
+    """
+    loans = Loan.objects.order_by().values("user_id").annotate(
+        pending=Sum("amount", filter=Q(status="PENDING")),
+        approved=Sum("amount", filter=Q(status="APPROVED")),
+    )
+    rows = CreditExposure.objects.all()
+    if user_ids is not None:
+        loans = loans.filter(user_id__in=user_ids)
+        rows = rows.filter(user_id__in=user_ids)
+
+    actual = {
+        row["user_id"]: (row["pending"] or Decimal("0"), row["approved"] or Decimal("0"))
+        for row in loans
+    }
+    stored = {row.user_id: row for row in rows}
+
+    mismatches = []
+    for user_id in sorted(set(actual) | set(stored)):
+        pending, approved = actual.get(user_id, (Decimal("0"), Decimal("0")))
+        row = stored.get(user_id)
+        if row is not None and (row.pending_amount, row.approved_amount) == (pending, approved):
+            continue
+        mismatches.append((user_id, row.total if row else Decimal("0"), pending + approved))
+        CreditExposure.objects.update_or_create(
+            user_id=user_id,
+            defaults={"pending_amount": pending, "approved_amount": approved},
+        )
+    return mismatches
@@ -0,0 +1,165 @@
+"""
+Idempotency-Key support for the payment and foreclosure POSTs.
+
+Mobile clients retry /pay/ and /foreclose/ when a request times out. If
+they send the same Idempotency-Key header on every attempt, only the
+first attempt runs; the others get the stored response back (with an
+Idempotent-Replayed: true header) from the IdempotencyKey table, without
+reading or locking any loan:
+
+- first request: a row is inserted (and committed) as "in progress";
+  the view then runs in one transaction with the UPDATE that stores its
+  response on the row, so the payment and its stored response commit
+  together or not at all (5xx and 409 responses are not stored, so
+  those can be retried with the same key);
+- a retry while the first attempt is still running gets 409;
+- an in-progress row older than LOANS_IDEMPOTENCY_LEASE_SECONDS was left
+  by a worker that died mid-request (its writes rolled back), so the
+  next retry takes it over and runs the view; the stored response is
+  only written while the row is still held by the same claim, so a slow
+  attempt that lost its lease rolls back instead of paying twice;
+- the same key with a different path or body gets 422;
+- keys are per user and expire after LOANS_IDEMPOTENCY_KEY_TTL_HOURS
+  (purged lazily and by `python manage.py purge_idempotency_keys`).
+
+Requests without the header behave exactly as before.
+"""
+from datetime import timedelta
+from functools import wraps
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Outcomes worth retrying are not stored against the key
+_RETRYABLE_STATUSES = {status.HTTP_409_CONFLICT}
+
+
+class _LeaseLost(Exception):
+    """Another attempt took the key over while this one was running"""
+
+
+def key_ttl() -> timedelta:
+    return timedelta(hours=getattr(settings, "LOANS_IDEMPOTENCY_KEY_TTL_HOURS", 24))
+
+
+def lease() -> timedelta:
+    return timedelta(seconds=getattr(settings, "LOANS_IDEMPOTENCY_LEASE_SECONDS", 60))
+
+
+def purge_expired_keys() -> int:
+    """Delete keys older than the TTL; returns how many were removed"""
+    deleted, _by_model = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - key_ttl()).delete()
+    return deleted
+
+
+def idempotent(view):
+    """
+    Honour the Idempotency-Key header on a DRF view (a function view under
+    @permission_classes, or a view method such as post()).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[1] if len(args) > 1 else args[0]  # (self, request) or (request)
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = _fingerprint(request)
+        record, created = _claim(request.user, key, fingerprint)
+        if not created:
+            return _replay(record, fingerprint)
+
+        claimed = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at, status_code__isnull=True)
+        try:
+            with transaction.atomic():
+                response = view(*args, **kwargs)
+                if response.status_code >= 500 or response.status_code in _RETRYABLE_STATUSES:
+                    claimed.delete()  # Nothing stored: the client may retry with the same key
+                elif not claimed.update(status_code=response.status_code, response_body=response.data):
+                    raise _LeaseLost
+        except _LeaseLost:
+            return _in_progress()
+        except Exception:
+            claimed.delete()
+            raise
+        return response
+
+    return wrapper
+
+
+def _fingerprint(request) -> str:
+    """What the key promises not to change: method, path and body"""
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.body):
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """
+    (record, created): insert an in-progress row for the key, or return
+    the live row another attempt already created. An expired row is
+    replaced; an in-progress row past its lease is taken over (one
+    conditional UPDATE, so only one retry gets it).
+    """
+    for _attempt in range(2):
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is not None:
+            now = timezone.now()
+            if record.created_at < now - key_ttl():
+                record.delete()
+            elif (
+                record.status_code is None
+                and record.request_fingerprint == fingerprint
+                and record.created_at < now - lease()
+            ):
+                if IdempotencyKey.objects.filter(
+                    pk=record.pk, created_at=record.created_at, status_code__isnull=True
+                ).update(created_at=now):
+                    record.created_at = now
+                    return record, True
+                continue  # Another retry took it over first
+            else:
+                return record, False
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, key=key, request_fingerprint=fingerprint), True
+        except IntegrityError:
+            continue  # A parallel attempt claimed it first: read its row
+    return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+def _replay(record, fingerprint):
+    if record.request_fingerprint != fingerprint:
+        return Response(
+            {"error": f"This {HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return _in_progress()
+    response = Response(record.response_body, status=record.status_code)
+    response[REPLAY_HEADER] = "true"
+    return response
+
+
+def _in_progress():
+    return Response(
+        {"error": f"A request with this {HEADER} is still being processed, retry shortly"},
+        status=status.HTTP_409_CONFLICT,
+    )
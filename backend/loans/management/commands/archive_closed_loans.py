@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.archive import archive_closed_loans
+
+
+class Command(BaseCommand):
+    help = "Move closed loans (and their payments) older than LOANS_ARCHIVE_AFTER_DAYS into the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, help="Override LOANS_ARCHIVE_AFTER_DAYS")
+        parser.add_argument("--batch-size", type=int, default=500, help="Loans moved per transaction (default: 500)")
+        parser.add_argument("--max-batches", type=int, help="Stop after this many batches (run again to resume)")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+
+    def handle(self, *args, **options):
+        try:
+            loans, payments = archive_closed_loans(
+                older_than_days=options["older_than_days"],
+                batch_size=options["batch_size"],
+                max_batches=options["max_batches"],
+                dry_run=options["dry_run"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{loans} loan(s) and {payments} payment(s) would be archived (dry run)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Archived {loans} loan(s) and {payments} payment(s)."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from loans.services import backfill_amortization_schedules
+
+
+class Command(BaseCommand):
+    help = "Store amortization schedules for approved loans in bulk (bulk_update per batch)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of loans written per UPDATE batch (default: 500)",
+        )
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Regenerate schedules even for loans that already have one",
+        )
+
+    def handle(self, *args, **options):
+        updated = backfill_amortization_schedules(
+            batch_size=options["batch_size"],
+            overwrite=options["overwrite"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stored amortization schedules for {updated} loan(s)."))
@@ -0,0 +1,80 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the loans.services financial core and compare against a baseline recorded "
+        "on this machine (--update-baseline records it)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100000, help="Loans in the batch case (default: 100000)")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per case; the best time is kept (default: 5)")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument(
+            "--baseline",
+            default=str(benchmarks.BASELINE_PATH),
+            help="Baseline JSON to compare against (default: loans/benchmarks/baseline.json)",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.5,
+            help="Fail if a case is more than this many times slower than baseline (default: 1.5)",
+        )
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Save these results as the new baseline instead of comparing",
+        )
+
+    def handle(self, *args, **options):
+        results = benchmarks.run(batch_size=options["batch_size"], repeat=options["repeat"])
+        report = {
+            "seed": benchmarks.SEED,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "batch_size": options["batch_size"],
+            "results": results,
+        }
+
+        for name, result in results.items():
+            self.stdout.write(f"{name:<24} {result['us_per_op']:>10.3f} µs/op  ({result['ops']} ops, {result['seconds']:.4f}s)")
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(report, handle, indent=2)
+
+        if options["update_baseline"]:
+            with open(options["baseline"], "w") as handle:
+                json.dump(report, handle, indent=2)
+                handle.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}."))
+            return
+
+        try:
+            with open(options["baseline"]) as handle:
+                baseline = json.load(handle)["results"]
+        except FileNotFoundError:
+            raise CommandError(
+                f"No baseline at {options['baseline']}; record one on this machine with --update-baseline first."
+            )
+
+        regressions = []
+        self.stdout.write("")
+        for name, baseline_us, current_us, ratio, regressed in benchmarks.compare(results, baseline, options["tolerance"]):
+            line = f"{name:<24} baseline {baseline_us:>10.3f}  now {current_us:>10.3f}  x{ratio:.2f}"
+            if regressed:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"Performance regression in: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS("No performance regressions against baseline."))
@@ -0,0 +1,142 @@
+import random
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans import services
+
+
+class Command(BaseCommand):
+    help = (
+        "Differential check of the integer-paise money engine against the Decimal "
+        "reference for every whole-rupee (amount, tenure) combination and a seeded "
+        "random sample of amounts with paise, plus a speed comparison. (The test "
+        "suite checks a smaller grid against a frozen copy of the original Decimal "
+        "code: loans.tests.MoneyEngineTests.)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-amount", type=int, default=1000, help="Smallest amount in rupees (default: 1000)")
+        parser.add_argument("--max-amount", type=int, default=100000, help="Largest amount in rupees (default: 100000)")
+        parser.add_argument("--step", type=int, default=1, help="Amount step in rupees (default: 1, i.e. every amount)")
+        parser.add_argument("--min-tenure", type=int, default=3)
+        parser.add_argument("--max-tenure", type=int, default=24)
+        parser.add_argument(
+            "--rate",
+            action="append",
+            help="Yearly interest rate to check, repeatable (default: 10.0)",
+        )
+        parser.add_argument(
+            "--schedules",
+            action="store_true",
+            help="Also compare every schedule row, not just EMI/total/interest (much slower)",
+        )
+        parser.add_argument(
+            "--paise-samples",
+            type=int,
+            default=20000,
+            help="Random amounts with paise (e.g. 48213.57) checked per rate, in the same ranges (default: 20000)",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the paise sample (default: 0)")
+        parser.add_argument(
+            "--benchmark-size",
+            type=int,
+            default=2000,
+            help="Number of loans timed for the speed comparison (0 to skip)",
+        )
+
+    def handle(self, *args, **options):
+        rates = [Decimal(rate) for rate in (options["rate"] or ["10.0"])]
+        amounts = range(options["min_amount"], options["max_amount"] + 1, options["step"])
+        tenures = range(options["min_tenure"], options["max_tenure"] + 1)
+
+        # Every whole-rupee amount, then a reproducible sample with paise
+        rng = random.Random(options["seed"])
+        paise_range = (options["min_amount"] * 100, options["max_amount"] * 100)
+        sweeps = (
+            ("whole-rupee", lambda: ((amount, tenure) for tenure in tenures for amount in amounts)),
+            ("paise", lambda: (
+                (Decimal(rng.randint(*paise_range)).scaleb(-2), rng.choice(tenures))
+                for _ in range(options["paise_samples"])
+            )),
+        )
+
+        mismatches = []
+        for label, combinations in sweeps:
+            checked = 0
+            fallbacks = 0
+            started = time.perf_counter()
+            for rate in rates:
+                rate_fraction = services._rate_fraction(rate)
+                for amount, tenure in combinations():
+                    checked += 1
+                    fallback, mismatch = self._compare(amount, tenure, rate, rate_fraction, options["schedules"])
+                    fallbacks += fallback
+                    if mismatch:
+                        mismatches.append(mismatch)
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Checked {checked} {label} combination(s) in {elapsed:.1f}s "
+                f"({fallbacks} settled by the Decimal tie-break path)."
+            )
+
+        if options["benchmark_size"]:
+            self._benchmark(options["benchmark_size"], rates[0])
+
+        if mismatches:
+            for amount, tenure, rate, kind, engine, reference in mismatches[:20]:
+                self.stderr.write(f"  {kind} mismatch: amount={amount} tenure={tenure} rate={rate}: {engine} != {reference}")
+            raise CommandError(f"{len(mismatches)} mismatch(es) between the integer engine and Decimal.")
+
+        self.stdout.write(self.style.SUCCESS("Integer-paise engine matches the Decimal reference."))
+
+    def _compare(self, amount, tenure, rate, rate_fraction, schedules):
+        """(whether the engine fell back to Decimal, mismatch tuple or None) for one set of terms"""
+        fallback = services._emi_paise(int(amount * 100), tenure, *rate_fraction) is None
+
+        template = services._build_schedule_template(amount, tenure, rate)
+        engine = (template.emi, template.total_payable, template.total_interest)
+        reference = services._calculate_emi_decimal(amount, tenure, rate)
+        if list(map(str, engine)) != list(map(str, reference)):
+            return fallback, (amount, tenure, rate, "emi", engine, reference)
+
+        if schedules:
+            reference_rows = tuple(
+                tuple(round(entry[key] * 100) for key in ("emi_amount", "principal", "interest", "remaining_balance"))
+                for entry in services._generate_schedule_decimal(amount, tenure, rate)
+            )
+            if reference_rows != template.rows:
+                return fallback, (amount, tenure, rate, "schedule", template.rows, reference_rows)
+        return fallback, None
+
+    def _benchmark(self, size, rate):
+        """Time EMI and full schedules for `size` loans with both implementations"""
+        terms = [(1000 + (index * 7919) % 99001, 3 + index % 22) for index in range(size)]
+        rate_numerator, rate_denominator = services._rate_fraction(rate)
+        start_date = date(2024, 1, 31)
+
+        def engine_schedule(amount, tenure):
+            template = services._build_schedule_template(amount, tenure, rate)
+            due_dates = [services._add_months_safe(start_date, month).isoformat() for month in range(1, tenure + 1)]
+            return services._schedule_entries(template.rows, due_dates)
+
+        def timed(function):
+            started = time.perf_counter()
+            for amount, tenure in terms:
+                function(amount, tenure)
+            return (time.perf_counter() - started) / size * 1e6
+
+        results = [
+            ("EMI", timed(lambda a, n: services._calculate_emi_decimal(a, n, rate)),
+             timed(lambda a, n: services._emi_paise(a * 100, n, rate_numerator, rate_denominator))),
+            ("Schedule", timed(lambda a, n: services._generate_schedule_decimal(a, n, rate, start_date)),
+             timed(engine_schedule)),
+        ]
+        for label, decimal_us, engine_us in results:
+            self.stdout.write(
+                f"{label:<9} Decimal {decimal_us:8.2f} µs/loan   integer {engine_us:8.2f} µs/loan   "
+                f"speedup {decimal_us / engine_us:5.1f}x"
+            )
@@ -0,0 +1,43 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from loans.services import iter_foreclosure_quotes
+
+
+class Command(BaseCommand):
+    help = "Write the daily payoff file: a foreclosure quote for every approved loan (CSV)"
+
+    FIELDS = [
+        "loan_id",
+        "user",
+        "original_amount",
+        "monthly_installment",
+        "total_tenure",
+        "payments_made",
+        "payments_remaining",
+        "foreclosure_amount",
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="File to write (default: print to stdout)",
+        )
+
+    def handle(self, *args, **options):
+        if options["output"]:
+            with open(options["output"], "w", newline="") as handle:
+                count = self._write(handle)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {count} foreclosure quote(s) to {options['output']}."))
+        else:
+            self._write(self.stdout)
+
+    def _write(self, handle):
+        writer = csv.DictWriter(handle, fieldnames=self.FIELDS)
+        writer.writeheader()
+        count = 0
+        for quote in iter_foreclosure_quotes():
+            writer.writerow(quote)
+            count += 1
+        return count
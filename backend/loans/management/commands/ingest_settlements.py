@@ -0,0 +1,54 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.settlements import FORMATS, guess_format, ingest_settlements
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply a gateway settlement file of EMI payments (NDJSON or CSV, see loans.settlements). "
+        "The file is streamed; failed rows are listed and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='Settlement file ("-" to read stdin)')
+        parser.add_argument("--format", choices=FORMATS, help="File format (default: from the file extension)")
+        parser.add_argument("--batch-size", type=int, help="Rows per transaction (default: LOANS_SETTLEMENT_BATCH_SIZE)")
+        parser.add_argument("--errors", help="Write failed rows to this CSV file instead of printing them")
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or guess_format(options["path"])
+        if file_format is None:
+            raise CommandError(f"Cannot tell the format of {options['path']}; pass --format {' or '.join(FORMATS)}.")
+
+        error_file = open(options["errors"], "w", newline="") if options["errors"] else None
+        try:
+            if error_file:
+                writer = csv.DictWriter(error_file, fieldnames=["line", "loan_id", "error"])
+                writer.writeheader()
+                on_error = writer.writerow
+            else:
+                def on_error(error):
+                    self.stderr.write(f"line {error['line']}: loan {error['loan_id']}: {error['error']}")
+
+            if options["path"] == "-":
+                report = ingest_settlements(sys.stdin, file_format, on_error=on_error, size=options["batch_size"])
+            else:
+                with open(options["path"], encoding="utf-8", errors="replace", newline="") as handle:
+                    report = ingest_settlements(handle, file_format, on_error=on_error, size=options["batch_size"])
+        finally:
+            if error_file:
+                error_file.close()
+
+        self.stdout.write(
+            f"{report['rows']} row(s): {report['applied']} payment(s) applied, {report['failed']} failed, "
+            f"{report['loans_repaid']} loan(s) fully repaid."
+        )
+        if report["failed"] and error_file:
+            self.stdout.write(self.style.WARNING(f"Failed rows written to {options['errors']}."))
+        elif report["failed"]:
+            self.stdout.write(self.style.WARNING("Some rows were not applied; see the errors above."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every row was applied."))
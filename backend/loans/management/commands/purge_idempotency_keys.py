@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from loans.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete Idempotency-Key records older than LOANS_IDEMPOTENCY_KEY_TTL_HOURS (run it from cron)"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired idempotency key(s)."))
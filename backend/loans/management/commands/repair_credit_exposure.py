@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from loans.exposure import rebuild_exposure
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's credit-exposure ledger row from their PENDING/APPROVED loans"
+
+    def handle(self, *args, **options):
+        mismatches = rebuild_exposure()
+
+        for user_id, stored, actual in mismatches:
+            self.stdout.write(f"User {user_id}: exposure ₹{stored} -> ₹{actual}")
+
+        if mismatches:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(mismatches)} ledger row(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("All exposure ledger rows are consistent."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from loans.services import repair_payment_counters
+
+
+class Command(BaseCommand):
+    help = "Recount each loan's paid_emi_count / last_paid_date from its payments and fix any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Loans checked per query (default: 500)")
+        parser.add_argument("--dry-run", action="store_true", help="Only report loans whose counters are wrong")
+
+    def handle(self, *args, **options):
+        mismatches = repair_payment_counters(batch_size=options["batch_size"], dry_run=options["dry_run"])
+
+        for loan_id, stored, actual in mismatches:
+            self.stdout.write(f"Loan {loan_id}: paid_emi_count {stored} -> {actual}")
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All payment counters are consistent."))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(mismatches)} loan(s) need repair (dry run, nothing written)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(mismatches)} loan(s)."))
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.simulation import SimulationTimeout, run_simulation
+
+
+class Command(BaseCommand):
+    help = "Rerun the approved loan book under a what-if scenario (rate change, prepayment, tenure extension)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", type=float, help="New yearly interest rate in percent (e.g. 12)")
+        parser.add_argument("--extra-months", type=int, default=0, help="Extend every loan by this many EMIs")
+        parser.add_argument("--prepayment-month", type=int, help="EMI number after which borrowers prepay")
+        parser.add_argument("--prepayment-amount", help="Amount each borrower prepays (₹)")
+        parser.add_argument("--workers", type=int, help="Worker processes (default: LOANS_SIMULATION_WORKERS or one per CPU)")
+        parser.add_argument("--chunk-size", type=int, help="Loans per chunk (default: LOANS_SIMULATION_CHUNK_SIZE)")
+        parser.add_argument("--output", help="Also write the full result as JSON to this file")
+
+    def handle(self, *args, **options):
+        scenario = {"extra_months": options["extra_months"]}
+        if options["rate"] is not None:
+            scenario["yearly_interest"] = options["rate"]
+        if options["prepayment_month"] is not None:
+            scenario["prepayment_month"] = options["prepayment_month"]
+        if options["prepayment_amount"] is not None:
+            scenario["prepayment_amount"] = options["prepayment_amount"]
+
+        try:
+            result = run_simulation(scenario, workers=options["workers"], chunk_size=options["chunk_size"])
+        except (ValueError, SimulationTimeout) as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(f"Loans simulated: {result['loans']}")
+        for label in ("interest_income", "collections"):
+            self.stdout.write(
+                f"{label:<16} baseline {result['baseline'][label]:>16}  "
+                f"scenario {result['scenario'][label]:>16}  delta {result['delta'][label]:>16}"
+            )
+        self.stdout.write(f"{'prepayments':<16} {result['scenario']['prepayments']:>25}")
+        self.stdout.write("")
+        for month in result["months"]:
+            self.stdout.write(f"{month['month']}  {month['baseline']:>16}  {month['scenario']:>16}  {month['delta']:>16}")
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(result, handle, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Wrote simulation result to {options['output']}."))
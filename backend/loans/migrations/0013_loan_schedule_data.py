@@ -0,0 +1,84 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:10
+
+import struct
+from datetime import date
+
+from django.db import migrations, models
+
+# Frozen copy of the format-1 layout from loans.services.pack_schedule /
+# unpack_schedule, so this migration keeps working if the format changes.
+HEADER = struct.Struct("<BH")
+MONEY_FIELDS = ("emi_amount", "principal", "interest", "remaining_balance")
+BATCH_SIZE = 500
+
+
+def pack(schedule):
+    count = len(schedule)
+    columns = [struct.pack(f"<{count}I", *(date.fromisoformat(entry["due_date"]).toordinal() for entry in schedule))]
+    for field in MONEY_FIELDS:
+        columns.append(struct.pack(f"<{count}i", *(round(entry[field] * 100) for entry in schedule)))
+    return HEADER.pack(1, count) + b"".join(columns)
+
+
+def unpack(data):
+    data = bytes(data)
+    _, count = HEADER.unpack_from(data)
+    columns = [struct.unpack_from(f"<{count}I", data, HEADER.size)]
+    for column in range(1, len(MONEY_FIELDS) + 1):
+        columns.append(struct.unpack_from(f"<{count}i", data, HEADER.size + column * count * 4))
+    return [
+        {
+            "emi_number": month,
+            "due_date": date.fromordinal(due_date).isoformat(),
+            **{field: value / 100 for field, value in zip(MONEY_FIELDS, values)},
+        }
+        for month, (due_date, *values) in enumerate(zip(*columns), start=1)
+    ]
+
+
+def _convert(Loan, source, target, convert):
+    """Copy one schedule column into the other, one primary-key batch at a time"""
+    last_pk = 0
+    while True:
+        batch = list(
+            Loan.objects.filter(pk__gt=last_pk, **{f"{source}__isnull": False})
+            .only("id", source)
+            .order_by("pk")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for loan in batch:
+            value = getattr(loan, source)
+            setattr(loan, target, convert(value) if value else None)
+        Loan.objects.bulk_update(batch, [target])
+        last_pk = batch[-1].pk
+
+
+def pack_schedules(apps, schema_editor):
+    Loan = apps.get_model("loans", "Loan")
+    _convert(Loan, "amortization_schedule", "schedule_data", pack)
+
+
+def unpack_schedules(apps, schema_editor):
+    Loan = apps.get_model("loans", "Loan")
+    _convert(Loan, "schedule_data", "amortization_schedule", unpack)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0012_payment_payment_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='schedule_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_schedules, unpack_schedules),
+        migrations.RemoveField(
+            model_name='loan',
+            name='amortization_schedule',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:43
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_payment_counters(apps, schema_editor):
+    """Count each loan's successful payments once, in a single UPDATE"""
+    Loan = apps.get_model("loans", "Loan")
+    Payment = apps.get_model("loans", "Payment")
+    successful = Payment.objects.filter(loan=OuterRef("pk"), status="SUCCESS").order_by().values("loan")
+    Loan.objects.update(
+        paid_emi_count=Coalesce(
+            Subquery(successful.annotate(total=Count("id")).values("total"), output_field=IntegerField()), 0
+        ),
+        last_paid_date=Subquery(successful.annotate(latest=Max("payment_date")).values("latest")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0013_loan_schedule_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='last_paid_date',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Date of the latest successful payment', null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='paid_emi_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Successful payments so far'),
+        ),
+        migrations.RunPython(fill_payment_counters, migrations.RunPython.noop),
+    ]
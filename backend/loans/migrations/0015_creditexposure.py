@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:46
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def fill_exposure(apps, schema_editor):
+    """One ledger row per user who has loans, from a single grouped query"""
+    Loan = apps.get_model("loans", "Loan")
+    CreditExposure = apps.get_model("loans", "CreditExposure")
+    totals = Loan.objects.order_by().values("user_id").annotate(
+        pending=Sum("amount", filter=Q(status="PENDING")),
+        approved=Sum("amount", filter=Q(status="APPROVED")),
+    )
+    CreditExposure.objects.bulk_create(
+        [
+            CreditExposure(
+                user_id=row["user_id"],
+                pending_amount=row["pending"] or Decimal("0"),
+                approved_amount=row["approved"] or Decimal("0"),
+            )
+            for row in totals
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0014_loan_paid_emi_count'),
+        ('users', '__first__'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditExposure',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_exposure', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending_amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('approved_amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(fill_exposure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0016_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoan',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tenure', models.PositiveIntegerField()),
+                ('interest_rate', models.FloatField(default=10.0)),
+                ('monthly_installment', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('total_payable', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('total_interest', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('is_closed', models.BooleanField(default=True)),
+                ('schedule_data', models.BinaryField(blank=True, null=True)),
+                ('paid_emi_count', models.PositiveIntegerField(default=0)),
+                ('last_paid_date', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending Approval'), ('APPROVED', 'Approved & Active'), ('REJECTED', 'Rejected'), ('REJECTED_LIMIT', 'Rejected - Limit Reached'), ('FORECLOSED', 'Foreclosed'), ('REPAID', 'Fully Repaid')], max_length=15)),
+                ('applied_date', models.DateTimeField()),
+                ('approved_date', models.DateTimeField(blank=True, null=True)),
+                ('rejection_reason', models.TextField(blank=True)),
+                ('foreclosure_date', models.DateTimeField(blank=True, null=True)),
+                ('foreclosure_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('approved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-applied_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payment_date', models.DateTimeField()),
+                ('emi_number', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SUCCESS', 'Success'), ('FAILED', 'Failed')], max_length=10)),
+                ('payment_type', models.CharField(choices=[('EMI', 'Regular EMI Payment'), ('FORECLOSURE', 'Foreclosure Settlement')], default='EMI', max_length=15)),
+                ('gateway_reference', models.CharField(blank=True, max_length=100)),
+                ('gateway_response', models.JSONField(blank=True, default=dict)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='loans.archivedloan')),
+            ],
+            options={
+                'ordering': ['payment_date'],
+                'unique_together': {('loan', 'emi_number')},
+            },
+        ),
+    ]
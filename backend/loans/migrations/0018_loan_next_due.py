@@ -0,0 +1,118 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:54
+
+import struct
+from calendar import monthrange
+from datetime import date, timedelta
+from decimal import Context, Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP, localcontext
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of loans.services.next_due_emi (format-1 schedule layout,
+# 10% Decimal schedule, due-date roll-forward), so this migration keeps
+# giving the same answers if those change.
+HEADER = struct.Struct("<BH")
+MONEY_FIELDS = ("emi_amount", "principal", "interest", "remaining_balance")
+YEARLY_INTEREST = Decimal("10.0")
+DECIMAL_CONTEXT = Context(prec=28, rounding=ROUND_HALF_EVEN)
+
+
+def round_to_paise(value):
+    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP, context=DECIMAL_CONTEXT)
+
+
+def due_date(start_date, emi_number):
+    """start date + emi_number months (day capped at month end), rolled if configured"""
+    month_index = start_date.year * 12 + start_date.month - 1 + emi_number
+    year, month = divmod(month_index, 12)
+    due = date(year, month + 1, min(start_date.day, monthrange(year, month + 1)[1]))
+    if getattr(settings, "LOANS_DUE_DATE_ROLL", None) == "following":
+        holidays = {date.fromisoformat(day) for day in getattr(settings, "LOANS_HOLIDAYS", ())}
+        while due.weekday() >= 5 or due in holidays:
+            due += timedelta(days=1)
+    return due
+
+
+def scheduled_emi(data, emi_number):
+    """(due date, EMI amount) of one row of a format-1 schedule, or (None, None)"""
+    data = bytes(data)
+    _, count = HEADER.unpack_from(data)
+    if emi_number > count:
+        return None, None
+    offset = HEADER.size + (emi_number - 1) * 4
+    (ordinal,) = struct.unpack_from("<I", data, offset)
+    (emi_paise,) = struct.unpack_from("<i", data, offset + count * 4)
+    return date.fromordinal(ordinal), Decimal(emi_paise).scaleb(-2, DECIMAL_CONTEXT)
+
+
+def computed_emi(loan_amount, months, start_date, emi_number):
+    """(due date, EMI amount) of one EMI worked out from the terms"""
+    with localcontext(DECIMAL_CONTEXT):
+        monthly_rate = YEARLY_INTEREST / Decimal("100") / Decimal("12")
+        power = (Decimal("1") + monthly_rate) ** Decimal(months)
+        emi_value = round_to_paise(round_to_paise(Decimal(loan_amount) * monthly_rate * power / (power - Decimal("1"))))
+        remaining_balance = Decimal(loan_amount)
+        for month in range(1, emi_number + 1):
+            interest = round_to_paise(remaining_balance * monthly_rate)
+            principal = round_to_paise(emi_value - interest)
+            if month == months:
+                # The last EMI clears the rounding residue
+                principal = remaining_balance
+                emi_value = round_to_paise(principal + interest)
+            remaining_balance = round_to_paise(remaining_balance - principal)
+    return due_date(start_date, emi_number), emi_value
+
+
+def next_due_emi(status, loan_amount, months, start_date, paid_emis, schedule_data=None):
+    if status != "APPROVED" or paid_emis >= months:
+        return None, None
+    if schedule_data:
+        return scheduled_emi(schedule_data, paid_emis + 1)
+    return computed_emi(loan_amount, months, start_date, paid_emis + 1)
+
+
+def fill_next_due(apps, schema_editor):
+    """Work out the next unpaid EMI of every approved loan from its schedule"""
+    Loan = apps.get_model("loans", "Loan")
+    loans = Loan.objects.filter(status="APPROVED").only(
+        "id", "status", "amount", "tenure", "approved_date", "applied_date", "schedule_data", "paid_emi_count"
+    ).order_by("pk")
+
+    batch = []
+    for loan in loans.iterator(chunk_size=500):
+        start_date = (loan.approved_date or loan.applied_date).date()
+        loan.next_due_date, loan.next_emi_amount = next_due_emi(
+            loan.status, loan.amount, loan.tenure, start_date, loan.paid_emi_count, loan.schedule_data
+        )
+        batch.append(loan)
+        if len(batch) == 500:
+            Loan.objects.bulk_update(batch, ["next_due_date", "next_emi_amount"])
+            batch = []
+    if batch:
+        Loan.objects.bulk_update(batch, ["next_due_date", "next_emi_amount"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0017_archived_loans'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='next_due_date',
+            field=models.DateField(blank=True, editable=False, help_text='Due date of the next unpaid EMI', null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='next_emi_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['next_due_date'], name='loan_next_due_idx'),
+        ),
+        migrations.RunPython(fill_next_due, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,17 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError, PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
 
-from django.db.models import Sum, Q
+from django.db.models import F, Max, OuterRef, Subquery, Q
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 
+from .tracking import DirtyFieldsMixin
+
 def validate_amount(value):
     """Validate loan amount is between ₹1,000 and ₹100,000"""
     if value < 1000 or value > 100000:
@@ -22,7 +26,7 @@ def validate_interest(value):
     if value <= 0:
         raise ValidationError("Interest rate must be a positive number.")
 
-class Loan(models.Model):
+class Loan(DirtyFieldsMixin, models.Model):
     # User who applied for the loan
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
@@ -44,8 +48,19 @@ class Loan(models.Model):
     total_interest = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=True)
     is_closed = models.BooleanField(default=False)
     
-    # Amortization schedule cache
-    amortization_schedule = models.JSONField(null=True, blank=True, editable=True)
+    # Amortization schedule cache, packed as fixed-width binary columns
+    # (read/write it through the amortization_schedule property)
+    schedule_data = models.BinaryField(null=True, blank=True, editable=False)
+
+    # Payment progress, kept in step by Payment.save() with atomic UPDATEs
+    # (fix drift with `python manage.py repair_payment_counters`)
+    paid_emi_count = models.PositiveIntegerField(default=0, editable=False, help_text="Successful payments so far")
+    last_paid_date = models.DateTimeField(null=True, blank=True, editable=False, help_text="Date of the latest successful payment")
+
+    # Next unpaid EMI, set on approval and moved by Payment.save(); NULL
+    # whenever nothing is due (not approved, closed or fully paid)
+    next_due_date = models.DateField(null=True, blank=True, editable=False, help_text="Due date of the next unpaid EMI")
+    next_emi_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
     
     # Loan status
     STATUS_CHOICES = (
@@ -75,8 +90,29 @@ class Loan(models.Model):
     foreclosure_date = models.DateTimeField(null=True, blank=True, help_text="Date when loan was foreclosed")
     foreclosure_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Amount paid to foreclose the loan")
 
+    # Only ever written by Payment.save() / repair_payment_counters, never by Loan.save()
+    PAYMENT_COUNTER_FIELDS = ('paid_emi_count', 'last_paid_date')
+
+    # Changing any of these means EMI and schedule must be worked out again
+    TERM_FIELDS = ('amount', 'tenure', 'interest_rate')
+
+    # Worked out by save() itself, so they are written whenever they change
+    DERIVED_FIELDS = ('monthly_installment', 'total_payable', 'total_interest', 'schedule_data', 'is_closed',
+                      'next_due_date', 'next_emi_amount')
+
+    # The next unpaid EMI (see update_next_due)
+    NEXT_DUE_FIELDS = ('next_due_date', 'next_emi_amount')
+
     class Meta:
         ordering = ['-applied_date']  # ADDED: Default ordering
+        # Matched to the hot queries (see loans/query_plans.py)
+        indexes = [
+            models.Index(fields=['-applied_date'], name='loan_applied_idx'),  # Admin loan list
+            models.Index(fields=['user', '-applied_date'], name='loan_user_applied_idx'),  # "My loans"
+            models.Index(fields=['user', 'status'], name='loan_user_status_idx'),  # A user's active loans
+            models.Index(fields=['status', '-applied_date'], name='loan_status_applied_idx'),  # Queues by status
+            models.Index(fields=['next_due_date'], name='loan_next_due_idx'),  # Due / overdue loans
+        ]
 
     def clean(self):
         """Extra validation for loan creation"""
@@ -90,40 +126,70 @@ class Loan(models.Model):
         # Loan limit validation (only for new loans or status changes to PENDING/APPROVED)
         if self._state.adding or self.status in ['PENDING', 'APPROVED']:  # IMPROVED: Use _state.adding
             # Only check if user is set
-            if self.user:
-                # Get total amount of user's pending and approved loans
-                total_unpaid = Loan.objects.filter(
-                    user=self.user
-                ).filter(
-                    Q(status='PENDING') | Q(status='APPROVED')
-                ).exclude(  # EXCLUDE current loan if updating
-                    pk=self.pk
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
+            if self.user_id:
+                from .exposure import current_exposure, EXPOSURE_LIMIT  # Local import to avoid circular dependency
+
+                # User's pending + approved total from the exposure ledger, minus this loan's own share
+                total_unpaid = current_exposure(self.user_id).total
+                stored_share = self._stored_exposure_share()
+                if stored_share and stored_share[0] == self.user_id:
+                    total_unpaid -= sum(stored_share[1:])
                 
-                if total_unpaid + self.amount > 100000:
+                if total_unpaid + self.amount > EXPOSURE_LIMIT:
                     raise ValidationError({
                         "amount": f"Loan limit exceeded. You already have ₹{total_unpaid} in pending/approved loans."
                     })
 
+    def _exposure_share(self, user_id=None, status=None, amount=None):
+        """(user_id, pending amount, approved amount) this loan counts towards the exposure ledger"""
+        user_id = self.user_id if user_id is None else user_id
+        status = self.status if status is None else status
+        amount = self.amount if amount is None else amount
+        return (
+            user_id,
+            amount if status == 'PENDING' else Decimal('0'),
+            amount if status == 'APPROVED' else Decimal('0'),
+        )
+
+    def _stored_exposure_share(self):
+        """
+        The exposure share as stored in the row (None for a new loan, or
+        one whose row no longer exists). Fields the instance was loaded
+        without (.only() / .defer()) are read from the row first.
+        """
+        if self._state.adding:
+            return None
+        names = ('user_id', 'status', 'amount')
+        missing = [name for name in names if self.get_loaded_value(name) is None]
+        if missing:
+            stored = Loan.objects.filter(pk=self.pk).values(*missing).first()
+            if stored is None:
+                return None
+            if not hasattr(self, '_loaded_values'):
+                self._loaded_values = {}
+            self._loaded_values.update(stored)
+        return self._exposure_share(*(self.get_loaded_value(name) for name in names))
+
     def save(self, *args, **kwargs):
         from .services import calculate_emi, generate_amortization_schedule # Local import to avoid circular dependency
         """Calculate EMI values and schedule when saving the loan"""
         
-        # Always recalculate EMI for consistency
-        emi, total_payable, total_interest = calculate_emi(
-            loan_amount=self.amount,
-            months=self.tenure,
-            yearly_interest=10.0
-        )
-        
-        self.monthly_installment = emi
-        self.total_payable = total_payable
-        self.total_interest = total_interest
+        # Recalculate EMI only for new loans or changed terms (status-only saves skip it)
+        if self._state.adding or self._loan_terms_changed() or self.monthly_installment is None:
+            emi, total_payable, total_interest = calculate_emi(
+                loan_amount=self.amount,
+                months=self.tenure,
+                yearly_interest=10.0
+            )
+            
+            self.monthly_installment = emi
+            self.total_payable = total_payable
+            self.total_interest = total_interest
         
         # Generate/update amortization schedule when loan is approved
         if self.status == 'APPROVED' and self.approved_date:
             # Only regenerate if not exists or loan terms changed
-            if not self.amortization_schedule or self._loan_terms_changed():
+            if not self.schedule_data or self._loan_terms_changed():
                 schedule = generate_amortization_schedule(
                     loan_amount=self.amount,
                     months=self.tenure,
@@ -134,30 +200,68 @@ class Loan(models.Model):
         
         # Auto-manage is_closed based on status
         self.is_closed = self.status in ['REPAID', 'FORECLOSED', 'REJECTED', 'REJECTED_LIMIT']
+
+        # Next unpaid EMI moves with status and terms here, and with payments in Payment.save()
+        if self._state.adding or self._loan_terms_changed() or self.is_dirty('status', 'approved_date'):
+            self.update_next_due()
         
         # simple enforcement: block non-staff even if someone tries to set it programmatically
-        if self.approved_by and not getattr(self.approved_by, "is_staff", False):
+        # (only when approved_by is set or changed, so other saves don't load the user)
+        if self.approved_by_id and self.is_dirty('approved_by') and not getattr(self.approved_by, "is_staff", False):
             raise ValidationError({"approved_by": "approved_by must be a staff user."})
-  
-        super().save(*args, **kwargs)
+
+        # Write only the columns that changed, and never write the payment
+        # counters back from a possibly stale instance
+        if not self._state.adding:
+            dirty = self.get_dirty_fields()
+            if kwargs.get('update_fields') is None:
+                update_fields = [name for name in dirty if name not in self.PAYMENT_COUNTER_FIELDS]
+            else:
+                update_fields = list(kwargs['update_fields'])
+                update_fields += [name for name in self.DERIVED_FIELDS if name in dirty and name not in update_fields]
+            if not update_fields:
+                return  # Nothing changed: no UPDATE, no ledger change
+            kwargs['update_fields'] = update_fields
+
+        from .exposure import apply_exposure_change  # Local import to avoid circular dependency
+
+        # Save and move the owner's exposure ledger in one transaction
+        stored_exposure = self._stored_exposure_share()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            apply_exposure_change(stored_exposure, self._exposure_share())
+
+    def delete(self, *args, **kwargs):
+        # Read the stored share while the row still exists; the post_delete
+        # receiver (loans.signals.loan_deleted) takes it off the ledger
+        self._stored_exposure_share()
+        return super().delete(*args, **kwargs)
 
     def _loan_terms_changed(self):
-        """Check if loan amount or tenure changed (for amortization recalculation)"""
-        if not self.pk:
-            return False
-        
-        try:
-            original = Loan.objects.get(pk=self.pk)
-            return (original.amount != self.amount or 
-                   original.tenure != self.tenure or
-                   original.interest_rate != self.interest_rate)
-        except Loan.DoesNotExist:
+        """Check if loan amount, tenure or rate changed since the loan was loaded (no extra query)"""
+        if self._state.adding:
             return False
+        return self.is_dirty(*self.TERM_FIELDS)
+
+    @property
+    def amortization_schedule(self):
+        """Stored payment schedule as a list of dicts (None if not stored)"""
+        from .services import unpack_schedule
+
+        if not self.schedule_data:
+            return None
+        return unpack_schedule(self.schedule_data)
+
+    @amortization_schedule.setter
+    def amortization_schedule(self, schedule):
+        from .services import pack_schedule
+
+        self.schedule_data = pack_schedule(schedule) if schedule else None
 
     def get_amortization_schedule(self):
         from .services import generate_amortization_schedule 
         """Get the payment schedule (generate if not stored)"""
-        if self.amortization_schedule:
+        if self.schedule_data:
             return self.amortization_schedule
         
         # Generate on-the-fly if not stored
@@ -169,64 +273,81 @@ class Loan(models.Model):
             start_date=start_date
         )
 
+    def iter_amortization_schedule(self, first_emi=1, last_emi=None):
+        """Yield only EMIs first_emi..last_emi of the payment schedule"""
+        from .services import iter_amortization_schedule, unpack_schedule
+
+        if self.schedule_data:
+            yield from unpack_schedule(self.schedule_data, first_emi, last_emi)
+            return
+
+        # Generate on-the-fly if not stored
+        start_date = self.approved_date.date() if self.approved_date else self.applied_date.date()
+        yield from iter_amortization_schedule(
+            loan_amount=self.amount,
+            months=self.tenure,
+            yearly_interest=10.0,
+            start_date=start_date,
+            first_emi=first_emi,
+            last_emi=last_emi
+        )
+
+    def update_next_due(self, paid_emis=None):
+        """Set next_due_date / next_emi_amount from the schedule (not saved)"""
+        from .services import next_due_emi
+
+        if paid_emis is None:
+            paid_emis = self.paid_emi_count
+        start_date = (self.approved_date or self.applied_date).date()
+        self.next_due_date, self.next_emi_amount = next_due_emi(
+            self.status, self.amount, self.tenure, start_date, paid_emis, self.schedule_data
+        )
+
     def get_next_payment_details(self):
         """Get details of the next EMI due"""
         if self.status != 'APPROVED':
             return None
         
-        schedule = self.get_amortization_schedule()
-        payments_made = self.payments.filter(status='SUCCESS').count()
-        
-        if payments_made < len(schedule):
-            return schedule[payments_made]
-        return None
+        next_emi = list(self.iter_amortization_schedule(self.paid_emi_count + 1, self.paid_emi_count + 1))
+        return next_emi[0] if next_emi else None
 
     @property
     def payments_made(self):
         """Convenience property for successful payments count"""
-        return self.payments.filter(status='SUCCESS').count()
+        return self.paid_emi_count
 
     @property
     def payments_remaining(self):
         """Convenience property for remaining payments"""
         return max(0, self.tenure - self.payments_made)
 
-    def calculate_outstanding_amount(self):
+    def calculate_outstanding_amount(self, payments_made=None):
         """
         Calculate the outstanding amount for loan foreclosure.
         Returns the remaining principal balance only (no future interest).
         This ensures customers only pay for the actual loan balance, not future interest.
+        Defaults to the loan's paid_emi_count.
         """
-        if self.status != 'APPROVED':
-            return Decimal('0.00')
+        from .services import calculate_outstanding_principal, DEFAULT_YEARLY_INTEREST
 
-        payments_made = self.payments.filter(status='SUCCESS').count()
-        payments_remaining = self.tenure - payments_made
-
-        if payments_remaining <= 0:
+        if self.status != 'APPROVED':
             return Decimal('0.00')
 
-        # Get the amortization schedule to find the current remaining balance
-        schedule = self.get_amortization_schedule()
-
-        # If no payments made yet, remaining balance is the full loan amount
-        if payments_made == 0:
-            return Decimal(str(self.amount)).quantize(Decimal('0.01'))
+        if payments_made is None:
+            payments_made = self.paid_emi_count
 
-        # Get the remaining balance after the last paid EMI
-        # The schedule stores remaining_balance after each EMI payment
-        if payments_made <= len(schedule):
-            last_paid_emi = schedule[payments_made - 1]
-            remaining_principal = Decimal(str(last_paid_emi.get('remaining_balance', 0)))
-            return remaining_principal.quantize(Decimal('0.01'))
-
-        return Decimal('0.00')
+        return calculate_outstanding_principal(
+            loan_amount=self.amount,
+            months=self.tenure,
+            yearly_interest=DEFAULT_YEARLY_INTEREST,
+            payments_made=payments_made
+        )
 
     def __str__(self):
         return f"Loan {self.id} - {self.user.username if self.user else 'No User'} - {self.status}"
 
 
-class Payment(models.Model):
+class Payment(DirtyFieldsMixin, models.Model):
     """Track EMI payments for loans"""
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -254,6 +375,58 @@ class Payment(models.Model):
     class Meta:
         ordering = ['payment_date']  # ADDED: Chronological order
         unique_together = ['loan', 'emi_number']  # ADDED: Prevent duplicate EMI payments
+        indexes = [
+            models.Index(fields=['loan', 'status'], name='payment_loan_status_idx'),
+            # Successful payments of a loan in EMI order (schedule view), partial: SUCCESS rows only
+            models.Index(fields=['loan', 'emi_number'], condition=Q(status='SUCCESS'), name='payment_success_emi_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Save, and move the loan's paid_emi_count (and next due EMI) when
+        the status enters or leaves SUCCESS
+        """
+        stored_status = None if self._state.adding else self.get_loaded_value('status')
+        change = (self.status == 'SUCCESS') - (stored_status == 'SUCCESS')
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._move_loan_counters(change)
+
+        # Keep an already-loaded loan in step with the new counter
+        if change and Payment.loan.is_cached(self):
+            self.loan.refresh_from_db(fields=[*Loan.PAYMENT_COUNTER_FIELDS, *Loan.NEXT_DUE_FIELDS])
+
+    def _move_loan_counters(self, change):
+        """
+        Move paid_emi_count by change (+1 / -1 / 0), with last_paid_date and
+        the next due EMI (also run for deleted payments, see loans.signals)
+        """
+        if not change:
+            return
+        # Lock the loan row so the next-due EMI matches the count it is written with
+        loan = Loan.objects.select_for_update().only(
+            'status', 'amount', 'tenure', 'approved_date', 'applied_date', 'schedule_data', 'paid_emi_count'
+        ).filter(pk=self.loan_id).first()
+        if loan is None:
+            return  # Deleted along with its loan
+        loan.update_next_due(paid_emis=loan.paid_emi_count + change)
+        next_due = {'next_due_date': loan.next_due_date, 'next_emi_amount': loan.next_emi_amount}
+        if change > 0:
+            Loan.objects.filter(pk=self.loan_id).update(
+                paid_emi_count=F('paid_emi_count') + 1,
+                last_paid_date=Greatest(Coalesce('last_paid_date', self.payment_date), self.payment_date),
+                **next_due,
+            )
+        else:
+            Loan.objects.filter(pk=self.loan_id).update(
+                paid_emi_count=F('paid_emi_count') - 1,
+                last_paid_date=Subquery(
+                    Payment.objects.filter(loan=OuterRef('pk'), status='SUCCESS')
+                    .order_by().values('loan').annotate(latest=Max('payment_date')).values('latest')
+                ),
+                **next_due,
+            )
 
     def clean(self):
         """Validate payment amount based on payment type"""
@@ -273,4 +446,123 @@ class Payment(models.Model):
             })
 
     def __str__(self):
-        return f"Payment {self.emi_number} - Loan {self.loan.id} - ₹{self.amount} - {self.status}"
\ No newline at end of file
+        return f"Payment {self.emi_number} - Loan {self.loan.id} - ₹{self.amount} - {self.status}"
+
+
+class CreditExposure(models.Model):
+    """
+    Running total of a user's PENDING and APPROVED loan amounts.
+
+    One row per user, moved by Loan.save() on every status or amount
+    change and by the Loan post_delete receiver, so the ₹100,000 limit check is a single row read
+    (locked with select_for_update while applying/approving; see
+    loans.exposure).
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='credit_exposure',
+    )
+    pending_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    approved_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def total(self):
+        """Pending + approved: what counts against the limit for new applications"""
+        return self.pending_amount + self.approved_amount
+
+    def __str__(self):
+        return f"Exposure {self.user_id} - pending ₹{self.pending_amount} / approved ₹{self.approved_amount}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored outcome of a POST sent with an Idempotency-Key header (see
+    loans.idempotency). A retry with the same key gets this response back
+    without running the payment again. Rows expire after
+    LOANS_IDEMPOTENCY_KEY_TTL_HOURS.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    request_fingerprint = models.CharField(max_length=64, help_text="Hash of method, path and body")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Empty while the request is running")
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),  # Expiry purge
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} - user {self.user_id} - {self.status_code or 'in progress'}"
+
+
+class ArchivedLoan(models.Model):
+    """
+    Cold-storage copy of a closed loan (see loans.archive).
+
+    Same columns and the same id as the Loan row it replaces, so detail
+    and payments endpoints can fall back to it transparently, while the
+    hot Loan table only holds loans that are still in play.
+    """
+    id = models.BigIntegerField(primary_key=True)  # The original Loan id
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_loans')
+
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    tenure = models.PositiveIntegerField()
+    interest_rate = models.FloatField(default=10.0)
+    monthly_installment = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    total_payable = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    total_interest = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    is_closed = models.BooleanField(default=True)
+    schedule_data = models.BinaryField(null=True, blank=True, editable=False)
+    paid_emi_count = models.PositiveIntegerField(default=0)
+    last_paid_date = models.DateTimeField(null=True, blank=True)
+
+    status = models.CharField(max_length=15, choices=Loan.STATUS_CHOICES)
+    applied_date = models.DateTimeField()
+    approved_date = models.DateTimeField(null=True, blank=True)
+    approved_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+    rejection_reason = models.TextField(blank=True)
+    foreclosure_date = models.DateTimeField(null=True, blank=True)
+    foreclosure_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-applied_date']
+
+    def __str__(self):
+        return f"Archived loan {self.id} - {self.user.username if self.user else 'No User'} - {self.status}"
+
+
+class ArchivedPayment(models.Model):
+    """Cold-storage copy of a payment that belonged to an archived loan"""
+    id = models.BigIntegerField(primary_key=True)  # The original Payment id
+    loan = models.ForeignKey(ArchivedLoan, on_delete=models.CASCADE, related_name='payments')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_date = models.DateTimeField()
+    emi_number = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=Payment.STATUS_CHOICES)
+    payment_type = models.CharField(max_length=15, choices=Payment.PAYMENT_TYPE_CHOICES, default='EMI')
+    gateway_reference = models.CharField(max_length=100, blank=True)
+    gateway_response = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['payment_date']
+        unique_together = ['loan', 'emi_number']
+
+    def __str__(self):
+        return f"Archived payment {self.emi_number} - Loan {self.loan_id} - ₹{self.amount} - {self.status}"
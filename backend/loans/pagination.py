@@ -0,0 +1,43 @@
+"""
+Opt-in keyset (cursor) pagination for loan and payment listings.
+
+Listings stay unpaginated by default so the existing frontend keeps
+working. Clients that send ?paginate=cursor (or follow a ?cursor= link)
+get pages of ?page_size= rows (LOANS_PAGE_SIZE by default) with "next" /
+"previous" links. Each page is one indexed range query on the ordering
+columns: no OFFSET scan and no COUNT(*).
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """CursorPagination that only applies when the request asks for it"""
+
+    page_size = getattr(settings, "LOANS_PAGE_SIZE", 50)
+    page_size_query_param = "page_size"
+    max_page_size = getattr(settings, "LOANS_MAX_PAGE_SIZE", 500)
+    opt_in_query_param = "paginate"
+
+    def is_requested(self, request) -> bool:
+        return (
+            request.query_params.get(self.opt_in_query_param) == "cursor"
+            or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None  # Plain list, as before
+        return super().paginate_queryset(queryset, request, view)
+
+
+class LoanCursorPagination(OptInCursorPagination):
+    """Newest loans first; id breaks ties between loans applied at the same instant"""
+
+    ordering = ("-applied_date", "-id")
+
+
+class PaymentCursorPagination(OptInCursorPagination):
+    """A loan's payments in EMI order (emi_number is unique per loan)"""
+
+    ordering = ("emi_number",)
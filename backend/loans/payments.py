@@ -0,0 +1,161 @@
+"""
+Row-locked payment pipeline for EMI payments and foreclosures.
+
+Both run as one transaction:
+
+1. SELECT ... FOR UPDATE the loan, so payments and foreclosures of the
+   same loan queue behind each other instead of racing;
+2. check it can still be paid / foreclosed;
+3. INSERT the payment (the (loan, emi_number) unique constraint is the
+   backstop against a duplicate EMI);
+4. one compare-and-swap UPDATE of the loan (see loans.state): paid EMI
+   count, last payment date, next due EMI and, for the final EMI or a
+   foreclosure, the closing status, guarded by
+   "WHERE status = 'APPROVED' AND paid_emi_count = n".
+
+If the swap finds the loan changed, nothing is written and PaymentError
+(409) is raised. Views turn PaymentError into the error response.
+"""
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import status
+
+from .models import Loan, Payment
+from .serializers import LoanSerializer
+from .services import next_due_emi
+from .state import compare_and_swap, transition
+
+
+class PaymentError(Exception):
+    """A payment/foreclosure that cannot go ahead: error payload plus HTTP status"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = {"error": message, **extra}
+
+
+def pay_next_emi(loan_id, user):
+    """
+    Pay the loan's next EMI as `user` (the owner or staff).
+
+    Returns: (loan, payment) with the loan as it stands after the payment
+    """
+    with transaction.atomic():
+        loan = _lock_loan(loan_id)
+        if loan.user_id != user.id and not user.is_staff:
+            raise PaymentError("Not authorized to make payments for this loan", status.HTTP_403_FORBIDDEN)
+        if loan.status != "APPROVED":
+            raise PaymentError("Can only pay for approved loans")
+
+        paid_emis = loan.paid_emi_count
+        if paid_emis >= loan.tenure:
+            raise PaymentError("Loan is already fully paid")
+
+        payment = _insert_payment(
+            loan,
+            amount=loan.monthly_installment,
+            emi_number=paid_emis + 1,
+            status="SUCCESS",
+            gateway_reference=f"MOCK_{timezone.now().strftime('%Y%m%d%H%M%S')}",
+            gateway_response={"mock": True, "message": "Payment simulated successfully"},
+        )
+        # The last EMI closes the loan in the same UPDATE
+        _swap_loan(loan, payment, new_status="REPAID" if paid_emis + 1 >= loan.tenure else None)
+    return loan, payment
+
+
+def foreclose(loan_id, user):
+    """
+    Settle the loan's outstanding principal as `user` (the owner or staff)
+    and close it.
+
+    Returns: (loan, payment, emis paid before, emis cleared)
+    """
+    with transaction.atomic():
+        loan = _lock_loan(loan_id)
+        if loan.user_id != user.id and not user.is_staff:
+            raise PaymentError("You can only foreclose your own loans", status.HTTP_403_FORBIDDEN)
+        if loan.status != "APPROVED":
+            raise PaymentError("Only approved loans can be foreclosed")
+
+        payments_made = loan.paid_emi_count
+        payments_remaining = loan.tenure - payments_made
+        outstanding_amount = loan.calculate_outstanding_amount()
+        if outstanding_amount <= 0:
+            raise PaymentError("Loan has no outstanding amount")
+
+        # A final payment record for the foreclosure settlement
+        payment = _insert_payment(
+            loan,
+            amount=outstanding_amount,
+            emi_number=payments_made + 1,  # Next EMI number
+            status="SUCCESS",
+            payment_type="FORECLOSURE",
+            gateway_reference=f"FORECLOSURE_{timezone.now().strftime('%Y%m%d%H%M%S')}",
+            gateway_response={
+                "type": "foreclosure",
+                "message": "Loan foreclosed - full settlement",
+                "emis_cleared": payments_remaining,
+            },
+        )
+        _swap_loan(
+            loan, payment,
+            new_status="FORECLOSED",
+            foreclosure_date=timezone.now(),
+            foreclosure_amount=outstanding_amount,
+        )
+    return loan, payment, payments_made, payments_remaining
+
+
+def _lock_loan(loan_id) -> Loan:
+    """The loan row, locked until the transaction ends (404 if missing)"""
+    return get_object_or_404(
+        Loan.objects.select_for_update(of=("self",)).select_related(*LoanSerializer.SELECT_RELATED),
+        pk=loan_id,
+    )
+
+
+def _insert_payment(loan, **fields) -> Payment:
+    """
+    INSERT the payment without Payment.save()'s counter UPDATE (the loan
+    row is written once, by _swap_loan). A payment row already holding
+    this EMI number becomes a 400, as before.
+    """
+    payment = Payment(loan=loan, **fields)
+    try:
+        with transaction.atomic():
+            Payment.objects.bulk_create([payment])
+    except IntegrityError:
+        existing = Payment.objects.filter(loan=loan, emi_number=payment.emi_number).first()
+        raise PaymentError(
+            f"EMI #{payment.emi_number} already exists",
+            payment_id=existing.id if existing else None,
+            status=existing.status if existing else None,
+        )
+    return payment
+
+
+def _swap_loan(loan, payment, new_status=None, **closing_fields):
+    """
+    Compare-and-swap the locked loan from "APPROVED with n paid EMIs" to
+    n + 1 paid EMIs (and, when closing, to new_status), mirrored on `loan`.
+    """
+    paid_emis = loan.paid_emi_count
+    changes = {
+        "paid_emi_count": paid_emis + 1,
+        # The guard on paid_emi_count pins last_paid_date too, so a plain value is safe
+        "last_paid_date": max(filter(None, (loan.last_paid_date, payment.payment_date))),
+    }
+    if new_status:
+        swapped = transition(loan, new_status, guard={"paid_emi_count": paid_emis}, **changes, **closing_fields)
+    else:
+        start_date = (loan.approved_date or loan.applied_date).date()
+        changes["next_due_date"], changes["next_emi_amount"] = next_due_emi(
+            loan.status, loan.amount, loan.tenure, start_date, paid_emis + 1, loan.schedule_data
+        )
+        swapped = compare_and_swap(loan, {"status": "APPROVED", "paid_emi_count": paid_emis}, changes)
+
+    if not swapped:
+        raise PaymentError("Loan changed while the payment was processed, please retry", status.HTTP_409_CONFLICT)
@@ -0,0 +1,88 @@
+"""
+EXPLAIN checks for the hot Loan/Payment queries.
+
+Each entry in hot_queries() is the queryset a view (or service) runs on
+every request. check_query_plans() asks the database how it would run
+each one and reports any that fall back to a full table scan, so a
+missing or unusable index shows up before it shows up in production.
+loans.tests.QueryPlanTests runs it as part of the test suite:
+
+    python manage.py test loans.tests.QueryPlanTests
+
+Works on SQLite (EXPLAIN QUERY PLAN) and PostgreSQL (EXPLAIN, with
+sequential scans disabled so that small development tables don't hide
+a missing index).
+"""
+import re
+
+from django.db import connection, transaction
+
+# "SCAN loans_loan" with no "USING ... INDEX" after it reads the whole table
+_SQLITE_FULL_SCAN = re.compile(r"\bSCAN (\S+)\s*$")
+_SQLITE_TEMP_SORT = re.compile(r"USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)")
+_POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\S+)")
+
+
+def hot_queries():
+    """
+    (name, queryset) for every hot access path. Parameters are placeholders:
+    EXPLAIN only needs the query shape, not real rows.
+    """
+    from users.models import User
+    from .models import CreditExposure, Loan, Payment
+    from .views import LoanDetailView, LoanListCreateView
+
+    admin = User(pk=1, is_staff=True)
+    user = User(pk=1, is_staff=False)
+
+    def view_queryset(view_class, request_user):
+        view = view_class()
+        view.request = type("Request", (), {"user": request_user})()
+        return view.get_queryset()
+
+    return [
+        ("loan list (admin)", view_queryset(LoanListCreateView, admin)),
+        ("loan list (user)", view_queryset(LoanListCreateView, user)),
+        ("loan detail (user)", view_queryset(LoanDetailView, user).filter(pk=1)),
+        ("loans by status, newest first", Loan.objects.filter(status="PENDING").order_by("-applied_date")),
+        ("active loans of a user", Loan.objects.filter(user_id=1, status__in=["PENDING", "APPROVED"])),
+        ("approved book in pk order", Loan.objects.filter(status="APPROVED").order_by("pk")),
+        ("loans due by a date", Loan.objects.filter(next_due_date__lte="2025-01-01").order_by("next_due_date", "pk")),
+        ("loan payments by EMI", Payment.objects.filter(loan_id=1).order_by("emi_number")),
+        ("payment for an EMI", Payment.objects.filter(loan_id=1, emi_number=1)),
+        ("successful payments of a loan", Payment.objects.filter(loan_id=1, status="SUCCESS")),
+        ("successful payments by EMI", Payment.objects.filter(loan_id=1, status="SUCCESS").order_by("emi_number")),
+        ("successful payment for an EMI", Payment.objects.filter(loan_id=1, emi_number=1, status="SUCCESS")),
+        ("exposure ledger row", CreditExposure.objects.filter(user_id=1)),
+    ]
+
+
+def explain(queryset):
+    """The database's plan for a queryset, one line per step"""
+    if connection.vendor == "postgresql":
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain().splitlines()
+    return queryset.explain().splitlines()
+
+
+def check_query_plans(queries=None):
+    """
+    Explain every hot query.
+
+    Returns: list of {"name", "plan", "full_scans", "temp_sorts"} where
+    full_scans lists the tables read in full (should be empty) and
+    temp_sorts the extra sort steps SQLite had to add.
+    """
+    results = []
+    for name, queryset in queries if queries is not None else hot_queries():
+        plan = explain(queryset)
+        if connection.vendor == "postgresql":
+            full_scans = [match.group(1) for line in plan for match in [_POSTGRES_FULL_SCAN.search(line)] if match]
+            temp_sorts = []
+        else:
+            full_scans = [match.group(1) for line in plan for match in [_SQLITE_FULL_SCAN.search(line)] if match]
+            temp_sorts = [match.group(1) for line in plan for match in [_SQLITE_TEMP_SORT.search(line)] if match]
+        results.append({"name": name, "plan": plan, "full_scans": full_scans, "temp_sorts": temp_sorts})
+    return results
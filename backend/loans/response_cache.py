@@ -0,0 +1,219 @@
+"""
+Server-side cache for the loan read endpoints.
+
+The dashboard polls the loan list, detail, schedule, next-payment and
+payments endpoints far more often than loans change, so successful (200)
+responses are kept in Django's cache framework (the LOANS_RESPONSE_CACHE_ALIAS
+cache).
+
+That cache must be shared by every worker process (Redis, Memcached,
+database): invalidation bumps version keys in it, and a bump in one
+process's LocMemCache never reaches the others, which would keep serving
+stale loans until the timeout. With a per-process backend the response
+cache stays off (system check loans.W001) unless
+LOANS_RESPONSE_CACHE_SINGLE_PROCESS says the app runs as one process.
+
+Invalidation is by version keys rather than by deleting entries:
+
+- every cached response key includes the current version of what it shows:
+  "loan:<id>" for one loan's endpoints, "user:<id>" for a user's loan list,
+  "all" for the staff list, plus a global "epoch";
+- loans/signals.py bumps those versions when a Loan, Payment, User or
+  UserProfile is saved or deleted (after the transaction commits), so the
+  next request misses and old entries simply expire. Code that writes
+  with queryset.update()/bulk_create() calls invalidate_loan() itself.
+
+Hit/miss counters per endpoint are kept per process (cache_stats(),
+GET /api/loans/cache-stats/). Set LOANS_RESPONSE_CACHE = False to turn the
+cache off while debugging.
+"""
+from functools import partial, wraps
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .conditional import not_modified_response
+
+_KEY_PREFIX = "loans:response"
+_VERSION_PREFIX = "loans:version"
+
+_stats_lock = threading.Lock()
+_stats = {}  # endpoint -> [hits, misses]
+
+
+def is_enabled() -> bool:
+    """LOANS_RESPONSE_CACHE is on and every worker process sees the same cache"""
+    return getattr(settings, "LOANS_RESPONSE_CACHE", True) and (
+        _is_shared_cache() or getattr(settings, "LOANS_RESPONSE_CACHE_SINGLE_PROCESS", False)
+    )
+
+
+def _cache():
+    return caches[getattr(settings, "LOANS_RESPONSE_CACHE_ALIAS", "default")]
+
+
+def _is_shared_cache() -> bool:
+    """False for backends that live in one process (locmem) or keep nothing (dummy)"""
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+@checks.register(checks.Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    if getattr(settings, "LOANS_RESPONSE_CACHE", True) and not is_enabled():
+        return [checks.Warning(
+            f"The loan response cache is off: the {type(_cache()).__name__} backend is per process, "
+            "so invalidations in one worker would not reach the others.",
+            hint="Point CACHES at a shared backend (Redis, Memcached, database), or set "
+                 "LOANS_RESPONSE_CACHE_SINGLE_PROCESS=True if the app runs as a single process.",
+            id="loans.W001",
+        )]
+    return []
+
+
+#------- Version Keys --------
+
+def _versions(names) -> list:
+    """
+    Current version token of each name, in order. A version that is not in
+    the cache (first use, or evicted) gets a fresh random token, so an
+    evicted version can never bring back entries cached under an older one.
+    """
+    cache = _cache()
+    keys = [f"{_VERSION_PREFIX}:{name}" for name in names]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+
+def bump_versions(*names):
+    """Invalidate every cached response that shows any of the names"""
+    if names:
+        _cache().set_many({f"{_VERSION_PREFIX}:{name}": uuid.uuid4().hex for name in names}, None)
+
+
+def invalidate(*names):
+    """
+    Bump the named versions once the current transaction commits (at once
+    outside a transaction), so readers in between cache the old data under
+    the old version, which the bump then retires
+    """
+    if is_enabled() and names:
+        transaction.on_commit(partial(bump_versions, *names))
+
+
+def invalidate_loan(loan_id, *user_ids):
+    """Invalidate one loan's responses and the loan lists that show it"""
+    invalidate("all", f"loan:{loan_id}", *(f"user:{user_id}" for user_id in set(user_ids) if user_id is not None))
+
+
+def clear_response_cache():
+    """Invalidate every cached loan response (e.g. after a bulk fix-up that skipped save())"""
+    bump_versions("epoch")
+
+
+#------- View Decorator --------
+
+def cached_response(endpoint, scope="loan"):
+    """
+    Cache the 200 responses of a loan read view.
+
+    scope="loan": the view shows one loan, taken from the "pk" URL kwarg.
+    scope="list": the view lists the requesting user's loans (all loans
+    for staff).
+
+    Works on DRF function views (put it under @permission_classes, so it
+    runs after authentication) and on view methods such as retrieve().
+    Each requesting user gets their own entries, so permission checks in
+    the view keep applying: only responses they were allowed to see are
+    cached for them.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = args[1] if len(args) > 1 else args[0]  # (self, request) or (request)
+            if not is_enabled() or request.method != "GET":
+                return view(*args, **kwargs)
+
+            user = request.user
+            if scope == "loan":
+                version_names = ["epoch", f"loan:{kwargs['pk']}"]
+            else:
+                version_names = ["epoch", "all" if user.is_staff else f"user:{user.pk}"]
+            request_key = hashlib.sha1(
+                f"{request.get_host()}|{request.get_full_path()}".encode()
+            ).hexdigest()
+            key = ":".join([
+                _KEY_PREFIX, endpoint, str(kwargs.get("pk", "")), str(user.pk), request_key,
+                *_versions(version_names),
+            ])
+
+            cache = _cache()
+            cached = cache.get(key)
+            if cached is not None:
+                _count(endpoint, hit=True)
+                data, etag = cached
+                if etag:
+                    not_modified = not_modified_response(request, etag)
+                    if not_modified:
+                        return not_modified
+                response = Response(data)
+                if etag:
+                    response["ETag"] = etag
+                return response
+
+            _count(endpoint, hit=False)
+            response = view(*args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                timeout = getattr(settings, "LOANS_RESPONSE_CACHE_TIMEOUT", 300)
+                cache.set(key, (response.data, response.get("ETag")), timeout)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+#------- Hit-Rate Counters --------
+
+def _count(endpoint, hit):
+    with _stats_lock:
+        counters = _stats.setdefault(endpoint, [0, 0])
+        counters[0 if hit else 1] += 1
+
+
+def cache_stats(reset=False) -> dict:
+    """
+    Hits, misses and hit rate per endpoint (this process only) plus the
+    totals. reset=True starts the counters again.
+    """
+    with _stats_lock:
+        snapshot = {endpoint: tuple(counters) for endpoint, counters in _stats.items()}
+        if reset:
+            _stats.clear()
+
+    def summary(hits, misses):
+        lookups = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": round(hits / lookups, 4) if lookups else None}
+
+    return {
+        "enabled": is_enabled(),
+        "backend": type(_cache()).__name__,
+        "endpoints": {endpoint: summary(*counters) for endpoint, counters in sorted(snapshot.items())},
+        "total": summary(
+            sum(hits for hits, _misses in snapshot.values()),
+            sum(misses for _hits, misses in snapshot.values()),
+        ),
+    }
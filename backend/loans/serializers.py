@@ -1,7 +1,12 @@
 from rest_framework import serializers
-from .models import Loan, Payment
+from .models import ArchivedLoan, ArchivedPayment, Loan, Payment
 
 class LoanSerializer(serializers.ModelSerializer):
+    # Relations the fields below read; querysets serialized with this class
+    # should select_related(*LoanSerializer.SELECT_RELATED) so a list costs
+    # one query instead of three or four per loan
+    SELECT_RELATED = ("user__profile", "approved_by")
+
     # Show username of the loan owner
     user = serializers.CharField(source="user.username", read_only=True)
 
@@ -90,12 +95,11 @@ class LoanSerializer(serializers.ModelSerializer):
 
     def get_payments_made(self, obj):
         """Get count of successful payments"""
-        return obj.payments.filter(status='SUCCESS').count()
+        return obj.paid_emi_count
 
     def get_payments_remaining(self, obj):
         """Calculate remaining payments"""
-        payments_made = obj.payments.filter(status='SUCCESS').count()
-        return max(0, obj.tenure - payments_made)
+        return max(0, obj.tenure - obj.paid_emi_count)
 
     def validate_amount(self, value):
         """Custom validation for amount"""
@@ -139,6 +143,24 @@ class PaymentSerializer(serializers.ModelSerializer):
             "gateway_reference",
         ]
 
+class ArchivedLoanSerializer(LoanSerializer):
+    """
+    Same shape as LoanSerializer for loans moved to the archive tables,
+    plus when they were archived
+    """
+    archived_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M", read_only=True)
+
+    class Meta(LoanSerializer.Meta):
+        model = ArchivedLoan
+        fields = LoanSerializer.Meta.fields + ["archived_at"]
+        read_only_fields = fields
+
+class ArchivedPaymentSerializer(PaymentSerializer):
+    """Same shape as PaymentSerializer for payments of archived loans"""
+
+    class Meta(PaymentSerializer.Meta):
+        model = ArchivedPayment
+
 class LoanCreateSerializer(serializers.ModelSerializer):
     """
     Simplified serializer for loan creation (only amount and tenure needed)
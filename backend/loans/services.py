@@ -1,15 +1,25 @@
-from decimal import Decimal, getcontext, ROUND_HALF_UP
-from datetime import date
+from collections import OrderedDict
+from decimal import Context, Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP, localcontext
+from calendar import monthrange
+from datetime import date, timedelta
+from functools import lru_cache
+from math import gcd
+import struct
+import threading
 
-# Set high precision for financial calculations (avoids rounding errors)
-getcontext().prec = 28  # 28 decimal places for intermediate math
+from django.conf import settings
+from django.utils import timezone
+
+# High precision for financial calculations (avoids rounding errors).
+# Kept in our own context so we never change the process-wide Decimal settings.
+_DECIMAL_CONTEXT = Context(prec=28, rounding=ROUND_HALF_EVEN)  # 28 digits for intermediate math
 
 def _round_to_paise(value: Decimal) -> Decimal:
     """
     Round to 2 decimal places (like Indian rupees and paise)
     Example: ₹100.456 becomes ₹100.46
     """
-    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP, context=_DECIMAL_CONTEXT)
 
 def calculate_emi(loan_amount: Decimal, months: int, yearly_interest: Decimal):
     """
@@ -20,53 +30,127 @@ def calculate_emi(loan_amount: Decimal, months: int, yearly_interest: Decimal):
     - P = Loan Amount (Principal)
     - r = Monthly Interest Rate (Yearly Rate ÷ 12 ÷ 100)
     - n = Number of Months (Tenure)
+
+    Repeat terms are answered from the schedule template cache.
     
     Returns: (monthly_emi, total_amount, total_interest)
     """
-    principal = Decimal(loan_amount)
-    tenure = int(months)
+    if not _is_whole_paise(loan_amount):
+        return _calculate_emi_decimal(loan_amount, months, yearly_interest)
+
+    template = schedule_template_cache.get(loan_amount, months, yearly_interest)
+    return template.emi, template.total_payable, template.total_interest
+
+def _calculate_emi_decimal(loan_amount: Decimal, months: int, yearly_interest: Decimal):
+    """Uncached Decimal EMI calculation (see calculate_emi)"""
+    with localcontext(_DECIMAL_CONTEXT):
+        principal = Decimal(loan_amount)
+        tenure = int(months)
     
-    # Convert yearly interest to monthly decimal (10% yearly → 0.833% monthly)
-    monthly_rate = (Decimal(yearly_interest) / Decimal("100")) / Decimal("12")
+        # Convert yearly interest to monthly decimal (10% yearly → 0.833% monthly)
+        monthly_rate = (Decimal(yearly_interest) / Decimal("100")) / Decimal("12")
     
-    # Special case: If interest is 0%, just divide loan by months
-    if monthly_rate == 0:
-        emi = principal / Decimal(tenure)
-        total_amount = principal
-    else:
-        # Compound interest formula
-        power = (Decimal("1") + monthly_rate) ** Decimal(tenure)
-        emi = principal * monthly_rate * power / (power - Decimal("1"))
-        total_amount = emi * Decimal(tenure)
+        # Special case: If interest is 0%, just divide loan by months
+        if monthly_rate == 0:
+            emi = principal / Decimal(tenure)
+            total_amount = principal
+        else:
+            # Compound interest formula
+            power = (Decimal("1") + monthly_rate) ** Decimal(tenure)
+            emi = principal * monthly_rate * power / (power - Decimal("1"))
+            total_amount = emi * Decimal(tenure)
     
-    total_interest = total_amount - principal
+        total_interest = total_amount - principal
     
-    # Round to rupees and paise (2 decimal places)
-    return (_round_to_paise(emi), 
-            _round_to_paise(total_amount), 
-            _round_to_paise(total_interest))
+        # Round to rupees and paise (2 decimal places)
+        return (_round_to_paise(emi), 
+                _round_to_paise(total_amount), 
+                _round_to_paise(total_interest))
 
 def _add_months_safe(start_date: date, months_to_add: int) -> date:
     """
     Safely add months to a date (handles month-end issues)
     Example: Jan 31 + 1 month = Feb 28 (not invalid Feb 31)
+
+    Month lengths come from the precomputed calendar table, so this is a
+    list lookup instead of trial date() constructions.
     """
     # Calculate new year and month
-    new_year = start_date.year + (start_date.month - 1 + months_to_add) // 12
-    new_month = (start_date.month - 1 + months_to_add) % 12 + 1
-    
-    # Try to keep the same day, but adjust if invalid (like Feb 30)
-    original_day = start_date.day
-    
-    # Check valid days in descending order (31, 30, 29, 28)
-    for day_option in (31, 30, 29, 28):
-        try:
-            return date(new_year, new_month, min(original_day, day_option))
-        except ValueError:
-            continue  # Try next smaller day
-    
-    # Fallback (should rarely happen)
-    return date(new_year, new_month, 28)
+    month_index = start_date.year * 12 + start_date.month - 1 + months_to_add
+    new_year, new_month = divmod(month_index, 12)
+
+    # Keep the same day, but cap it at the month's length (like Feb 30 → Feb 28/29)
+    table_index = month_index - _CALENDAR_FIRST_MONTH
+    if 0 <= table_index < len(_MONTH_LENGTHS):
+        return date(new_year, new_month + 1, min(start_date.day, _MONTH_LENGTHS[table_index]))
+
+    # Outside the table's horizon: ask the calendar module directly
+    return date(new_year, new_month + 1, min(start_date.day, monthrange(new_year, new_month + 1)[1]))
+
+
+#------- Due-Date Calendar --------
+
+# Days in every month of the supported horizon, indexed by months since
+# January of _CALENDAR_FIRST_YEAR (built once at import, ~3,000 entries)
+_CALENDAR_FIRST_YEAR = 1970
+_CALENDAR_LAST_YEAR = 2200
+_CALENDAR_FIRST_MONTH = _CALENDAR_FIRST_YEAR * 12
+_MONTH_LENGTHS = [
+    monthrange(year, month)[1]
+    for year in range(_CALENDAR_FIRST_YEAR, _CALENDAR_LAST_YEAR + 1)
+    for month in range(1, 13)
+]
+
+# Optional roll-forward for due dates that land on a weekend or holiday.
+# LOANS_DUE_DATE_ROLL = "following" moves them to the next business day;
+# LOANS_HOLIDAYS lists extra non-business days as "YYYY-MM-DD" strings.
+_DUE_DATE_ROLL = getattr(settings, "LOANS_DUE_DATE_ROLL", None)
+_HOLIDAYS = frozenset(date.fromisoformat(day) for day in getattr(settings, "LOANS_HOLIDAYS", ()))
+
+
+def _roll_forward(due_date: date) -> date:
+    """Move a due date to the next business day (skips weekends and holidays)"""
+    while due_date.weekday() >= 5 or due_date in _HOLIDAYS:
+        due_date += timedelta(days=1)
+    return due_date
+
+
+def _due_date(start_date: date, emi_number: int) -> date:
+    """Due date of one EMI: start date + emi_number months, rolled if configured"""
+    due_date = _add_months_safe(start_date, emi_number)
+    if _DUE_DATE_ROLL == "following":
+        due_date = _roll_forward(due_date)
+    return due_date
+
+
+# Due dates are precomputed per start date in blocks of this many EMIs
+# (24 covers every tenure LoanFriend offers)
+_DUE_DATE_BLOCK = 24
+
+
+@lru_cache(maxsize=4096)
+def _due_date_row(start_date: date, horizon: int) -> tuple:
+    """ISO due dates for EMIs 1..horizon from one start date"""
+    return tuple(_due_date(start_date, month).isoformat() for month in range(1, horizon + 1))
+
+
+def _due_dates(start_date: date, months: int) -> tuple:
+    """
+    ISO due dates for EMIs 1..months from one start date.
+
+    Loans approved on the same day share one precomputed row of due dates,
+    whatever their tenure, so this is a cached lookup plus a slice.
+    """
+    horizon = -(-months // _DUE_DATE_BLOCK) * _DUE_DATE_BLOCK
+    return _due_date_row(start_date, horizon)[:months]
+
+
+def due_dates_for(start_dates, months: int):
+    """
+    Batch due-date query: {start_date: (ISO due dates for EMIs 1..months)}
+    for every distinct start date given.
+    """
+    return {start_date: _due_dates(start_date, months) for start_date in set(start_dates)}
 
 
 #------- Amortization Schedule Generation --------
@@ -77,43 +161,847 @@ def generate_amortization_schedule(loan_amount: Decimal, months: int,
     Returns a list of monthly payment entries that are JSON-serializable:
     - due_date as ISO string "YYYY-MM-DD"
     - amounts as floats
+
+    The numbers come from the schedule template cache; only the due dates
+    are worked out per call.
     """
-    # If you have a calculate_emi function, call it; otherwise compute EMI here.
-    # This assumes calculate_emi(loan_amount, months, yearly_interest) exists and returns
-    # (emi_decimal, total_payable_decimal, total_interest_decimal)
-    emi, total_payable, total_interest = calculate_emi(loan_amount, months, yearly_interest)
+    if not _is_whole_paise(loan_amount):
+        return _generate_schedule_decimal(loan_amount, months, yearly_interest, start_date)
+
+    if start_date is None:
+        start_date = date.today()
 
-    monthly_rate = (Decimal(yearly_interest) / Decimal("100")) / Decimal("12")
+    template = schedule_template_cache.get(loan_amount, months, yearly_interest)
+    # EMI starts from next month after approval (month, not month-1)
+    return _schedule_entries(template.rows, _due_dates(start_date, len(template.rows)))
+
+def iter_amortization_schedule(loan_amount: Decimal, months: int, yearly_interest: Decimal,
+                               start_date: date = None, first_emi: int = 1, last_emi: int = None):
+    """
+    Lazily yield schedule entries for EMI numbers first_emi..last_emi.
+
+    Same entries as generate_amortization_schedule, but only the rows you
+    ask for are turned into dicts (each due date is worked out directly
+    from its EMI number, so starting at EMI 10 skips rows 1-9).
+    Example: list(iter_amortization_schedule(10000, 12, 10.0, first_emi=4, last_emi=6))
+    """
+    months = int(months)
+    first_emi = max(1, first_emi)
+    last_emi = months if last_emi is None else min(last_emi, months)
+
+    if not _is_whole_paise(loan_amount):
+        schedule = _generate_schedule_decimal(loan_amount, months, yearly_interest, start_date)
+        yield from schedule[first_emi - 1:last_emi]
+        return
 
     if start_date is None:
         start_date = date.today()
 
-    schedule = []
-    remaining_balance = Decimal(loan_amount)
-    emi_value = _round_to_paise(emi)
+    rows = schedule_template_cache.get(loan_amount, months, yearly_interest).rows
+    for month in range(first_emi, last_emi + 1):
+        emi_value, principal, interest, remaining_balance = rows[month - 1]
+        yield {
+            "emi_number": month,
+            "due_date": _due_date(start_date, month).isoformat(),
+            "emi_amount": emi_value / 100,
+            "principal": principal / 100,
+            "interest": interest / 100,
+            "remaining_balance": remaining_balance / 100,
+        }
+
+def _generate_schedule_decimal(loan_amount: Decimal, months: int,
+                               yearly_interest: Decimal, start_date: date = None):
+    """Uncached Decimal schedule generation (see generate_amortization_schedule)"""
+    with localcontext(_DECIMAL_CONTEXT):
+        emi, total_payable, total_interest = _calculate_emi_decimal(loan_amount, months, yearly_interest)
+
+        monthly_rate = (Decimal(yearly_interest) / Decimal("100")) / Decimal("12")
+
+        if start_date is None:
+            start_date = date.today()
+
+        schedule = []
+        remaining_balance = Decimal(loan_amount)
+        emi_value = _round_to_paise(emi)
+
+        for month in range(1, months + 1):
+            interest = _round_to_paise(remaining_balance * monthly_rate)
+            principal = _round_to_paise(emi_value - interest)
+
+            # If last month, clear out any small rounding residue
+            if month == months:
+                principal = remaining_balance
+                emi_value = _round_to_paise(principal + interest)
+
+            remaining_balance = _round_to_paise(remaining_balance - principal)
+
+            # Convert date to ISO string and Decimal to float so JSON can handle it
+            # EMI starts from next month after approval (month, not month-1)
+            due_date_iso = _due_date(start_date, month).isoformat()
+
+            schedule.append({
+                "emi_number": month,
+                "due_date": due_date_iso,                    # string like "2025-09-26"
+                "emi_amount": float(_round_to_paise(emi_value)),   # float like 4500.12
+                "principal": float(principal),
+                "interest": float(interest),
+                "remaining_balance": float(remaining_balance)
+            })
+
+        return schedule
+
+def _schedule_entries(rows, due_dates):
+    """Turn paise template rows plus ISO due dates into schedule dicts"""
+    return [
+        {
+            "emi_number": month,
+            "due_date": due_date,
+            "emi_amount": emi_value / 100,
+            "principal": principal / 100,
+            "interest": interest / 100,
+            "remaining_balance": remaining_balance / 100,
+        }
+        for month, ((emi_value, principal, interest, remaining_balance), due_date)
+        in enumerate(zip(rows, due_dates), start=1)
+    ]
+
+
+#------- Integer-Paise Money Engine --------
+
+# Loan.save() always builds schedules at the fixed LoanFriend rate
+DEFAULT_YEARLY_INTEREST = 10.0
+
+# Decimal keeps 28 significant digits; the integer helpers below mirror that
+_DECIMAL_DIGITS = 28
+
+# Results closer than 1e-12 paise to a half-paisa go back to the Decimal
+# code; Decimal's own error at 28 digits is far smaller than that
+_TIE_GUARD = 10 ** 12
+
+
+def _monthly_rate(yearly_interest) -> Decimal:
+    """Monthly rate exactly as generate_amortization_schedule computes it"""
+    with localcontext(_DECIMAL_CONTEXT):
+        return (Decimal(yearly_interest) / Decimal("100")) / Decimal("12")
+
+
+def _is_whole_paise(value) -> bool:
+    """True when the amount has no fraction of a paisa (e.g. 1000.50, not 1000.505)"""
+    amount = Decimal(value)
+    return amount == _round_to_paise(amount)
+
+
+def _to_paise(value) -> int:
+    """Convert a rupee amount (Decimal/int/float/str) into integer paise"""
+    return int(_round_to_paise(Decimal(value)) * 100)
+
+
+def _paise_to_decimal(paise: int) -> Decimal:
+    """Integer paise back to a 2-place Decimal (439826 → Decimal('4398.26'))"""
+    return Decimal(paise).scaleb(-2, _DECIMAL_CONTEXT)
+
+
+@lru_cache(maxsize=256)
+def _rate_fraction(yearly_interest: Decimal):
+    """
+    The 28-digit Decimal monthly rate as an exact fraction of integers.
+    Example: 10% yearly → (8333333333333333333333333333, 10**30)
+    """
+    sign, digits, exponent = _monthly_rate(yearly_interest).as_tuple()
+    numerator = int("".join(map(str, digits)) or "0")
+    if sign:
+        numerator = -numerator
+    if exponent >= 0:
+        return numerator * 10 ** exponent, 1
+    return numerator, 10 ** -exponent
+
+
+@lru_cache(maxsize=1024)
+def _annuity_factor(rate_numerator: int, rate_denominator: int, months: int):
+    """
+    EMI per paisa of principal, r × (1+r)^n / ((1+r)^n - 1), as an exact
+    (numerator, denominator) fraction. Only depends on rate and tenure,
+    so every loan amount reuses it.
+    """
+    growth = (rate_denominator + rate_numerator) ** months
+    base = rate_denominator ** months
+    numerator = rate_numerator * growth
+    denominator = rate_denominator * (growth - base)
+    common = gcd(numerator, denominator)
+    return numerator // common, denominator // common
+
+
+def _round_ratio(numerator: int, denominator: int):
+    """
+    numerator / denominator rounded to the nearest integer, or None when
+    it is within _TIE_GUARD of a half (let the Decimal code decide those).
+    """
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    quotient, remainder = divmod(numerator, denominator)
+    distance = 2 * remainder - denominator
+    if abs(distance) * _TIE_GUARD < denominator:
+        return None
+    return quotient + 1 if distance > 0 else quotient
+
+
+def _emi_paise(principal_paise: int, months: int, rate_numerator: int, rate_denominator: int):
+    """
+    (emi, total_payable, total_interest) in paise, matching calculate_emi.
+    Returns None if any value is too close to a half-paisa to call.
+    """
+    if months <= 0:
+        return None
+
+    # Special case: If interest is 0%, just divide loan by months
+    if rate_numerator == 0:
+        emi = _round_ratio(principal_paise, months)
+        return None if emi is None else (emi, principal_paise, 0)
+
+    factor_numerator, factor_denominator = _annuity_factor(rate_numerator, rate_denominator, months)
+    emi = _round_ratio(principal_paise * factor_numerator, factor_denominator)
+    total_payable = _round_ratio(principal_paise * factor_numerator * months, factor_denominator)
+    if emi is None or total_payable is None:
+        return None
+    return emi, total_payable, total_payable - principal_paise
+
+
+def _interest_paise(balance_paise: int, rate_numerator: int, rate_denominator: int) -> int:
+    """
+    One month of interest in paise, matching
+    _round_to_paise(remaining_balance * monthly_rate) bit for bit.
+
+    Decimal multiplies exactly, rounds the product to 28 significant digits
+    (ROUND_HALF_EVEN) and we then round to paise (ROUND_HALF_UP). That
+    first rounding moves the product by less than value / 10**27, so it can
+    only matter when the exact product sits that close to a half-paisa;
+    only then do we repeat Decimal's steps digit for digit.
+    """
+    value = balance_paise * rate_numerator
+    negative = value < 0
+    if negative:
+        value = -value
+
+    paise, remainder = divmod(value, rate_denominator)
+    distance = 2 * remainder - rate_denominator
+    if abs(distance) > (value >> 89) + 1:  # value >> 89 > value / 10**27
+        if distance >= 0:
+            paise += 1
+        return -paise if negative else paise
+
+    # Step 1: round the exact product to 28 significant digits
+    extra_digits = len(str(value)) - _DECIMAL_DIGITS
+    if extra_digits > 0:
+        scale = 10 ** extra_digits
+        value, remainder = divmod(value, scale)
+        if remainder * 2 > scale or (remainder * 2 == scale and value & 1):
+            value += 1
+        value *= scale
+
+    # Step 2: round to 2 decimal places (paise), halves go up
+    paise, remainder = divmod(value, rate_denominator)
+    if remainder * 2 >= rate_denominator:
+        paise += 1
+    return -paise if negative else paise
+
+
+#------- Schedule Template Cache --------
+
+class ScheduleTemplate:
+    """
+    The date-free part of a schedule for one set of loan terms.
+
+    - emi, total_payable, total_interest: Decimals, as calculate_emi returns them
+    - rows: tuple of (emi, principal, interest, remaining_balance) in paise
+    """
+    __slots__ = ("emi", "total_payable", "total_interest", "rows")
+
+    def __init__(self, emi, total_payable, total_interest, rows):
+        self.emi = emi
+        self.total_payable = total_payable
+        self.total_interest = total_interest
+        self.rows = rows
+
+
+def _build_schedule_template(loan_amount, months: int, yearly_interest) -> ScheduleTemplate:
+    """Work out EMI and every schedule row (in paise) for one set of terms"""
+    months = int(months)
+    principal_paise = _to_paise(loan_amount)
+    rate_numerator, rate_denominator = _rate_fraction(Decimal(yearly_interest))
+
+    totals = _emi_paise(principal_paise, months, rate_numerator, rate_denominator)
+    if totals is None:
+        emi, total_payable, total_interest = _calculate_emi_decimal(loan_amount, months, yearly_interest)
+        emi_value = _to_paise(emi)
+    else:
+        emi, total_payable, total_interest = map(_paise_to_decimal, totals)
+        emi_value = totals[0]
+
+    remaining_balance = principal_paise
+    rows = []
 
     for month in range(1, months + 1):
-        interest = _round_to_paise(remaining_balance * monthly_rate)
-        principal = _round_to_paise(emi_value - interest)
+        interest = _interest_paise(remaining_balance, rate_numerator, rate_denominator)
+        principal = emi_value - interest
 
-        # If last month, clear out any small rounding residue
+        # Same last-month residue handling as _generate_schedule_decimal
         if month == months:
             principal = remaining_balance
-            emi_value = _round_to_paise(principal + interest)
+            emi_value = principal + interest
+
+        remaining_balance -= principal
+        rows.append((emi_value, principal, interest, remaining_balance))
+
+    return ScheduleTemplate(emi, total_payable, total_interest, tuple(rows))
+
+
+class ScheduleTemplateCache:
+    """
+    LRU-bounded cache of ScheduleTemplates keyed by (amount, tenure, rate).
+
+    Most loans share their terms and only differ in due dates, so the
+    numbers are worked out once and reused. Set LOANS_SCHEDULE_CACHE_SIZE
+    to size it (0 turns caching off); stats() reports hits, misses and
+    evictions.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-        remaining_balance = _round_to_paise(remaining_balance - principal)
+    def get(self, loan_amount, months: int, yearly_interest) -> ScheduleTemplate:
+        key = (Decimal(loan_amount), int(months), Decimal(yearly_interest))
 
-        # Convert date to ISO string and Decimal to float so JSON can handle it
-        # EMI starts from next month after approval (month, not month-1)
-        due_date_iso = _add_months_safe(start_date, month).isoformat()
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
 
-        schedule.append({
+        # Build outside the lock; a rare duplicate build is harmless
+        template = _build_schedule_template(*key)
+        if self.maxsize <= 0:
+            return template
+
+        with self._lock:
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+                self.evictions += 1
+        return template
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._templates),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+schedule_template_cache = ScheduleTemplateCache(
+    maxsize=getattr(settings, "LOANS_SCHEDULE_CACHE_SIZE", 4096)
+)
+
+
+#------- Batch Schedule Generation --------
+
+def generate_amortization_schedules(loan_amounts, months, yearly_interests, start_dates):
+    """
+    Build schedules for many loans in one call.
+
+    Takes parallel sequences (one entry per loan) and returns a list of
+    schedules in the same order, each identical to what
+    generate_amortization_schedule would return for that loan.
+
+    Simple Explanation:
+    - Loans with the same amount, tenure and rate share the same numbers,
+      so each distinct set of terms comes from the template cache.
+    - Due dates come from the calendar lookup, shared by every loan
+      with the same start date.
+    """
+    loan_amounts = list(loan_amounts)
+    months = list(months)
+    yearly_interests = list(yearly_interests)
+    start_dates = list(start_dates)
+    if not len(loan_amounts) == len(months) == len(yearly_interests) == len(start_dates):
+        raise ValueError("Batch inputs must all have the same length.")
+
+    schedules = []
+
+    for loan_amount, tenure, yearly_interest, start_date in zip(
+        loan_amounts, months, yearly_interests, start_dates
+    ):
+        if not _is_whole_paise(loan_amount):
+            schedules.append(_generate_schedule_decimal(loan_amount, tenure, yearly_interest, start_date))
+            continue
+
+        template = schedule_template_cache.get(loan_amount, tenure, yearly_interest)
+
+        if start_date is None:
+            start_date = date.today()
+        schedules.append(_schedule_entries(template.rows, _due_dates(start_date, len(template.rows))))
+
+    return schedules
+
+
+def backfill_amortization_schedules(queryset=None, batch_size=500, overwrite=False):
+    """
+    Store amortization schedules for approved loans in bulk.
+
+    Loans are read in primary-key order, one batch at a time, and written
+    back with bulk_update (one UPDATE per batch instead of one save() per
+    loan). Safe to re-run: without overwrite only loans that are still
+    missing a schedule are touched.
+
+    Returns: number of loans updated
+    """
+    from .models import Loan  # Local import to avoid circular dependency
+
+    if queryset is None:
+        queryset = Loan.objects.all()
+    queryset = queryset.filter(status="APPROVED", approved_date__isnull=False)
+    if not overwrite:
+        queryset = queryset.filter(schedule_data__isnull=True)
+    queryset = queryset.only("id", "amount", "tenure", "approved_date").order_by("pk")
+
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+
+        schedules = generate_amortization_schedules(
+            [loan.amount for loan in batch],
+            [loan.tenure for loan in batch],
+            [DEFAULT_YEARLY_INTEREST] * len(batch),
+            [loan.approved_date.date() for loan in batch],
+        )
+        for loan, schedule in zip(batch, schedules):
+            loan.amortization_schedule = schedule
+
+        Loan.objects.bulk_update(batch, ["schedule_data"])
+        updated += len(batch)
+        last_pk = batch[-1].pk
+
+    if updated:
+        from .response_cache import clear_response_cache
+
+        clear_response_cache()  # bulk_update sends no signals
+    return updated
+
+
+#------- Payment Counters --------
+
+def repair_payment_counters(queryset=None, batch_size=500, dry_run=False):
+    """
+    Recount paid_emi_count / last_paid_date from the payments table (and
+    next_due_date / next_emi_amount from the corrected count).
+
+    Payment.save() keeps the counters in step, but rows written around it
+    (raw SQL, queryset.update(), restored backups) can drift. Loans are
+    checked one primary-key batch at a time and only the ones that differ
+    are written back with bulk_update.
+
+    Returns: list of (loan_id, stored count, actual count) that were wrong
+    """
+    from django.db.models import Count, Max, Q
+    from .models import Loan  # Local import to avoid circular dependency
+
+    if queryset is None:
+        queryset = Loan.objects.all()
+    queryset = (
+        queryset.annotate(
+            actual_count=Count("payments", filter=Q(payments__status="SUCCESS")),
+            actual_last_paid=Max("payments__payment_date", filter=Q(payments__status="SUCCESS")),
+        )
+        .only(
+            "id", "status", "amount", "tenure", "approved_date", "applied_date", "schedule_data",
+            *Loan.PAYMENT_COUNTER_FIELDS, *Loan.NEXT_DUE_FIELDS,
+        )
+        .order_by("pk")
+    )
+
+    mismatches = []
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+
+        stale = []
+        for loan in batch:
+            start_date = (loan.approved_date or loan.applied_date).date()
+            actual_next_due = next_due_emi(
+                loan.status, loan.amount, loan.tenure, start_date, loan.actual_count, loan.schedule_data
+            )
+            stored = (loan.paid_emi_count, loan.last_paid_date, loan.next_due_date, loan.next_emi_amount)
+            if stored == (loan.actual_count, loan.actual_last_paid, *actual_next_due):
+                continue
+            mismatches.append((loan.id, loan.paid_emi_count, loan.actual_count))
+            loan.paid_emi_count = loan.actual_count
+            loan.last_paid_date = loan.actual_last_paid
+            loan.next_due_date, loan.next_emi_amount = actual_next_due
+            stale.append(loan)
+        if stale and not dry_run:
+            Loan.objects.bulk_update(stale, [*Loan.PAYMENT_COUNTER_FIELDS, *Loan.NEXT_DUE_FIELDS])
+        last_pk = batch[-1].pk
+
+    if mismatches and not dry_run:
+        from .response_cache import clear_response_cache
+
+        clear_response_cache()  # bulk_update sends no signals
+    return mismatches
+
+
+#------- Next Due EMI --------
+
+def next_due_emi(status, loan_amount, months, start_date, paid_emis, schedule_data=None):
+    """
+    (due date, EMI amount) of the first unpaid EMI, or (None, None) when
+    nothing is due (loan not APPROVED, or every EMI paid).
+
+    Simple Explanation:
+    - Reads just that one row from the stored schedule bytes when there
+      are any, otherwise works it out from the loan terms.
+    - Loan.next_due_date / next_emi_amount hold this result, so "who is
+      due or overdue" is a plain indexed date range query.
+    """
+    if status != "APPROVED" or paid_emis >= months:
+        return None, None
+
+    next_emi = paid_emis + 1
+    if schedule_data:
+        _first, (due_dates, emi_values, *_rest) = _unpack_schedule_columns(schedule_data, next_emi, next_emi)
+        if not due_dates:
+            return None, None
+        return date.fromordinal(due_dates[0]), _paise_to_decimal(emi_values[0])
+
+    entry = next(iter_amortization_schedule(loan_amount, months, DEFAULT_YEARLY_INTEREST, start_date, next_emi, next_emi), None)
+    if entry is None:
+        return None, None
+    return date.fromisoformat(entry["due_date"]), _round_to_paise(Decimal(str(entry["emi_amount"])))
+
+
+# Days-past-due buckets for overdue loans: (label, first day, last day)
+OVERDUE_BUCKETS = (("1-30", 1, 30), ("31-60", 31, 60), ("61-90", 61, 90), ("90+", 91, None))
+
+
+def due_and_overdue_loans(days: int = 7, today: date = None, queryset=None):
+    """
+    Loans with an EMI due in the next `days` days, and overdue loans
+    grouped by days past due.
+
+    Simple Explanation:
+    - One range query on the indexed next_due_date column
+      (next_due_date <= today + days); nothing else is read.
+    - Rows due today or later go to "due", earlier ones to the overdue
+      bucket for their days past due.
+
+    Returns: {"as_of", "days", "due": {...}, "overdue": {...}} where each
+    group has "count", "amount" (Decimal) and its "loans"; overdue loans
+    are further split into "buckets" (see OVERDUE_BUCKETS).
+    """
+    from .models import Loan  # Local import to avoid circular dependency
+
+    if today is None:
+        today = timezone.localdate()
+    if queryset is None:
+        queryset = Loan.objects.all()
+    rows = (
+        queryset.filter(next_due_date__lte=today + timedelta(days=days))
+        .order_by("next_due_date", "pk")
+        .values_list("id", "user__username", "paid_emi_count", "next_due_date", "next_emi_amount")
+    )
+
+    def group():
+        return {"count": 0, "amount": Decimal("0.00"), "loans": []}
+
+    due = group()
+    buckets = {label: group() for label, _first, _last in OVERDUE_BUCKETS}
+    for loan_id, username, paid_emis, due_date, emi_amount in rows:
+        days_past_due = (today - due_date).days
+        entry = {
+            "loan_id": loan_id,
+            "user": username,
+            "emi_number": paid_emis + 1,
+            "due_date": due_date,
+            "emi_amount": emi_amount,
+            "days_past_due": max(days_past_due, 0),
+        }
+        if days_past_due <= 0:
+            target = due
+        else:
+            target = next(
+                buckets[label] for label, first, last in OVERDUE_BUCKETS
+                if first <= days_past_due and (last is None or days_past_due <= last)
+            )
+        target["count"] += 1
+        target["amount"] += emi_amount
+        target["loans"].append(entry)
+
+    overdue_buckets = [{"bucket": label, **buckets[label]} for label, _first, _last in OVERDUE_BUCKETS]
+    return {
+        "as_of": today,
+        "days": days,
+        "due": due,
+        "overdue": {
+            "count": sum(bucket["count"] for bucket in overdue_buckets),
+            "amount": sum((bucket["amount"] for bucket in overdue_buckets), Decimal("0.00")),
+            "buckets": overdue_buckets,
+        },
+    }
+
+
+#------- Compact Schedule Storage --------
+
+# Loan.schedule_data layout (little-endian):
+#   header: format version (uint8), number of EMIs n (uint16)
+#   then one column per field, n values each:
+#   due date as date ordinal (uint32), emi / principal / interest /
+#   remaining balance in paise (int32)
+# A 24-month schedule is 483 bytes instead of ~3.2 KB of JSON.
+_SCHEDULE_FORMAT_VERSION = 1
+_SCHEDULE_HEADER = struct.Struct("<BH")
+_SCHEDULE_MONEY_FIELDS = ("emi_amount", "principal", "interest", "remaining_balance")
+_SCHEDULE_COLUMN_WIDTH = 4
+
+
+def pack_schedule(schedule) -> bytes:
+    """Pack a list of schedule dicts into the compact binary format"""
+    count = len(schedule)
+    columns = [struct.pack(f"<{count}I", *(date.fromisoformat(entry["due_date"]).toordinal() for entry in schedule))]
+    for field in _SCHEDULE_MONEY_FIELDS:
+        columns.append(struct.pack(f"<{count}i", *(round(entry[field] * 100) for entry in schedule)))
+    return _SCHEDULE_HEADER.pack(_SCHEDULE_FORMAT_VERSION, count) + b"".join(columns)
+
+
+def unpack_schedule(data, first_emi: int = 1, last_emi: int = None):
+    """
+    Unpack stored schedule bytes back into the usual list of dicts.
+    Pass first_emi/last_emi to decode only that window of EMIs.
+    """
+    first_emi, columns = _unpack_schedule_columns(data, first_emi, last_emi)
+    due_dates, *money = columns
+
+    return [
+        {
             "emi_number": month,
-            "due_date": due_date_iso,                    # string like "2025-09-26"
-            "emi_amount": float(_round_to_paise(emi_value)),   # float like 4500.12
-            "principal": float(principal),
-            "interest": float(interest),
-            "remaining_balance": float(remaining_balance)
-        })
-
-    return schedule
\ No newline at end of file
+            "due_date": date.fromordinal(due_date).isoformat(),
+            "emi_amount": emi_value / 100,
+            "principal": principal / 100,
+            "interest": interest / 100,
+            "remaining_balance": remaining_balance / 100,
+        }
+        for month, (due_date, emi_value, principal, interest, remaining_balance)
+        in enumerate(zip(due_dates, *money), start=first_emi)
+    ]
+
+
+def _unpack_schedule_columns(data, first_emi: int = 1, last_emi: int = None):
+    """
+    Raw columns for a window of EMIs: (first_emi, (due date ordinals,
+    emi, principal, interest, remaining balance)), money in paise.
+    """
+    data = bytes(data)  # PostgreSQL hands back a memoryview
+    version, count = _SCHEDULE_HEADER.unpack_from(data)
+    if version != _SCHEDULE_FORMAT_VERSION:
+        raise ValueError(f"Unknown schedule format version: {version}")
+
+    first_emi = max(1, first_emi)
+    last_emi = count if last_emi is None else min(last_emi, count)
+    if last_emi < first_emi:
+        return first_emi, [()] * (len(_SCHEDULE_MONEY_FIELDS) + 1)
+
+    width = last_emi - first_emi + 1
+    offset = _SCHEDULE_HEADER.size + (first_emi - 1) * _SCHEDULE_COLUMN_WIDTH
+    column_size = count * _SCHEDULE_COLUMN_WIDTH
+
+    columns = [struct.unpack_from(f"<{width}I", data, offset)]
+    for column in range(1, len(_SCHEDULE_MONEY_FIELDS) + 1):
+        columns.append(struct.unpack_from(f"<{width}i", data, offset + column_size * column))
+    return first_emi, columns
+
+
+#------- Outstanding Balance / Foreclosure Quotes --------
+
+def calculate_outstanding_principal(loan_amount: Decimal, months: int,
+                                    yearly_interest: Decimal, payments_made: int) -> Decimal:
+    """
+    Remaining principal after `payments_made` EMIs (the foreclosure amount).
+
+    Same value as the schedule's remaining_balance for that EMI, but read
+    straight from the template's paise rows: no schedule dicts, no due
+    dates, no stored JSON needed.
+
+    Example: ₹10,000 over 6 months, 2 EMIs paid → ₹6,721.84 still owed
+    """
+    months = int(months)
+    if payments_made >= months:
+        return Decimal("0.00")
+    if payments_made <= 0:
+        return _round_to_paise(Decimal(loan_amount))
+
+    if not _is_whole_paise(loan_amount):
+        schedule = _generate_schedule_decimal(loan_amount, months, yearly_interest)
+        return _round_to_paise(Decimal(str(schedule[payments_made - 1]["remaining_balance"])))
+
+    template = schedule_template_cache.get(loan_amount, months, yearly_interest)
+    return _paise_to_decimal(template.rows[payments_made - 1][3])
+
+
+def iter_foreclosure_quotes(queryset=None, chunk_size=2000):
+    """
+    Foreclosure quote for every APPROVED loan, in one pass.
+
+    Paid EMI counts come from the loans' paid_emi_count column, so this
+    never loads schedules or counts payments. Yields one dict per loan.
+    """
+    from .models import Loan  # Local import to avoid circular dependency
+
+    if queryset is None:
+        queryset = Loan.objects.all()
+    rows = (
+        queryset.filter(status="APPROVED")
+        .order_by("pk")
+        .values_list("id", "user__username", "amount", "tenure", "monthly_installment", "paid_emi_count")
+    )
+
+    for loan_id, username, amount, tenure, monthly_installment, paid_emis in rows.iterator(chunk_size=chunk_size):
+        yield {
+            "loan_id": loan_id,
+            "user": username,
+            "original_amount": amount,
+            "monthly_installment": monthly_installment,
+            "total_tenure": tenure,
+            "payments_made": paid_emis,
+            "payments_remaining": max(0, tenure - paid_emis),
+            "foreclosure_amount": calculate_outstanding_principal(
+                amount, tenure, DEFAULT_YEARLY_INTEREST, paid_emis
+            ),
+        }
+
+
+#------- Portfolio Cash-Flow Projection --------
+
+def project_portfolio_cash_flows(queryset=None, chunk_size=2000):
+    """
+    Expected collections per month across all APPROVED loans.
+
+    Simple Explanation:
+    - One query streams every approved loan with its paid_emi_count and
+      stored schedule (no payments join, no full list in memory).
+    - Only the unpaid window of each stored schedule is decoded, straight
+      into paise, and added to the month each EMI falls due in (EMIs
+      already past due stay in their original month).
+    - Loans without a stored schedule are grouped by amount, tenure, start
+      date and progress, so each group's schedule is worked out once.
+
+    Returns: {"loans": n, "months": [...], "totals": {...}} where each month
+    is {"month": "YYYY-MM", "emi_count", "emi_amount", "principal", "interest"}
+    and amounts are Decimals.
+    """
+    from collections import Counter
+    from .models import Loan  # Local import to avoid circular dependency
+
+    if queryset is None:
+        queryset = Loan.objects.all()
+    rows = (
+        queryset.filter(status="APPROVED")
+        .order_by()
+        .values_list("amount", "tenure", "approved_date", "applied_date", "schedule_data", "paid_emi_count")
+    )
+
+    # month -> [emi_count, emi, principal, interest], money in paise
+    buckets = {}
+    unscheduled = Counter()
+    loan_count = 0
+
+    for amount, tenure, approved_date, applied_date, schedule_data, paid_emis in rows.iterator(chunk_size=chunk_size):
+        loan_count += 1
+        if schedule_data is not None:
+            _, (due_dates, emis, principals, interests, _balances) = _unpack_schedule_columns(
+                schedule_data, paid_emis + 1
+            )
+            for due_date, emi_value, principal, interest in zip(due_dates, emis, principals, interests):
+                bucket = buckets.get(_ordinal_month(due_date))
+                if bucket is None:
+                    bucket = buckets[_ordinal_month(due_date)] = [0, 0, 0, 0]
+                bucket[0] += 1
+                bucket[1] += emi_value
+                bucket[2] += principal
+                bucket[3] += interest
+        else:
+            start_date = (approved_date or applied_date).date()
+            unscheduled[(amount, tenure, start_date, min(paid_emis, tenure))] += 1
+
+    for (amount, tenure, start_date, paid_emis), group_size in unscheduled.items():
+        for due_date, emi_value, principal, interest in _projection_rows(amount, tenure, start_date)[paid_emis:]:
+            bucket = buckets.get(due_date[:7])
+            if bucket is None:
+                bucket = buckets[due_date[:7]] = [0, 0, 0, 0]
+            bucket[0] += group_size
+            bucket[1] += emi_value * group_size
+            bucket[2] += principal * group_size
+            bucket[3] += interest * group_size
+
+    months = [
+        {
+            "month": month,
+            "emi_count": emi_count,
+            "emi_amount": _paise_to_decimal(emi_value),
+            "principal": _paise_to_decimal(principal),
+            "interest": _paise_to_decimal(interest),
+        }
+        for month, (emi_count, emi_value, principal, interest) in sorted(buckets.items())
+    ]
+    return {
+        "loans": loan_count,
+        "months": months,
+        "totals": {
+            "emi_count": sum(bucket[0] for bucket in buckets.values()),
+            "emi_amount": _paise_to_decimal(sum(bucket[1] for bucket in buckets.values())),
+            "principal": _paise_to_decimal(sum(bucket[2] for bucket in buckets.values())),
+            "interest": _paise_to_decimal(sum(bucket[3] for bucket in buckets.values())),
+        },
+    }
+
+
+@lru_cache(maxsize=8192)
+def _ordinal_month(ordinal: int) -> str:
+    """Month key ("YYYY-MM") of a stored due-date ordinal"""
+    return date.fromordinal(ordinal).isoformat()[:7]
+
+
+def _projection_rows(loan_amount, months: int, start_date: date):
+    """(ISO due date, emi, principal, interest) in paise for every EMI of one loan"""
+    if not _is_whole_paise(loan_amount):
+        return [
+            (entry["due_date"], _to_paise(str(entry["emi_amount"])),
+             _to_paise(str(entry["principal"])), _to_paise(str(entry["interest"])))
+            for entry in _generate_schedule_decimal(loan_amount, months, DEFAULT_YEARLY_INTEREST, start_date)
+        ]
+
+    template = schedule_template_cache.get(loan_amount, months, DEFAULT_YEARLY_INTEREST)
+    return [
+        (due_date, emi_value, principal, interest)
+        for due_date, (emi_value, principal, interest, _balance)
+        in zip(_due_dates(start_date, len(template.rows)), template.rows)
+    ]
@@ -0,0 +1,282 @@
+"""
+Ingest gateway settlement files: EMI payments made outside the app.
+
+A file is NDJSON (one JSON object per line) or CSV with a header row,
+with these fields per row:
+
+    loan_id            required
+    amount             required, must equal the loan's monthly_installment
+    gateway_reference  required, the gateway's transaction id
+    emi_number         optional, defaults to the loan's next EMI
+    settled_at         optional, kept in the payment's gateway_response
+                       (payment_date is the time of ingestion)
+
+Rows are read one at a time (the file is never held in memory) and
+applied LOANS_SETTLEMENT_BATCH_SIZE at a time, one transaction per
+batch:
+
+1. lock the batch's loans (one SELECT ... FOR UPDATE);
+2. check each row against the loan (approved, next EMI in order, not
+   already paid, amount);
+3. INSERT the good rows with one bulk_create();
+4. write the loans' payment counters and next due EMI with one UPDATE
+   guarded on status = 'APPROVED' (loans.state.compare_and_swap_many());
+   loans whose last EMI was settled become REPAID through
+   loans.state.transition_many(), which also releases them from the
+   exposure ledger. Cached responses of every loan paid are invalidated.
+
+Rows that fail are reported with their line number and skipped; the
+rest of the file still goes in. Re-ingesting a file is safe: a row
+whose gateway_reference is already recorded on the loan comes back as
+"Payment ... already applied".
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from .models import Loan, Payment
+from .services import next_due_emi
+from .state import compare_and_swap_many, transition_many
+
+FORMATS = ("ndjson", "csv")
+
+
+class SettlementRowError(ValueError):
+    """A row that cannot be applied"""
+
+
+def batch_size() -> int:
+    return getattr(settings, "LOANS_SETTLEMENT_BATCH_SIZE", 500)
+
+
+def max_reported_errors() -> int:
+    return getattr(settings, "LOANS_SETTLEMENT_MAX_ERRORS", 1000)
+
+
+def guess_format(filename) -> str:
+    """"csv" / "ndjson" from the file extension (None if unknown)"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+
+def ingest_settlements(lines, file_format, on_error=None, size=None) -> dict:
+    """
+    Apply a settlement file given as an iterable of lines (str or bytes,
+    e.g. an open file or an uploaded file). `on_error(error)` is called
+    for every failed row with {"line", "loan_id", "error"}.
+
+    Returns: {"rows", "applied", "failed", "loans_repaid"}
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown settlement format {file_format!r}, expected one of {', '.join(FORMATS)}")
+    size = size or batch_size()
+    rows = _iter_csv(lines) if file_format == "csv" else _iter_ndjson(lines)
+
+    report = {"rows": 0, "applied": 0, "failed": 0, "loans_repaid": 0}
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            break
+        applied, repaid, errors = _apply_batch(batch)
+        report["rows"] += len(batch)
+        report["applied"] += applied
+        report["loans_repaid"] += repaid
+        report["failed"] += len(errors)
+        if on_error:
+            for error in sorted(errors, key=lambda error: error["line"]):
+                on_error(error)
+    return report
+
+
+#------- Reading --------
+
+def _text_lines(lines):
+    """Decode byte lines (undecodable bytes become U+FFFD and fail that row) and drop a BOM"""
+    for number, line in enumerate(lines):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        yield line.lstrip("\ufeff") if number == 0 else line
+
+
+def _iter_ndjson(lines):
+    """(line number, parsed row or SettlementRowError) per non-blank line"""
+    for number, line in enumerate(_text_lines(lines), start=1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError:
+            yield number, SettlementRowError("Invalid JSON")
+            continue
+        yield number, _parse_row(raw)
+
+
+def _iter_csv(lines):
+    """(line number, parsed row or SettlementRowError) per CSV record"""
+    reader = csv.DictReader(_text_lines(lines))
+    for raw in reader:
+        yield reader.line_num, _parse_row(raw)
+
+
+def _parse_row(raw):
+    """Validated field values of one row, or the SettlementRowError to report"""
+    if not isinstance(raw, dict):
+        return SettlementRowError("Each row must be an object")
+    try:
+        loan_id = _integer(raw.get("loan_id"), "loan_id")
+        emi_number = raw.get("emi_number")
+        emi_number = None if emi_number in (None, "") else _integer(emi_number, "emi_number")
+        try:
+            amount = Decimal(str(raw.get("amount")).strip())
+        except InvalidOperation:
+            raise SettlementRowError("amount must be a number")
+        if not amount.is_finite():
+            raise SettlementRowError("amount must be a number")
+        reference = str(raw.get("gateway_reference") or "").strip()
+        if not reference:
+            raise SettlementRowError("gateway_reference is required")
+        if len(reference) > Payment._meta.get_field("gateway_reference").max_length:
+            raise SettlementRowError("gateway_reference is too long")
+    except SettlementRowError as error:
+        error.loan_id = raw.get("loan_id")
+        return error
+    return {
+        "loan_id": loan_id,
+        "emi_number": emi_number,
+        "amount": amount,
+        "gateway_reference": reference,
+        "settled_at": raw.get("settled_at") or None,
+    }
+
+
+def _integer(value, name) -> int:
+    if isinstance(value, bool):
+        raise SettlementRowError(f"{name} must be an integer")
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise SettlementRowError(f"{name} must be an integer")
+    if number < 1:
+        raise SettlementRowError(f"{name} must be positive")
+    return number
+
+
+#------- Applying --------
+
+def _apply_batch(batch):
+    """
+    Apply one batch of (line number, row) in one transaction.
+
+    Returns: (payments created, loans repaid, errors)
+    """
+    errors = []
+    rows = []
+    for number, row in batch:
+        if isinstance(row, SettlementRowError):
+            errors.append({"line": number, "loan_id": getattr(row, "loan_id", None), "error": str(row)})
+        else:
+            rows.append((number, row))
+    if not rows:
+        return 0, 0, errors
+
+    loan_ids = sorted({row["loan_id"] for _number, row in rows})
+    with transaction.atomic():
+        loans = Loan.objects.select_for_update().filter(pk__in=loan_ids).order_by("pk").in_bulk()
+        existing = set(Payment.objects.filter(loan_id__in=loan_ids).values_list("loan_id", "emi_number"))
+        references = set(
+            Payment.objects.filter(
+                loan_id__in=loan_ids, gateway_reference__in={row["gateway_reference"] for _number, row in rows}
+            ).values_list("loan_id", "gateway_reference")
+        )
+
+        payments = []
+        paid = {}  # loan id -> paid EMI count including this batch
+        for number, row in rows:
+            loan = loans.get(row["loan_id"])
+            try:
+                emi_number = _check_row(loan, row, paid, existing, references)
+            except SettlementRowError as error:
+                errors.append({"line": number, "loan_id": row["loan_id"], "error": str(error)})
+                continue
+            paid[loan.pk] = emi_number
+            references.add((loan.pk, row["gateway_reference"]))
+            payments.append(Payment(
+                loan=loan,
+                amount=row["amount"],
+                emi_number=emi_number,
+                status="SUCCESS",
+                payment_type="EMI",
+                gateway_reference=row["gateway_reference"],
+                gateway_response={"settlement": True, "settled_at": row["settled_at"], "line": number},
+            ))
+        if not payments:
+            return 0, 0, errors
+
+        # bulk_create skips Payment.save(), so the loan counters are written below
+        Payment.objects.bulk_create(payments)
+        repaid = _update_loans([loans[loan_id] for loan_id in paid], paid)
+
+    return len(payments), repaid, errors
+
+
+def _check_row(loan, row, paid, existing, references) -> int:
+    """EMI number the row pays, or SettlementRowError"""
+    if loan is None:
+        raise SettlementRowError("Loan not found")
+    if (loan.pk, row["gateway_reference"]) in references:
+        raise SettlementRowError(f"Payment {row['gateway_reference']} already applied")
+    paid_emis = paid.get(loan.pk, loan.paid_emi_count)
+    if loan.status == "REPAID" or (loan.status == "APPROVED" and paid_emis >= loan.tenure):
+        raise SettlementRowError("Loan is already fully paid")
+    if loan.status != "APPROVED":
+        raise SettlementRowError("Can only pay for approved loans")
+
+    emi_number = row["emi_number"] or paid_emis + 1
+    if emi_number <= paid_emis:
+        raise SettlementRowError(f"EMI #{emi_number} already paid")
+    if emi_number != paid_emis + 1:
+        raise SettlementRowError(f"Expected EMI #{paid_emis + 1}, got EMI #{emi_number}")
+    if (loan.pk, emi_number) in existing:
+        raise SettlementRowError(f"EMI #{emi_number} already exists")
+    if row["amount"] != loan.monthly_installment:
+        raise SettlementRowError(f"EMI payment amount must match loan EMI: ₹{loan.monthly_installment}")
+    return emi_number
+
+
+def _update_loans(loans, paid) -> int:
+    """
+    Counters and next due EMI for the loans paid in this batch (`paid`:
+    loan id -> paid EMI count); loans now fully paid move to REPAID.
+    Returns loans repaid.
+    """
+    # One expression for every loan, so it is not a CASE over the batch
+    latest_payment = Subquery(
+        Payment.objects.filter(loan=OuterRef("pk"), status="SUCCESS")
+        .order_by().values("loan").annotate(latest=Max("payment_date")).values("latest")
+    )
+
+    paying = []
+    repaid = []
+    for loan in loans:
+        changes = {"paid_emi_count": paid[loan.pk], "last_paid_date": latest_payment}
+        if paid[loan.pk] >= loan.tenure:
+            repaid.append((loan, "REPAID", changes))
+            continue
+        start_date = (loan.approved_date or loan.applied_date).date()
+        changes["next_due_date"], changes["next_emi_amount"] = next_due_emi(
+            loan.status, loan.amount, loan.tenure, start_date, paid[loan.pk], loan.schedule_data
+        )
+        paying.append((loan, changes))
+
+    compare_and_swap_many(paying, {"status": "APPROVED"})
+    transition_many(repaid)
+    return len(repaid)
@@ -0,0 +1,76 @@
+"""
+Invalidate cached loan responses (see loans.response_cache) when the
+data behind them changes, and keep the exposure ledger and the loan's
+payment counters right when a loan or payment is deleted. Connected in
+LoansConfig.ready().
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import UserProfile
+
+from .exposure import apply_exposure_change
+from .models import Loan, Payment
+from .response_cache import invalidate, invalidate_loan, is_enabled
+
+
+def _invalidate_user_loans(user_id):
+    """A user's details appear on all their loans and in the lists"""
+    loan_ids = Loan.objects.filter(user_id=user_id).values_list("id", flat=True)
+    invalidate("all", f"user:{user_id}", *(f"loan:{loan_id}" for loan_id in loan_ids))
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+def loan_changed(sender, instance, **kwargs):
+    # A deleted row cannot load a deferred user_id; the loaded value has it
+    user_id = None if "user_id" in instance.get_deferred_fields() else instance.user_id
+    invalidate_loan(instance.pk, user_id, instance.get_loaded_value("user_id"))
+
+
+def _deleting_loans(origin):
+    """Whether a delete started from a Loan or Loan queryset (payments go with it by cascade)"""
+    return isinstance(origin, Loan) or getattr(origin, "model", None) is Loan
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def payment_changed(sender, instance, origin=None, **kwargs):
+    if _deleting_loans(origin):
+        return  # The loan's own post_delete invalidates it
+    # Payment counters move with a queryset UPDATE, so Loan's own signal doesn't fire
+    if Payment.loan.is_cached(instance):
+        user_id = instance.loan.user_id
+    else:
+        user_id = Loan.objects.filter(pk=instance.loan_id).values_list("user_id", flat=True).first()
+    invalidate_loan(instance.loan_id, user_id)
+
+
+@receiver(post_delete, sender=Loan)
+def loan_deleted(sender, instance, **kwargs):
+    # Loan.delete(), queryset deletes (admin "delete selected") and
+    # cascades, inside the delete's transaction
+    apply_exposure_change(instance._stored_exposure_share(), None)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, origin=None, **kwargs):
+    # Payment.delete() and queryset deletes (admin "delete selected"); not
+    # the cascade from deleting the loan itself
+    deleting_payments = isinstance(origin, Payment) or getattr(origin, "model", None) is Payment
+    if deleting_payments and instance.get_loaded_value("status", instance.status) == "SUCCESS":
+        instance._move_loan_counters(-1)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    if is_enabled():
+        _invalidate_user_loans(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which no loan response shows
+    if is_enabled() and not kwargs.get("created") and set(update_fields or ()) != {"last_login"}:
+        _invalidate_user_loans(instance.pk)
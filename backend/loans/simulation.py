@@ -0,0 +1,286 @@
+"""
+What-if simulation of the approved loan book.
+
+A scenario changes the terms of every approved loan from its next unpaid
+EMI onwards and reports what that does to interest income and monthly
+collections compared with the loans as they stand today:
+
+- yearly_interest: new yearly rate (re-amortizes the remaining balance)
+- extra_months: tenure extension (remaining balance spread over more EMIs)
+- prepayment_month / prepayment_amount: every borrower pays this much extra
+  right after their EMI number `prepayment_month`; the EMI is then reworked
+  over the remaining months
+
+Loans are streamed from the database in one query and simulated in chunks
+on a process pool. Use run_simulation() from code, the simulate_scenario
+management command, or POST /api/loans/simulate/.
+"""
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from decimal import Decimal, InvalidOperation
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+
+from .services import (
+    DEFAULT_YEARLY_INTEREST,
+    ScheduleTemplateCache,
+    _due_dates,
+    _paise_to_decimal,
+    _to_paise,
+    schedule_template_cache,
+)
+
+# Reworked schedules are keyed by remaining balances that real loans almost
+# never have, so they get their own cache (one per worker process) instead
+# of evicting the real loan terms the request path needs from
+# schedule_template_cache
+_rework_cache = ScheduleTemplateCache(maxsize=getattr(settings, "LOANS_SCHEDULE_CACHE_SIZE", 4096))
+
+
+class SimulationTimeout(Exception):
+    """The worker pool did not finish within LOANS_SIMULATION_TIMEOUT seconds"""
+
+
+#------- Scenario Definition --------
+
+def parse_scenario(data) -> dict:
+    """
+    Validate a scenario definition (e.g. request JSON) and return it with
+    defaults filled in. Raises ValueError with a readable message.
+    """
+    data = data or {}
+    unknown = set(data) - {"yearly_interest", "extra_months", "prepayment_month", "prepayment_amount"}
+    if unknown:
+        raise ValueError(f"Unknown scenario field(s): {', '.join(sorted(unknown))}")
+
+    try:
+        yearly_interest = Decimal(str(data.get("yearly_interest", DEFAULT_YEARLY_INTEREST)))
+        extra_months = int(data.get("extra_months", 0))
+        prepayment_month = data.get("prepayment_month")
+        prepayment_month = None if prepayment_month is None else int(prepayment_month)
+        prepayment_amount = Decimal(str(data.get("prepayment_amount", 0)))
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError("Scenario values must be numbers")
+
+    if not Decimal("0") <= yearly_interest <= Decimal("100"):
+        raise ValueError("yearly_interest must be between 0 and 100")
+    if extra_months < 0:
+        raise ValueError("extra_months cannot be negative")
+    if prepayment_amount < 0:
+        raise ValueError("prepayment_amount cannot be negative")
+    if (prepayment_month is None) != (prepayment_amount == 0):
+        raise ValueError("prepayment_month and prepayment_amount must be given together")
+    if prepayment_month is not None and prepayment_month < 1:
+        raise ValueError("prepayment_month must be an EMI number (1 or more)")
+
+    return {
+        "yearly_interest": yearly_interest,
+        "extra_months": extra_months,
+        "prepayment_month": prepayment_month,
+        "prepayment_amount": _to_paise(prepayment_amount),  # paise
+    }
+
+
+#------- Simulation Engine --------
+
+def run_simulation(scenario, queryset=None, workers=None, chunk_size=None):
+    """
+    Run a scenario definition (see parse_scenario) over every APPROVED loan.
+
+    Simple Explanation:
+    - One query streams (amount, tenure, start date, paid_emi_count) for
+      each approved loan.
+    - Loans are cut into chunks of `chunk_size` and simulated on a pool of
+      `workers` processes (1 runs everything in this process).
+    - Each chunk returns small totals, which are added up here.
+
+    Returns: {"loans", "baseline", "scenario", "delta", "months": [...]}
+    with interest income and collections as Decimals, plus the monthly
+    cash-flow shift.
+    """
+    from .models import Loan  # Local import to avoid circular dependency
+
+    scenario = parse_scenario(scenario)
+    if workers is None:
+        workers = getattr(settings, "LOANS_SIMULATION_WORKERS", None) or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = getattr(settings, "LOANS_SIMULATION_CHUNK_SIZE", 5000)
+    if workers < 1 or chunk_size < 1:
+        raise ValueError("workers and chunk_size must be at least 1")
+
+    if queryset is None:
+        queryset = Loan.objects.all()
+    rows = (
+        queryset.filter(status="APPROVED")
+        .order_by()
+        .values_list("amount", "tenure", "approved_date", "applied_date", "paid_emi_count")
+    )
+
+    def chunks():
+        chunk = []
+        for amount, tenure, approved_date, applied_date, paid_emis in rows.iterator(chunk_size=chunk_size):
+            chunk.append((amount, tenure, (approved_date or applied_date).date(), paid_emis))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    totals = _empty_totals()
+    if workers == 1:
+        for chunk in chunks():
+            _merge_totals(totals, simulate_chunk(chunk, scenario))
+    else:
+        timeout = getattr(settings, "LOANS_SIMULATION_TIMEOUT", 300)
+        deadline = time.monotonic() + timeout
+        # Not fork: the API starts the pool from a threaded request handler, and a
+        # forked child can inherit a lock (schedule cache, logging) held by another thread
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+        finished = False
+        try:
+            # Keep at most two chunks per worker in flight so memory stays flat
+            pending = []
+            for chunk in chunks():
+                pending.append(pool.submit(simulate_chunk, chunk, scenario))
+                if len(pending) >= workers * 2:
+                    _merge_totals(totals, pending.pop(0).result(timeout=max(0, deadline - time.monotonic())))
+            for future in pending:
+                _merge_totals(totals, future.result(timeout=max(0, deadline - time.monotonic())))
+            finished = True
+        except TimeoutError:
+            raise SimulationTimeout(f"Simulation did not finish within {timeout} seconds")
+        finally:
+            # Don't wait for stuck workers after a timeout or error
+            pool.shutdown(wait=finished, cancel_futures=not finished)
+
+    return _report(totals)
+
+
+def _pool_context():
+    """forkserver where the platform has it, else spawn"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def simulate_chunk(loans, scenario) -> dict:
+    """
+    Simulate one chunk of (amount, tenure, start_date, paid_emis) tuples.
+    Runs inside the worker processes, so it only touches loans.services.
+    """
+    totals = _empty_totals()
+    for amount, tenure, start_date, paid_emis in loans:
+        _simulate_loan(totals, amount, tenure, start_date, min(paid_emis, tenure), scenario)
+    return totals
+
+
+def _simulate_loan(totals, amount, tenure, start_date, paid_emis, scenario):
+    """Add one loan's remaining baseline and scenario cash flows to totals"""
+    if paid_emis >= tenure:
+        return
+
+    totals["loans"] += 1
+    months = totals["months"]
+    baseline_rows = schedule_template_cache.get(amount, tenure, DEFAULT_YEARLY_INTEREST).rows
+    total_months = tenure + scenario["extra_months"]
+    due_dates = _due_dates(start_date, total_months)
+
+    # Baseline: the loan carries on exactly as scheduled
+    for emi_number in range(paid_emis + 1, tenure + 1):
+        emi_value, _principal, interest, _balance = baseline_rows[emi_number - 1]
+        totals["baseline_interest"] += interest
+        totals["baseline_collections"] += emi_value
+        months.setdefault(due_dates[emi_number - 1][:7], [0, 0])[0] += emi_value
+
+    # Scenario: rework the schedule from the next unpaid EMI
+    yearly_interest = scenario["yearly_interest"]
+    terms_changed = yearly_interest != Decimal(DEFAULT_YEARLY_INTEREST) or scenario["extra_months"]
+    balance = baseline_rows[paid_emis - 1][3] if paid_emis else _to_paise(amount)
+
+    prepayment_month = scenario["prepayment_month"]
+    if prepayment_month is None or not paid_emis < prepayment_month < total_months:
+        prepayment_month = None  # Already past, or nothing left to rework after it
+
+    if terms_changed:
+        rows = _rework_cache.get(_paise_to_decimal(balance), total_months - paid_emis, yearly_interest).rows
+    else:
+        rows = baseline_rows[paid_emis:]
+
+    emi_number = paid_emis
+    for emi_value, _principal, interest, balance in rows:
+        emi_number += 1
+        totals["scenario_interest"] += interest
+        totals["scenario_collections"] += emi_value
+        months.setdefault(due_dates[emi_number - 1][:7], [0, 0])[1] += emi_value
+
+        if emi_number == prepayment_month:
+            prepayment = min(scenario["prepayment_amount"], balance)
+            balance -= prepayment
+            totals["prepayments"] += prepayment
+            totals["scenario_collections"] += prepayment
+            months[due_dates[emi_number - 1][:7]][1] += prepayment
+            if balance:
+                # Same rate and end date, lower EMI for the rest of the loan
+                rework = _rework_cache.get(_paise_to_decimal(balance), total_months - emi_number, yearly_interest).rows
+                for emi_value, _principal, interest, _balance in rework:
+                    emi_number += 1
+                    totals["scenario_interest"] += interest
+                    totals["scenario_collections"] += emi_value
+                    months.setdefault(due_dates[emi_number - 1][:7], [0, 0])[1] += emi_value
+            break
+
+
+def _empty_totals() -> dict:
+    """Running totals in paise; months maps "YYYY-MM" to [baseline, scenario]"""
+    return {
+        "loans": 0,
+        "baseline_interest": 0,
+        "scenario_interest": 0,
+        "baseline_collections": 0,
+        "scenario_collections": 0,
+        "prepayments": 0,
+        "months": {},
+    }
+
+
+def _merge_totals(totals, chunk_totals):
+    for key, value in chunk_totals.items():
+        if key == "months":
+            for month, (baseline, scenario) in value.items():
+                bucket = totals["months"].setdefault(month, [0, 0])
+                bucket[0] += baseline
+                bucket[1] += scenario
+        else:
+            totals[key] += value
+
+
+def _report(totals) -> dict:
+    """Turn paise totals into the Decimal summary run_simulation returns"""
+    baseline = {
+        "interest_income": _paise_to_decimal(totals["baseline_interest"]),
+        "collections": _paise_to_decimal(totals["baseline_collections"]),
+    }
+    scenario = {
+        "interest_income": _paise_to_decimal(totals["scenario_interest"]),
+        "collections": _paise_to_decimal(totals["scenario_collections"]),
+        "prepayments": _paise_to_decimal(totals["prepayments"]),
+    }
+    return {
+        "loans": totals["loans"],
+        "baseline": baseline,
+        "scenario": scenario,
+        "delta": {
+            "interest_income": scenario["interest_income"] - baseline["interest_income"],
+            "collections": scenario["collections"] - baseline["collections"],
+        },
+        "months": [
+            {
+                "month": month,
+                "baseline": _paise_to_decimal(baseline_paise),
+                "scenario": _paise_to_decimal(scenario_paise),
+                "delta": _paise_to_decimal(scenario_paise - baseline_paise),
+            }
+            for month, (baseline_paise, scenario_paise) in sorted(totals["months"].items())
+        ],
+    }
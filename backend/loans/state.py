@@ -0,0 +1,244 @@
+"""
+Loan state machine with compare-and-swap transitions.
+
+Every status change is a single conditional UPDATE:
+
+    UPDATE loans_loan SET status = 'APPROVED', ... WHERE id = ? AND status = 'PENDING'
+
+so of two parallel requests (two admins approving, a payment racing a
+foreclosure) exactly one wins. transition() returns whether this caller
+won; only the winner gets the side effects (schedule, closing fields,
+exposure ledger, response-cache invalidation), and the loan instance is
+updated in memory to match the row.
+
+    if not transition(loan, "APPROVED", approved_by=admin, approved_date=timezone.now()):
+        ...  # Someone else moved the loan first
+
+Batch flows (bulk decisions, settlement files) lock their loans first
+and move them with transition_many(), which applies the same rules and
+side effects with one conditional UPDATE per from-status:
+
+    transition_many([(loan, "REPAID", {"paid_emi_count": 12}), ...])
+
+Allowed moves are listed in TRANSITIONS. Loan.save() still works for
+edits outside these flows (admin site, shell).
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
+
+from .exposure import apply_exposure_change, apply_exposure_changes
+from .models import Loan
+from .response_cache import invalidate, invalidate_loan
+
+# to status -> statuses it may be entered from
+TRANSITIONS = {
+    "APPROVED": ("PENDING",),
+    "REJECTED": ("PENDING",),
+    "REJECTED_LIMIT": ("PENDING",),
+    "REPAID": ("APPROVED",),
+    "FORECLOSED": ("APPROVED",),
+}
+
+CLOSED_STATUSES = ("REPAID", "FORECLOSED", "REJECTED", "REJECTED_LIMIT")
+
+
+class InvalidTransition(ValueError):
+    """The requested move is not in TRANSITIONS at all (a programming error)"""
+
+
+class StaleLoans(RuntimeError):
+    """A batch UPDATE matched fewer rows than it was given (the loans were not locked)"""
+
+
+def can_transition(loan, to_status) -> bool:
+    """Whether the loan, as loaded, could move to to_status"""
+    return loan.status in TRANSITIONS.get(to_status, ())
+
+
+def transition(loan, to_status, guard=None, **changes) -> bool:
+    """
+    Move `loan` from its loaded status to `to_status` with one conditional
+    UPDATE, also writing `changes` (plain values). `guard` adds extra
+    WHERE conditions, e.g. {"paid_emi_count": 3}.
+
+    Returns True if this call won. Losing (the row no longer matches)
+    writes nothing and leaves `loan` untouched.
+    """
+    from_status = loan.status
+    _check_move(from_status, to_status, changes)
+
+    changes = {"status": to_status, **changes, **_derived_changes(loan, to_status, changes)}
+    with transaction.atomic():
+        if not compare_and_swap(loan, {"status": from_status, **(guard or {})}, changes):
+            return False
+        # Only the winner moves the owner's credit exposure
+        apply_exposure_change(
+            loan._exposure_share(status=from_status),
+            loan._exposure_share(status=to_status),
+        )
+    return True
+
+
+def transition_many(moves) -> None:
+    """
+    transition() for a batch: `moves` is [(loan, to_status, changes), ...]
+    for loans the caller has locked (SELECT ... FOR UPDATE) in its
+    transaction. Schedules for loans being approved come from one
+    generate_amortization_schedules() call, the rows are written with one
+    UPDATE per from-status (WHERE status = <from-status>), then the
+    exposure ledger moves once and the cached responses are invalidated;
+    the loans are updated in memory to match.
+
+    Raises StaleLoans, rolling back, if a row no longer matched.
+    """
+    from .services import DEFAULT_YEARLY_INTEREST, generate_amortization_schedules, pack_schedule
+
+    for loan, to_status, changes in moves:
+        _check_move(loan.status, to_status, changes)
+
+    needing = [
+        (loan, changes) for loan, to_status, changes in moves
+        if to_status == "APPROVED" and not (changes.get("schedule_data") or loan.schedule_data)
+    ]
+    schedules = generate_amortization_schedules(
+        [loan.amount for loan, _changes in needing],
+        [loan.tenure for loan, _changes in needing],
+        [DEFAULT_YEARLY_INTEREST] * len(needing),
+        [(changes.get("approved_date") or loan.approved_date or loan.applied_date).date() for loan, changes in needing],
+    )
+    schedule_data = {loan.pk: pack_schedule(schedule) for (loan, _changes), schedule in zip(needing, schedules)}
+
+    by_status = defaultdict(list)
+    exposure_changes = []
+    for loan, to_status, changes in moves:
+        if loan.pk in schedule_data:
+            changes = {**changes, "schedule_data": schedule_data[loan.pk]}
+        changes = {"status": to_status, **changes, **_derived_changes(loan, to_status, changes)}
+        by_status[loan.status].append((loan, changes))
+        exposure_changes.append((loan._exposure_share(), loan._exposure_share(status=to_status)))
+
+    with transaction.atomic():
+        for from_status, loan_changes in by_status.items():
+            compare_and_swap_many(loan_changes, {"status": from_status})
+        apply_exposure_changes(exposure_changes)
+
+
+def compare_and_swap(loan, expected, changes) -> bool:
+    """
+    UPDATE the loan row with `changes` only if its columns still equal
+    `expected`; on success mirror the changes on `loan` (and its
+    dirty-tracking snapshot, so a later save() sees nothing to write) and
+    invalidate cached responses. Returns whether the row was updated.
+    """
+    updated = Loan.objects.filter(pk=loan.pk, **expected).update(**changes)
+    if not updated:
+        return False
+
+    for name, value in changes.items():
+        setattr(loan, name, value)
+    loan._snapshot_fields(list(changes))
+    invalidate_loan(loan.pk, loan.user_id)
+    return True
+
+
+def compare_and_swap_many(loan_changes, expected) -> None:
+    """
+    compare_and_swap() for a batch of [(loan, changes), ...] the caller
+    has locked: one UPDATE (per bulk_batch_size chunk) of the rows still
+    matching `expected`. A column is written as a plain value when every
+    loan gets the same one, otherwise as a CASE with one WHEN id IN (...)
+    per distinct value. Changes may be expressions (e.g. a Subquery);
+    those columns are read back after the UPDATE.
+
+    Raises StaleLoans, rolling back, if a row no longer matched.
+    """
+    if not loan_changes:
+        return
+    names = list(dict.fromkeys(name for _loan, changes in loan_changes for name in changes))
+    fields = [Loan._meta.get_field(name) for name in names]
+    loans = [loan for loan, _changes in loan_changes]
+    chunk_size = connection.ops.bulk_batch_size(["pk", "pk", *names], loans) or len(loans)
+
+    with transaction.atomic():
+        for start in range(0, len(loan_changes), chunk_size):
+            chunk = loan_changes[start:start + chunk_size]
+            update = {}
+            for name, field in zip(names, fields):
+                loan_ids = defaultdict(list)  # value -> loans getting it
+                for loan, changes in chunk:
+                    loan_ids[_column_value(field, changes.get(name, getattr(loan, field.attname)))].append(loan.pk)
+                if len(loan_ids) == 1:
+                    update[field.attname] = next(iter(loan_ids))
+                    continue
+                update[field.attname] = Case(
+                    *(
+                        When(pk__in=ids, then=value if hasattr(value, "resolve_expression") else Value(value, output_field=field))
+                        for value, ids in loan_ids.items()
+                    ),
+                    output_field=field,
+                )
+            updated = Loan.objects.filter(pk__in=[loan.pk for loan, _changes in chunk], **expected).update(**update)
+            if updated != len(chunk):
+                raise StaleLoans(f"{len(chunk) - updated} of {len(chunk)} loans no longer matched {expected}")
+
+        computed = [name for name in names if any(
+            hasattr(changes.get(name), "resolve_expression") for _loan, changes in loan_changes
+        )]
+        if computed:
+            stored = {row["pk"]: row for row in Loan.objects.filter(pk__in=[loan.pk for loan in loans]).values("pk", *computed)}
+            loan_changes = [
+                (loan, {**changes, **{name: stored[loan.pk][name] for name in computed if name in changes}})
+                for loan, changes in loan_changes
+            ]
+
+    for loan, changes in loan_changes:
+        for name, value in changes.items():
+            setattr(loan, name, value)
+        loan._snapshot_fields(list(changes))
+    invalidate("all", *(f"loan:{loan.pk}" for loan in loans), *{f"user:{loan.user_id}" for loan in loans})
+
+
+def _check_move(from_status, to_status, changes):
+    """InvalidTransition / ValidationError for a move transition() must not make"""
+    if from_status not in TRANSITIONS.get(to_status, ()):
+        raise InvalidTransition(f"A {from_status} loan cannot become {to_status}")
+    approver = changes.get("approved_by")
+    if approver is not None and not getattr(approver, "is_staff", False):
+        raise ValidationError({"approved_by": "approved_by must be a staff user."})
+
+
+def _column_value(field, value):
+    """What an UPDATE writes for `value`, hashable (a related object becomes its id)"""
+    if field.is_relation and value is not None and not isinstance(value, int):
+        return value.pk
+    if isinstance(value, memoryview):
+        return bytes(value)
+    return value
+
+
+def _derived_changes(loan, to_status, changes) -> dict:
+    """Columns that follow from the new status, as Loan.save() would set them"""
+    from .services import generate_amortization_schedule, next_due_emi, pack_schedule
+
+    if to_status in CLOSED_STATUSES:
+        return {"is_closed": True, "next_due_date": None, "next_emi_amount": None}
+
+    derived = {"is_closed": False}
+    if to_status == "APPROVED":
+        approved_date = changes.get("approved_date") or loan.approved_date or loan.applied_date
+        schedule_data = changes.get("schedule_data") or loan.schedule_data
+        if not schedule_data:
+            schedule_data = pack_schedule(generate_amortization_schedule(
+                loan_amount=loan.amount,
+                months=loan.tenure,
+                yearly_interest=10.0,
+                start_date=approved_date.date(),
+            ))
+            derived["schedule_data"] = schedule_data
+        derived["next_due_date"], derived["next_emi_amount"] = next_due_emi(
+            "APPROVED", loan.amount, loan.tenure, approved_date.date(), loan.paid_emi_count, schedule_data
+        )
+    return derived
@@ -1,3 +1,605 @@
-from django.test import TestCase
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Context, Decimal, ROUND_HALF_UP, localcontext
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from users.models import User, UserProfile
+
+from . import services
+from .archive import archive_closed_loans
+from .exposure import EXPOSURE_LIMIT, rebuild_exposure
+from .idempotency import REPLAY_HEADER, _fingerprint, idempotent
+from .models import ArchivedLoan, ArchivedPayment, IdempotencyKey, Loan, Payment
+from .query_plans import check_query_plans
+from .response_cache import cache_stats, check_response_cache, is_enabled
+from .services import (
+    calculate_emi,
+    calculate_outstanding_principal,
+    generate_amortization_schedule,
+    schedule_template_cache,
+)
+from .simulation import run_simulation
+from .views import LoanForecloseView, LoanListCreateView, approve_loan, make_payment
+
+
+def create_borrower(username, number=0):
+    """A borrower with a full profile (the loan serializer shows both)"""
+    user = User.objects.create(username=username, email=f"{username}@example.com", first_name="Sample", role="USER")
+    UserProfile.objects.create(
+        user=user,
+        phone_number="+910000000000",
+        bank_account_number="000000000000",
+        ifsc_code="TEST0000000",
+        address_line_1="Sample street",
+        city="Sample city",
+        state="Sample state",
+        pin_code="000000",
+        pan_number=f"Q{number:09d}",
+        aadhaar_number=f"{number:012d}",
+    )
+    return user
+
+
+def create_admin(username="admin"):
+    return User.objects.create(username=username, role="ADMIN", is_staff=True)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def run_parallel(calls, threads=8):
+    """
+    Run (view, user, path, data, view kwargs) POSTs on a thread pool.
+    Returns a Counter of "<path label> <status code>" (or the exception name).
+    """
+    def post(call):
+        view, user, path, data, kwargs = call
+        label = path.rstrip("/").rsplit("/", 1)[-1]
+        request = APIRequestFactory().post(path, data, format="json")
+        force_authenticate(request, user=user)
+        try:
+            return f"{label} {view(request, **kwargs).status_code}"
+        except Exception as error:
+            return f"{label} {type(error).__name__}"
+        finally:
+            connection.close()  # Each worker thread has its own connection
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return Counter(pool.map(post, calls))
+
+
+#------- Frozen Decimal reference --------
+# calculate_emi / generate_amortization_schedule as they were before the
+# integer-paise engine, in their own 28-digit context. Do not edit these
+# along with loans.services: they are what the engine must keep matching.
+
+def _reference_round(value):
+    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def reference_emi(loan_amount, months, yearly_interest):
+    with localcontext(Context(prec=28)):
+        principal = Decimal(loan_amount)
+        monthly_rate = (Decimal(yearly_interest) / Decimal("100")) / Decimal("12")
+        if monthly_rate == 0:
+            emi = principal / Decimal(months)
+            total_amount = principal
+        else:
+            power = (Decimal("1") + monthly_rate) ** Decimal(months)
+            emi = principal * monthly_rate * power / (power - Decimal("1"))
+            total_amount = emi * Decimal(months)
+        return _reference_round(emi), _reference_round(total_amount), _reference_round(total_amount - principal)
+
+
+def reference_schedule(loan_amount, months, yearly_interest, start_date):
+    with localcontext(Context(prec=28)):
+        emi, _total_payable, _total_interest = reference_emi(loan_amount, months, yearly_interest)
+        monthly_rate = (Decimal(yearly_interest) / Decimal("100")) / Decimal("12")
+        remaining_balance = Decimal(loan_amount)
+        emi_value = _reference_round(emi)
+        schedule = []
+        for month in range(1, months + 1):
+            interest = _reference_round(remaining_balance * monthly_rate)
+            principal = _reference_round(emi_value - interest)
+            if month == months:
+                principal = remaining_balance
+                emi_value = _reference_round(principal + interest)
+            remaining_balance = _reference_round(remaining_balance - principal)
+            month_index = start_date.month - 1 + month
+            due_year, due_month = start_date.year + month_index // 12, month_index % 12 + 1
+            for day in (31, 30, 29, 28):
+                try:
+                    due_date = date(due_year, due_month, min(start_date.day, day))
+                    break
+                except ValueError:
+                    continue
+            schedule.append({
+                "emi_number": month,
+                "due_date": due_date.isoformat(),
+                "emi_amount": float(_reference_round(emi_value)),
+                "principal": float(principal),
+                "interest": float(interest),
+                "remaining_balance": float(remaining_balance),
+            })
+        return schedule
+
+
+# No due-date roll (LOANS_DUE_DATE_ROLL is read at import): the reference never had one
+@mock.patch.object(services, "_DUE_DATE_ROLL", None)
+class MoneyEngineTests(SimpleTestCase):
+    """The integer-paise money engine must give the frozen Decimal reference's numbers exactly"""
+
+    def setUp(self):
+        services._due_date_row.cache_clear()
+        self.addCleanup(services._due_date_row.cache_clear)
+
+    RATES = ("0", "7.5", "10.0", "12.25", "18", "36")
+    TENURES = (1, 2, 3, 6, 11, 12, 24, 36, 60)
+    START_DATES = (date(2024, 1, 31), date(2025, 6, 15), date(2023, 12, 29))
+
+    def amounts(self):
+        """Seeded sample: whole rupees and amounts with paise, from ₹1 to ₹10 lakh"""
+        rng = random.Random(0)
+        whole = [Decimal(rng.randint(1, 1_000_000)) for _ in range(15)]
+        paise = [Decimal(rng.randint(100, 100_000_000)).scaleb(-2) for _ in range(15)]
+        return [Decimal("1000"), Decimal("100000"), Decimal("0.01"), Decimal("999.99"), *whole, *paise]
+
+    def test_emi(self):
+        for rate in self.RATES:
+            for months in self.TENURES:
+                for amount in self.amounts():
+                    with self.subTest(amount=amount, months=months, rate=rate):
+                        self.assertEqual(calculate_emi(amount, months, Decimal(rate)), reference_emi(amount, months, rate))
+
+    def test_schedule_and_outstanding_principal(self):
+        for number, rate in enumerate(self.RATES):
+            for months in self.TENURES:
+                for amount in self.amounts():
+                    start_date = self.START_DATES[(number + months) % len(self.START_DATES)]
+                    with self.subTest(amount=amount, months=months, rate=rate):
+                        expected = reference_schedule(amount, months, rate, start_date)
+                        self.assertEqual(generate_amortization_schedule(amount, months, Decimal(rate), start_date), expected)
+                        paid = months // 2
+                        if paid:
+                            self.assertEqual(
+                                calculate_outstanding_principal(amount, months, Decimal(rate), paid),
+                                _reference_round(Decimal(str(expected[paid - 1]["remaining_balance"]))),
+                            )
+
+
+# Measure the views themselves, not the response cache in front of them
+@override_settings(LOANS_RESPONSE_CACHE=False)
+class LoanQueryCountTests(TestCase):
+    """Loan listings must not run more queries as they return more rows (no N+1 in the serializer)"""
+
+    LOANS = 120
+    PAGE_SIZES = (1, 10, 100, LOANS)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_admin()
+        cls.borrowers = [create_borrower(f"borrower{number}", number) for number in range(12)]
+        now = timezone.now()
+        Loan.objects.bulk_create(
+            Loan(
+                user=cls.borrowers[number % len(cls.borrowers)],
+                amount=Decimal("10000.00"),
+                tenure=12,
+                monthly_installment=Decimal("879.16"),
+                status="APPROVED" if number % 2 else "PENDING",
+                approved_by=cls.admin if number % 2 else None,
+                approved_date=now if number % 2 else None,
+                applied_date=now,
+            )
+            for number in range(cls.LOANS)
+        )
+
+    def count_queries(self, user, path):
+        client = client_for(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200, response.data)
+        return len(queries)
+
+    def assert_constant_across_page_sizes(self, user):
+        visible = Loan.objects.count() if user.is_staff else Loan.objects.filter(user=user).count()
+        expected = self.count_queries(user, "/api/loans/?paginate=cursor&page_size=1")
+        for size in self.PAGE_SIZES:
+            with self.subTest(page_size=size):
+                with self.assertNumQueries(expected):
+                    response = client_for(user).get(f"/api/loans/?paginate=cursor&page_size={size}")
+                self.assertEqual(len(response.data["results"]), min(size, visible))
+
+    def test_admin_pages(self):
+        self.assert_constant_across_page_sizes(self.admin)
+
+    def test_borrower_pages(self):
+        self.assert_constant_across_page_sizes(self.borrowers[0])
+
+    def test_full_list_is_one_query(self):
+        # Owner, profile and approver come with the loans
+        self.assertEqual(self.count_queries(self.admin, "/api/loans/"), 1)
+
+    def test_detail(self):
+        loan_ids = Loan.objects.filter(status="APPROVED").values_list("id", flat=True)[:2]
+        counts = {self.count_queries(self.admin, f"/api/loans/{loan_id}/") for loan_id in loan_ids}
+        self.assertEqual(len(counts), 1, counts)
+
+
+class QueryPlanTests(TestCase):
+    """Every hot Loan/Payment query (loans.query_plans.hot_queries) must use an index"""
+
+    def test_no_full_table_scans(self):
+        for result in check_query_plans():
+            with self.subTest(query=result["name"]):
+                self.assertEqual(result["full_scans"], [], "\n".join(result["plan"]))
+
+
+class ExposureLedgerTests(TestCase):
+    """CreditExposure must follow every loan write, however the loan was loaded"""
+
+    def setUp(self):
+        self.borrower = create_borrower("ledger")
+
+    def apply(self, amount="30000"):
+        return Loan.objects.create(user=self.borrower, amount=Decimal(amount), tenure=12)
+
+    def test_save_of_partly_loaded_loan(self):
+        loan = self.apply()
+        loan = Loan.objects.only("id").get(pk=loan.pk)
+        loan.status = "REJECTED"
+        loan.save()
+        self.assertEqual(rebuild_exposure(), [])
+
+    def test_queryset_delete_of_active_loans(self):
+        admin = create_admin()
+        self.apply()
+        approved = self.apply("20000")
+        approved.status, approved.approved_by, approved.approved_date = "APPROVED", admin, timezone.now()
+        approved.save()
+        kept = self.apply("10000")
+
+        # What the admin's "Delete selected loans" action runs
+        Loan.objects.exclude(pk=kept.pk).delete()
+        self.assertEqual(rebuild_exposure(), [])
+
+    def test_delete_of_partly_loaded_loan(self):
+        loan = self.apply()
+        Loan.objects.only("id").get(pk=loan.pk).delete()
+        self.assertEqual(rebuild_exposure(), [])
+
+
+class IdempotencyKeyTests(TestCase):
+    """/pay/ retries with the same Idempotency-Key must pay once"""
+
+    def setUp(self):
+        admin = create_admin()
+        self.borrower = create_borrower("payer")
+        self.loan = Loan.objects.create(
+            user=self.borrower, amount=Decimal("10000"), tenure=6,
+            status="APPROVED", approved_by=admin, approved_date=timezone.now(),
+        )
+        self.client = client_for(self.borrower)
+
+    def pay(self, key="key-1", loan=None):
+        return self.client.post(f"/api/loans/{(loan or self.loan).pk}/pay/", {}, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self.pay()
+        retry = self.pay()
+        self.assertEqual(first.status_code, 200, first.data)
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+        self.assertEqual(retry[REPLAY_HEADER], "true")
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 1)
+
+    def test_retry_while_in_progress_is_409(self):
+        first = self.pay()
+        IdempotencyKey.objects.filter(key="key-1").update(status_code=None, response_body=None)
+        response = self.pay()
+        self.assertEqual(response.status_code, 409, response.data)
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 1)
+
+    def test_same_key_for_another_request_is_422(self):
+        self.pay()
+        other = Loan.objects.create(user=self.borrower, amount=Decimal("5000"), tenure=6)
+        response = self.pay(loan=other)
+        self.assertEqual(response.status_code, 422, response.data)
+
+    @override_settings(LOANS_IDEMPOTENCY_LEASE_SECONDS=60)
+    def test_abandoned_claim_is_taken_over_after_its_lease(self):
+        # A worker died after claiming the key: its payment rolled back, the row stayed
+        IdempotencyKey.objects.create(
+            user=self.borrower, key="key-1",
+            request_fingerprint=_fingerprint(APIRequestFactory().post(f"/api/loans/{self.loan.pk}/pay/", {}, format="json")),
+            created_at=timezone.now() - timedelta(seconds=61),
+        )
+        response = self.pay()
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.pay()[REPLAY_HEADER], "true")
+        self.assertEqual(Payment.objects.filter(loan=self.loan).count(), 1)
+
+    def test_attempt_that_lost_its_lease_rolls_back(self):
+        @idempotent
+        def slow_view(request):
+            Payment.objects.create(loan=self.loan, amount=self.loan.monthly_installment, emi_number=1, status="SUCCESS")
+            # Meanwhile a retry took the key over
+            IdempotencyKey.objects.filter(key="slow").update(created_at=timezone.now() + timedelta(seconds=1))
+            return Response({"paid": True})
+
+        request = APIRequestFactory().post("/slow/", {}, format="json", HTTP_IDEMPOTENCY_KEY="slow")
+        request.user = self.borrower
+        response = slow_view(request)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Payment.objects.filter(loan=self.loan).exists())
+
+
+@override_settings(LOANS_RESPONSE_CACHE=True, LOANS_RESPONSE_CACHE_SINGLE_PROCESS=True)
+class ResponseCacheTests(TestCase):
+    """Committed writes retire cached responses; rolled-back ones must not"""
+
+    def setUp(self):
+        caches["default"].clear()
+        cache_stats(reset=True)
+        admin = create_admin()
+        self.borrower = create_borrower("reader")
+        self.loan = Loan.objects.create(
+            user=self.borrower, amount=Decimal("10000"), tenure=6,
+            status="APPROVED", approved_by=admin, approved_date=timezone.now(),
+        )
+        self.client = client_for(self.borrower)
+
+    def fetch(self, path=""):
+        response = self.client.get(f"/api/loans/{self.loan.pk}/{path}")
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def lookups(self, endpoint):
+        counters = cache_stats(reset=True)["endpoints"][endpoint]
+        return counters["hits"], counters["misses"]
+
+    def test_repeated_read_is_a_hit(self):
+        self.fetch()
+        self.fetch()
+        self.assertEqual(self.lookups("loan_detail"), (1, 1))
+
+    def test_committed_payment_is_a_miss(self):
+        self.fetch("payments/")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Payment.objects.create(loan=self.loan, amount=self.loan.monthly_installment, emi_number=1, status="SUCCESS")
+        self.assertTrue(callbacks)
+        response = self.fetch("payments/")
+        self.assertEqual(self.lookups("loan_payments"), (0, 2))
+        self.assertEqual(len(response.data["payments"]), 1)
+
+    def test_committed_loan_write_is_a_miss(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.loan.status = "FORECLOSED"
+            self.loan.save()
+        response = self.fetch()
+        self.assertEqual(self.lookups("loan_detail"), (0, 2))
+        self.assertEqual(response.data["status"], "FORECLOSED")
+
+    def test_rolled_back_write_keeps_the_entry(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ValueError), transaction.atomic():
+                Payment.objects.create(loan=self.loan, amount=self.loan.monthly_installment, emi_number=1, status="SUCCESS")
+                raise ValueError
+        self.assertEqual(callbacks, [])
+        self.fetch()
+        self.assertEqual(self.lookups("loan_detail"), (1, 1))
+
+    @override_settings(LOANS_RESPONSE_CACHE_SINGLE_PROCESS=False)
+    def test_per_process_backend_keeps_the_cache_off(self):
+        self.assertFalse(is_enabled())
+        self.assertEqual([warning.id for warning in check_response_cache(None)], ["loans.W001"])
+        self.fetch()
+        self.fetch()
+        self.assertEqual(cache_stats()["endpoints"], {})
+
+
+class ArchiveTests(TestCase):
+    """Archiving moves closed loans and their payments intact, in a fixed number of queries"""
+
+    def setUp(self):
+        self.admin = create_admin()
+        self.borrower = create_borrower("archived")
+
+    def repaid_loan(self, tenure):
+        loan = Loan.objects.create(
+            user=self.borrower, amount=Decimal("10000"), tenure=tenure,
+            status="APPROVED", approved_by=self.admin, approved_date=timezone.now(),
+        )
+        for emi_number in range(1, tenure + 1):
+            Payment.objects.create(loan=loan, amount=loan.monthly_installment, emi_number=emi_number, status="SUCCESS")
+        loan.refresh_from_db()
+        loan.status = "REPAID"
+        loan.save()
+        return loan
+
+    def archive(self):
+        with CaptureQueriesContext(connection) as queries:
+            # older_than_days=-1: everything closed so far is old enough
+            archived = archive_closed_loans(older_than_days=-1)
+        return archived, len(queries)
+
+    def test_archived_loan_matches_and_is_still_served(self):
+        loan = self.repaid_loan(6)
+        payments = list(Payment.objects.filter(loan=loan).order_by("emi_number").values_list("emi_number", "amount", "status"))
+        detail = client_for(self.borrower).get(f"/api/loans/{loan.pk}/").data
+
+        self.assertEqual(self.archive()[0], (1, 6))
+        self.assertFalse(Loan.objects.filter(pk=loan.pk).exists())
+        archived = ArchivedLoan.objects.get(pk=loan.pk)
+        self.assertEqual(
+            (archived.user_id, archived.amount, archived.status, archived.paid_emi_count),
+            (loan.user_id, loan.amount, "REPAID", 6),
+        )
+        self.assertEqual(
+            list(ArchivedPayment.objects.filter(loan=archived).order_by("emi_number").values_list("emi_number", "amount", "status")),
+            payments,
+        )
+
+        client = client_for(self.borrower)
+        response = client.get(f"/api/loans/{loan.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["id"], response.data["status"], response.data["amount"]), (detail["id"], detail["status"], detail["amount"]))
+        response = client.get(f"/api/loans/{loan.pk}/payments/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["payments"]), 6)
+
+    def test_queries_do_not_grow_with_payments(self):
+        self.repaid_loan(3)
+        _archived, few = self.archive()
+        self.repaid_loan(12)
+        _archived, many = self.archive()
+        self.assertEqual(few, many)
+
+
+class SimulationTests(TestCase):
+    """Scenario runs must not depend on the worker count, nor fill the shared schedule cache"""
+
+    PREPAYMENT = {"prepayment_month": 3, "prepayment_amount": "2000"}
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = create_admin()
+        borrower = create_borrower("simulated")
+        for number in range(24):
+            loan = Loan.objects.create(
+                user=borrower, amount=Decimal(10000 + 1500 * number), tenure=(6, 12, 24)[number % 3],
+                status="APPROVED", approved_by=admin, approved_date=timezone.now(),
+            )
+            Loan.objects.filter(pk=loan.pk).update(paid_emi_count=number % 3)
+
+    def test_workers_agree(self):
+        for scenario in (self.PREPAYMENT, {"yearly_interest": "14", "extra_months": 6, **self.PREPAYMENT}):
+            with self.subTest(scenario=scenario):
+                single = run_simulation(dict(scenario), workers=1, chunk_size=5)
+                pooled = run_simulation(dict(scenario), workers=2, chunk_size=5)
+                self.assertEqual(single, pooled)
+                self.assertEqual(single["loans"], 24)
+
+    def test_prepayment_matches_reference(self):
+        loan = Loan.objects.filter(paid_emi_count=0).order_by("pk").first()
+        result = run_simulation(dict(self.PREPAYMENT), queryset=Loan.objects.filter(pk=loan.pk), workers=1)
+
+        before = reference_schedule(loan.amount, loan.tenure, "10.0", date.today())
+        balance = Decimal(str(before[2]["remaining_balance"])) - Decimal("2000")
+        after = reference_schedule(balance, loan.tenure - 3, "10.0", date.today())
+        self.assertEqual(result["scenario"]["prepayments"], Decimal("2000.00"))
+        self.assertEqual(
+            result["scenario"]["interest_income"],
+            sum((Decimal(str(row["interest"])) for row in before[:3] + after), Decimal("0.00")),
+        )
+        self.assertEqual(
+            result["baseline"]["interest_income"],
+            sum((Decimal(str(row["interest"])) for row in before), Decimal("0.00")),
+        )
+
+    def test_reworked_schedules_stay_out_of_the_shared_cache(self):
+        schedule_template_cache.clear()
+        self.addCleanup(schedule_template_cache.clear)
+        run_simulation({"yearly_interest": "14", **self.PREPAYMENT}, workers=1)
+        terms = {(loan.amount, loan.tenure) for loan in Loan.objects.all()}
+        self.assertTrue(all((amount, months) in terms for amount, months, _rate in schedule_template_cache._templates))
+
+
+class ExposureLimitStressTests(TransactionTestCase):
+    """Parallel applications and approvals must never take a user past the ₹100,000 limit"""
+
+    USERS = 3
+    APPLICATIONS = 8
+    AMOUNT = "30000"
+
+    def test_parallel_apply_and_approve(self):
+        admin = create_admin()
+        applicants = [create_borrower(f"applicant{number}", number) for number in range(self.USERS)]
+        apply = LoanListCreateView.as_view()
+        applications = [
+            (apply, user, "/api/loans/", {"amount": self.AMOUNT, "tenure": 12}, {})
+            for user in applicants for _ in range(self.APPLICATIONS)
+        ]
+
+        # Round 1: everyone applies at once
+        outcomes = run_parallel(applications)
+        self.assertEqual(set(outcomes), {"loans 201", "loans 400"}, outcomes)
+        self.assert_within_limit(applicants)
+
+        # Round 2: approve every pending loan while the same users keep applying
+        pending = Loan.objects.filter(user__in=applicants, status="PENDING").values_list("id", flat=True)
+        outcomes = run_parallel([
+            (approve_loan, admin, f"/api/loans/{loan_id}/approve/", {}, {"pk": loan_id}) for loan_id in pending
+        ] + applications)
+        self.assertFalse([outcome for outcome in outcomes if not outcome.endswith(("200", "201", "400"))], outcomes)
+        self.assert_within_limit(applicants)
+
+    def assert_within_limit(self, users):
+        for user in users:
+            outstanding = sum(
+                Loan.objects.filter(user=user, status__in=["PENDING", "APPROVED"]).values_list("amount", flat=True),
+                Decimal("0"),
+            )
+            self.assertLessEqual(outstanding, EXPOSURE_LIMIT, user.username)
+        self.assertEqual(rebuild_exposure([user.pk for user in users]), [], "exposure ledger drifted")
+
+
+class PaymentLoadTests(TransactionTestCase):
+    """Parallel EMI payments and foreclosures of the same loans must leave every loan consistent"""
+
+    BORROWERS = 3
+    LOANS = 3
+    TENURE = 6
+    REQUESTS = 150
+    FORECLOSE_SHARE = 0.05
+
+    def test_parallel_payments_and_foreclosures(self):
+        admin = create_admin()
+        loans = [
+            Loan.objects.create(
+                user=borrower, amount=Decimal("10000"), tenure=self.TENURE,
+                status="APPROVED", approved_by=admin, approved_date=timezone.now(),
+            )
+            for borrower in (create_borrower(f"payer{number}", number) for number in range(self.BORROWERS))
+            for _ in range(self.LOANS)
+        ]
+
+        # Many requests per loan, so every loan sees parallel pay/foreclose clicks
+        rng = random.Random(0)
+        foreclose = LoanForecloseView.as_view()
+        calls = []
+        for _ in range(self.REQUESTS):
+            loan = rng.choice(loans)
+            if rng.random() < self.FORECLOSE_SHARE:
+                calls.append((foreclose, loan.user, f"/api/loans/{loan.pk}/foreclose/", {}, {"pk": loan.pk}))
+            else:
+                calls.append((make_payment, loan.user, f"/api/loans/{loan.pk}/pay/", {}, {"pk": loan.pk}))
+        outcomes = run_parallel(calls)
+        self.assertFalse([outcome for outcome in outcomes if not outcome.endswith(("200", "400"))], outcomes)
+
+        for loan in Loan.objects.filter(pk__in=[loan.pk for loan in loans]):
+            with self.subTest(loan=loan.pk, status=loan.status):
+                payments = list(Payment.objects.filter(loan=loan).order_by("emi_number"))
+                foreclosures = [payment for payment in payments if payment.payment_type == "FORECLOSURE"]
+                self.assertEqual([payment.emi_number for payment in payments], list(range(1, len(payments) + 1)))
+                self.assertEqual(loan.paid_emi_count, len(payments))
+                if loan.status == "FORECLOSED":
+                    self.assertEqual(foreclosures, payments[-1:])
+                else:
+                    self.assertEqual(foreclosures, [])
+                    self.assertEqual(loan.status, "REPAID" if len(payments) == loan.tenure else "APPROVED")
+        self.assertEqual(rebuild_exposure([loan.user_id for loan in loans]), [], "exposure ledger drifted")
@@ -0,0 +1,72 @@
+"""
+Dirty-field tracking for models.
+
+DirtyFieldsMixin remembers the column values an instance was loaded with
+(from_db / refresh_from_db) and after every save, so a model can tell what
+actually changed without reading the row again:
+
+    class Loan(DirtyFieldsMixin, models.Model):
+        ...
+
+    loan = Loan.objects.get(pk=1)
+    loan.status = "APPROVED"
+    loan.get_dirty_fields()       # {"status": "PENDING"}
+    loan.save(update_fields=loan.get_dirty_fields())
+"""
+
+
+class DirtyFieldsMixin:
+    """Snapshot loaded field values and report which fields changed since"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {}
+        instance._snapshot_fields()
+        return instance
+
+    def _snapshot_fields(self, field_names=None):
+        """Record the current value of the loaded (non-deferred) concrete fields"""
+        if not hasattr(self, "_loaded_values"):
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            if field_names is not None and field.name not in field_names and field.attname not in field_names:
+                continue
+            if field.attname in self.__dict__:
+                self._loaded_values[field.attname] = self.__dict__[field.attname]
+
+    def get_loaded_value(self, attname, default=None):
+        """Value a field had when last loaded or saved (default if unknown)"""
+        return getattr(self, "_loaded_values", {}).get(attname, default)
+
+    def get_dirty_fields(self) -> dict:
+        """
+        {field name: value as loaded} for every field changed since the
+        last load/save. Instances that were never loaded report every
+        concrete field; deferred fields that were never touched are clean.
+        """
+        loaded_values = getattr(self, "_loaded_values", None)
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if loaded_values is None:
+                dirty[field.name] = None
+            elif field.attname not in self.__dict__:
+                continue  # Deferred and never loaded
+            elif field.attname not in loaded_values or loaded_values[field.attname] != self.__dict__[field.attname]:
+                dirty[field.name] = loaded_values.get(field.attname)
+        return dirty
+
+    def is_dirty(self, *field_names) -> bool:
+        """True if any of the given fields (or any field at all) changed"""
+        dirty = self.get_dirty_fields()
+        return bool(dirty) if not field_names else any(name in dirty for name in field_names)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._snapshot_fields(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_fields(kwargs.get("update_fields"))
@@ -1,10 +1,18 @@
 from django.urls import path
 from .views import LoanListCreateView, LoanForecloseView, LoanDetailView
-from .views import approve_loan,reject_loan, delete_loan,make_payment, get_loan_schedule, get_next_payment
+from .views import approve_loan,reject_loan, bulk_decide_loans, delete_loan,make_payment, get_loan_schedule, get_next_payment
 from .views import get_loan_payments, send_email_to_user, send_whatsapp_to_user
+from .views import get_portfolio_projection, get_due_loans, get_response_cache_stats, simulate_portfolio_scenario
+from .views import ingest_settlement_file
 
 urlpatterns = [
     path("", LoanListCreateView.as_view(), name="loan_list_create"),
+    path("projection/", get_portfolio_projection, name="portfolio_projection"),
+    path("simulate/", simulate_portfolio_scenario, name="simulate_scenario"),
+    path("due/", get_due_loans, name="due_loans"),
+    path("cache-stats/", get_response_cache_stats, name="response_cache_stats"),
+    path("bulk-decision/", bulk_decide_loans, name="bulk_decide_loans"),
+    path("settlements/", ingest_settlement_file, name="ingest_settlements"),
     path("<int:pk>/", LoanDetailView.as_view(), name="loan_detail"),
     path("<int:pk>/foreclose/", LoanForecloseView.as_view(), name="loan_foreclose"),
 
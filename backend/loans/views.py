@@ -1,3 +1,6 @@
+import os
+from collections import Counter
+
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -5,67 +8,116 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 
-from .models import Loan, Payment
-from .serializers import LoanSerializer, PaymentSerializer, LoanCreateSerializer
+from .models import ArchivedLoan, Loan, Payment
+from .bulk_decisions import decide_loans, max_decisions
+from .conditional import loan_etag, not_modified_response, user_etag_parts
+from .exposure import EXPOSURE_LIMIT, lock_exposure
+from .idempotency import idempotent
+from .serializers import (
+    ArchivedLoanSerializer,
+    ArchivedPaymentSerializer,
+    LoanCreateSerializer,
+    LoanSerializer,
+    PaymentSerializer,
+)
 from .permissions import IsAdminRole
 from .notifications import send_loan_email, send_loan_whatsapp
+from .pagination import LoanCursorPagination, PaymentCursorPagination
+from .payments import PaymentError, foreclose, pay_next_emi
+from .response_cache import cache_stats, cached_response
+from .services import due_and_overdue_loans, project_portfolio_cash_flows
+from .settlements import FORMATS as SETTLEMENT_FORMATS, guess_format, ingest_settlements, max_reported_errors
+from .simulation import SimulationTimeout, run_simulation
+from .state import can_transition, transition
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Sum, Q
+from django.db import transaction
 
 
 class LoanListCreateView(generics.ListCreateAPIView):
     """
     List and create loans with different serializers for GET/POST
+    (add ?paginate=cursor for cursor pages instead of the full list)
     """
 
     permission_classes = [IsAuthenticated]
+    pagination_class = LoanCursorPagination
 
     def get_serializer_class(self):
         return LoanCreateSerializer if self.request.method == "POST" else LoanSerializer
 
     def get_queryset(self):
         user = self.request.user
+        # The list never shows schedules, so don't fetch the packed blob;
+        # owner, profile and approver come in the same query
+        loans = Loan.objects.select_related(*LoanSerializer.SELECT_RELATED).defer("schedule_data")
         if user.is_staff:
-            return Loan.objects.all().order_by("-applied_date")
+            return loans.order_by("-applied_date")
+
+        return loans.filter(user=user).order_by("-applied_date")
 
-        return Loan.objects.filter(user=user).order_by("-applied_date")
+    @cached_response("loan_list", scope="list")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """Auto-assign user and validate loan limit before creating"""
         user = self.request.user
-
-        # Check existing loan limit (₹100,000 max per user)
-        existing_loans_total = (
-            Loan.objects.filter(user=user)
-            .filter(Q(status="PENDING") | Q(status="APPROVED"))
-            .aggregate(Sum("amount"))["amount__sum"]
-            or 0
-        )
-
         requested_amount = serializer.validated_data["amount"]
 
-        if existing_loans_total + requested_amount > 100000:
-            raise ValidationError(
-                {
-                    "error": f"Loan limit exceeded. You already have ₹{existing_loans_total} in pending/approved loans."
-                }
-            )
+        with transaction.atomic():
+            # Check existing loan limit (₹100,000 max per user) on the locked
+            # exposure row, so parallel applications are checked one by one
+            existing_loans_total = lock_exposure(user.pk).total
 
-        serializer.save(user=user, interest_rate=10.0, status="PENDING")
+            if existing_loans_total + requested_amount > EXPOSURE_LIMIT:
+                raise ValidationError(
+                    {
+                        "error": f"Loan limit exceeded. You already have ₹{existing_loans_total} in pending/approved loans."
+                    }
+                )
+
+            serializer.save(user=user, interest_rate=10.0, status="PENDING")
 
 
 class LoanDetailView(generics.RetrieveAPIView):
-    """View details of a single loan"""
+    """View details of a single loan (archived loans included; supports If-None-Match)"""
 
     serializer_class = LoanSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
+        loans = Loan.objects.select_related(*LoanSerializer.SELECT_RELATED)
         if user.is_staff:
-            return Loan.objects.all()
-        return Loan.objects.filter(user=user)
+            return loans
+        return loans.filter(user=user)
+
+    @cached_response("loan_detail")
+    def retrieve(self, request, *args, **kwargs):
+        loan = self.get_queryset().filter(pk=kwargs["pk"]).first()
+        serializer_class = self.get_serializer_class()
+        if loan is None:
+            # Not in the hot table: it may have been moved to the archive
+            archived = ArchivedLoan.objects.select_related(*LoanSerializer.SELECT_RELATED)
+            if not request.user.is_staff:
+                archived = archived.filter(user=request.user)
+            loan = archived.filter(pk=kwargs["pk"]).first()
+            if loan is None:
+                raise Http404("No Loan matches the given query.")
+            serializer_class = ArchivedLoanSerializer
+
+        # Conditional GET: answer 304 before serializing if nothing changed
+        approver = loan.approved_by.username if loan.approved_by else None
+        etag = loan_etag(loan, approver, *user_etag_parts(loan.user))
+        not_modified = not_modified_response(request, etag)
+        if not_modified:
+            return not_modified
+
+        response = Response(serializer_class(loan).data)
+        response["ETag"] = etag
+        return response
 
 
 class LoanForecloseView(APIView):
@@ -92,9 +144,9 @@ class LoanForecloseView(APIView):
             )
 
         # Calculate outstanding amount
-        outstanding_amount = loan.calculate_outstanding_amount()
-        payments_made = loan.payments.filter(status="SUCCESS").count()
+        payments_made = loan.paid_emi_count
         payments_remaining = loan.tenure - payments_made
+        outstanding_amount = loan.calculate_outstanding_amount()
 
         return Response(
             {
@@ -108,63 +160,20 @@ class LoanForecloseView(APIView):
             }
         )
 
+    @idempotent
     def post(self, request, pk):
-        loan = get_object_or_404(Loan, id=pk)
-
-        # Permission check
-        if loan.user != request.user and not request.user.is_staff:
-            return Response(
-                {"error": "You can only foreclose your own loans"},
-                status=status.HTTP_403_FORBIDDEN,
-            )
-
-        # Business logic checks
-        if loan.status != "APPROVED":
-            return Response(
-                {"error": "Only approved loans can be foreclosed"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Calculate outstanding amount
-        outstanding_amount = loan.calculate_outstanding_amount()
-        payments_made = loan.payments.filter(status="SUCCESS").count()
-        payments_remaining = loan.tenure - payments_made
-
-        # If no outstanding amount, loan is already fully paid
-        if outstanding_amount <= 0:
-            return Response(
-                {"error": "Loan has no outstanding amount"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Create a final payment record for foreclosure settlement
-        Payment.objects.create(
-            loan=loan,
-            amount=outstanding_amount,
-            emi_number=payments_made + 1,  # Next EMI number
-            status="SUCCESS",
-            payment_type="FORECLOSURE",  # Mark as foreclosure payment
-            gateway_reference=f"FORECLOSURE_{timezone.now().strftime('%Y%m%d%H%M%S')}",
-            gateway_response={
-                "type": "foreclosure",
-                "message": "Loan foreclosed - full settlement",
-                "emis_cleared": payments_remaining,
-            },
-        )
-
-        # Update loan status with foreclosure details
-        loan.status = "FORECLOSED"
-        loan.is_closed = True
-        loan.foreclosure_date = timezone.now()
-        loan.foreclosure_amount = outstanding_amount
-        loan.save()
+        """Foreclose in one row-locked transaction (see loans.payments); honours Idempotency-Key"""
+        try:
+            loan, _payment, payments_made, payments_remaining = foreclose(pk, request.user)
+        except PaymentError as exc:
+            return Response(exc.payload, status=exc.status_code)
 
         return Response(
             {
                 "message": "Loan foreclosed successfully",
                 "loan_id": loan.id,
                 "status": loan.status,
-                "foreclosure_amount": float(outstanding_amount),
+                "foreclosure_amount": float(loan.foreclosure_amount),
                 "emis_paid_before_foreclosure": payments_made,
                 "emis_cleared_by_foreclosure": payments_remaining,
                 "foreclosure_date": loan.foreclosure_date.isoformat(),
@@ -177,41 +186,40 @@ class LoanForecloseView(APIView):
 @permission_classes([IsAdminRole])
 def approve_loan(request, pk):
     """Admin approves a pending loan"""
-    loan = get_object_or_404(Loan, id=pk)
-
-    if loan.status != "PENDING":
-        return Response(
-            {"error": "Only pending loans can be approved"},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
-
-    # Check loan limit (₹100,000 max per user)
-    user_approved_loans = (
-        Loan.objects.filter(user=loan.user, status="APPROVED").aggregate(
-            total_amount=Sum("amount")
-        )["total_amount"]
-        or 0
+    loan = get_object_or_404(Loan.objects.select_related(*LoanSerializer.SELECT_RELATED), id=pk)
+    not_pending = Response(
+        {"error": "Only pending loans can be approved"},
+        status=status.HTTP_400_BAD_REQUEST,
     )
+    if not can_transition(loan, "APPROVED"):
+        return not_pending
+
+    with transaction.atomic():
+        # The user's exposure row lock serialises limit checks; the status
+        # compare-and-swap decides which of two parallel approvals wins
+        user_approved_loans = lock_exposure(loan.user_id).approved_amount
+
+        # Check loan limit (₹100,000 max per user)
+        if user_approved_loans + loan.amount > EXPOSURE_LIMIT:
+            rejected = transition(
+                loan, "REJECTED_LIMIT",
+                rejection_reason=f"Loan limit exceeded. User already has ₹{user_approved_loans} in approved loans.",
+            )
+            if not rejected:
+                return not_pending
+            return Response(
+                {
+                    "error": "Loan rejected - user exceeded ₹100,000 limit",
+                    "current_total": float(user_approved_loans),
+                    "requested_amount": float(loan.amount),
+                    "remaining_limit": float(EXPOSURE_LIMIT - user_approved_loans),
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-    if user_approved_loans + loan.amount > 100000:
-        loan.status = "REJECTED_LIMIT"
-        loan.rejection_reason = f"Loan limit exceeded. User already has ₹{user_approved_loans} in approved loans."
-        loan.save()
-        return Response(
-            {
-                "error": "Loan rejected - user exceeded ₹100,000 limit",
-                "current_total": float(user_approved_loans),
-                "requested_amount": float(loan.amount),
-                "remaining_limit": float(100000 - user_approved_loans),
-            },
-            status=status.HTTP_400_BAD_REQUEST,
-        )
-
-    # Approve the loan
-    loan.status = "APPROVED"
-    loan.approved_by = request.user
-    loan.approved_date = timezone.now()
-    loan.save()
+        # Approve the loan (also writes its schedule and first due EMI)
+        if not transition(loan, "APPROVED", approved_by=request.user, approved_date=timezone.now()):
+            return not_pending
 
     # Get updated loan data
     serializer = LoanSerializer(loan)
@@ -225,7 +233,7 @@ def reject_loan(request, pk):
     """Admin rejects a pending loan"""
     loan = get_object_or_404(Loan, id=pk)
 
-    if loan.status != "PENDING":
+    if not can_transition(loan, "REJECTED"):
         return Response(
             {"error": "Only pending loans can be rejected"},
             status=status.HTTP_400_BAD_REQUEST,
@@ -239,9 +247,12 @@ def reject_loan(request, pk):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    loan.status = "REJECTED"
-    loan.rejection_reason = reason
-    loan.save()
+    if not transition(loan, "REJECTED", rejection_reason=reason):
+        # Approved or rejected by someone else since it was read
+        return Response(
+            {"error": "Only pending loans can be rejected"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     return Response(
         {
@@ -253,6 +264,29 @@ def reject_loan(request, pk):
     )
 
 
+@api_view(["POST"])
+@permission_classes([IsAdminRole])
+def bulk_decide_loans(request):
+    """
+    Admin approves / rejects many pending loans at once:
+    {"decisions": [{"loan_id": 1, "decision": "approve"},
+                   {"loan_id": 2, "decision": "reject", "reason": "..."}]}
+    """
+    decisions = request.data.get("decisions") if isinstance(request.data, dict) else None
+    if not isinstance(decisions, list) or not decisions:
+        return Response({"error": "decisions must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(decisions) > max_decisions():
+        return Response(
+            {"error": f"At most {max_decisions()} decisions per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    results = decide_loans(decisions, request.user)
+
+    summary = Counter(result.get("status") if "error" not in result else "failed" for result in results)
+    return Response({"processed": len(results), "summary": dict(summary), "results": results})
+
+
 @api_view(["DELETE"])
 @permission_classes([IsAdminRole])
 def delete_loan(request, pk):
@@ -274,63 +308,163 @@ def delete_loan(request, pk):
     return Response({"message": "Loan deleted permanently", "deleted_loan_id": loan_id})
 
 
-# PAYMENT RELATED VIEWS
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def make_payment(request, pk):
-    """Mock payment gateway for EMI payments"""
-    loan = get_object_or_404(Loan, id=pk)
 
-    # Permission check
-    if loan.user != request.user and not request.user.is_staff:
-        return Response(
-            {"error": "Not authorized to make payments for this loan"},
-            status=status.HTTP_403_FORBIDDEN,
-        )
+@api_view(["GET"])
+@permission_classes([IsAdminRole])
+def get_portfolio_projection(request):
+    """Admin view: expected collections per month across all approved loans"""
+    projection = project_portfolio_cash_flows()
+
+    def as_floats(bucket):
+        return {
+            key: float(value) if key in ("emi_amount", "principal", "interest") else value
+            for key, value in bucket.items()
+        }
 
-    # Business logic checks
-    if loan.status != "APPROVED":
+    return Response(
+        {
+            "loans": projection["loans"],
+            "totals": as_floats(projection["totals"]),
+            "months": [as_floats(month) for month in projection["months"]],
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminRole])
+def get_due_loans(request):
+    """
+    Admin view: loans with an EMI due in the next ?days=N days (default 7)
+    and overdue loans by days-past-due bucket
+    """
+    try:
+        days = int(request.query_params.get("days", 7))
+    except ValueError:
+        return Response({"error": "days must be a whole number"}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 <= days <= 366:
+        return Response({"error": "days must be between 0 and 366"}, status=status.HTTP_400_BAD_REQUEST)
+
+    report = due_and_overdue_loans(days)
+
+    def as_response(group):
+        loans = [{**loan, "emi_amount": float(loan["emi_amount"])} for loan in group["loans"]]
+        return {**group, "amount": float(group["amount"]), "loans": loans}
+
+    return Response(
+        {
+            "as_of": report["as_of"].isoformat(),
+            "days": report["days"],
+            "due": as_response(report["due"]),
+            "overdue": {
+                "count": report["overdue"]["count"],
+                "amount": float(report["overdue"]["amount"]),
+                "buckets": [as_response(bucket) for bucket in report["overdue"]["buckets"]],
+            },
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminRole])
+def get_response_cache_stats(request):
+    """Admin view: response-cache hits, misses and hit rate per endpoint (?reset=1 to zero them)"""
+    return Response(cache_stats(reset=request.query_params.get("reset") == "1"))
+
+
+@api_view(["POST"])
+@permission_classes([IsAdminRole])
+def ingest_settlement_file(request):
+    """
+    Admin view: apply a gateway settlement file of EMI payments, uploaded
+    as multipart "file" (NDJSON or CSV, see loans.settlements; "format"
+    overrides the guess from the file name)
+    """
+    upload = request.FILES.get("file")
+    if upload is None:
+        return Response({"error": 'Upload the settlement file as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+    file_format = request.data.get("format") or guess_format(upload.name)
+    if file_format not in SETTLEMENT_FORMATS:
         return Response(
-            {"error": "Can only pay for approved loans"},
+            {"error": f"format must be one of: {', '.join(SETTLEMENT_FORMATS)}"},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    paid_emis = loan.payments.filter(status="SUCCESS").count()
-    if paid_emis >= loan.tenure:
-        return Response(
-            {"error": "Loan is already fully paid"}, status=status.HTTP_400_BAD_REQUEST
-        )
+    errors = []
+    limit = max_reported_errors()
+
+    def keep_error(error):
+        if len(errors) < limit:
+            errors.append(error)
+
+    # The upload is read line by line (large ones are spooled to disk by Django)
+    report = ingest_settlements(upload, file_format, on_error=keep_error)
+    return Response({**report, "errors": errors, "errors_truncated": report["failed"] > len(errors)})
 
-    # Check if next EMI is due (prevent skipping EMIs)
-    next_emi_number = paid_emis + 1
-    existing_payment = Payment.objects.filter(
-        loan=loan, emi_number=next_emi_number
-    ).first()
-    if existing_payment:
+
+@api_view(["POST"])
+@permission_classes([IsAdminRole])
+def simulate_portfolio_scenario(request):
+    """
+    Admin view: rerun the approved book under a what-if scenario.
+    Body: {"yearly_interest", "extra_months", "prepayment_month",
+    "prepayment_amount"} (all optional), plus optional "workers" and
+    "chunk_size" to override the pool settings.
+    """
+    scenario = dict(request.data)
+    workers = scenario.pop("workers", None)
+    chunk_size = scenario.pop("chunk_size", None)
+    try:
+        # Never start more processes than the server has CPUs
+        workers = None if workers is None else min(int(workers), os.cpu_count() or 1)
+        chunk_size = None if chunk_size is None else int(chunk_size)
+    except (TypeError, ValueError):
         return Response(
-            {
-                "error": f"EMI #{next_emi_number} already exists",
-                "payment_id": existing_payment.id,
-                "status": existing_payment.status,
-            },
+            {"error": "workers and chunk_size must be whole numbers"},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    # Process payment
-    payment = Payment.objects.create(
-        loan=loan,
-        amount=loan.monthly_installment,
-        emi_number=next_emi_number,
-        status="SUCCESS",
-        gateway_reference=f"MOCK_{timezone.now().strftime('%Y%m%d%H%M%S')}",
-        gateway_response={"mock": True, "message": "Payment simulated successfully"},
+    try:
+        result = run_simulation(scenario, workers=workers, chunk_size=chunk_size)
+    except ValueError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    except SimulationTimeout as error:
+        return Response({"error": str(error)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+
+    return Response(
+        {
+            "loans": result["loans"],
+            "baseline": {key: float(value) for key, value in result["baseline"].items()},
+            "scenario": {key: float(value) for key, value in result["scenario"].items()},
+            "delta": {key: float(value) for key, value in result["delta"].items()},
+            "months": [
+                {
+                    "month": month["month"],
+                    "baseline": float(month["baseline"]),
+                    "scenario": float(month["scenario"]),
+                    "delta": float(month["delta"]),
+                }
+                for month in result["months"]
+            ],
+        }
     )
 
-    # Check if loan is now fully paid
-    if next_emi_number >= loan.tenure:
-        loan.status = "REPAID"
-        loan.is_closed = True
-        loan.save()
+
+# PAYMENT RELATED VIEWS
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@idempotent
+def make_payment(request, pk):
+    """
+    Mock payment gateway for EMI payments (one row-locked transaction, see
+    loans.payments); honours Idempotency-Key
+    """
+    try:
+        loan, payment = pay_next_emi(pk, request.user)
+    except PaymentError as exc:
+        return Response(exc.payload, status=exc.status_code)
+
+    next_emi_number = payment.emi_number
+    if loan.status == "REPAID":
         message = f"Final EMI #{next_emi_number} paid successfully - Loan Fully Repaid!"
     else:
         message = f"EMI #{next_emi_number} paid successfully"
@@ -352,31 +486,67 @@ def make_payment(request, pk):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_response("loan_schedule")
 def get_loan_schedule(request, pk):
-    """Get amortization schedule for a specific loan"""
+    """Get amortization schedule for a specific loan (supports If-None-Match)"""
     loan = get_object_or_404(Loan, id=pk)
 
-    if loan.user != request.user and not request.user.is_staff:
+    if loan.user_id != request.user.id and not request.user.is_staff:
         return Response(
             {"error": "Not authorized to view this loan schedule"},
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    schedule = loan.get_amortization_schedule()
-    payments_made = loan.payments.filter(status="SUCCESS").count()
+    # Optional window: ?from=4&to=6 returns only EMIs 4-6
+    try:
+        first_emi = int(request.query_params.get("from", 1))
+        last_emi = int(request.query_params.get("to", loan.tenure))
+    except ValueError:
+        return Response(
+            {"error": "'from' and 'to' must be EMI numbers"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    # Mark which payments have been made
-    for i, payment_entry in enumerate(schedule):
-        payment_entry["paid"] = i < payments_made
-        if i < payments_made:
-            try:
-                payment = loan.payments.get(emi_number=i + 1, status="SUCCESS")
-                payment_entry["payment_date"] = payment.payment_date.isoformat()
-                payment_entry["payment_id"] = payment.id
-            except Payment.DoesNotExist:
-                payment_entry["payment_date"] = None
+    if first_emi < 1 or last_emi < first_emi:
+        return Response(
+            {"error": "Invalid range: need 1 <= from <= to"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    return Response(
+    payments_made = loan.paid_emi_count
+
+    # Conditional GET: same loan state and window means the same schedule
+    etag = loan_etag(loan, first_emi, last_emi)
+    not_modified = not_modified_response(request, etag)
+    if not_modified:
+        return not_modified
+
+    # Successful payments for the paid EMIs in the window, in one query
+    paid_until = min(last_emi, payments_made)
+    payments = {}
+    if first_emi <= paid_until:
+        payments = {
+            emi_number: (payment_id, payment_date)
+            for emi_number, payment_id, payment_date in Payment.objects.filter(
+                loan=loan, status="SUCCESS", emi_number__range=(first_emi, paid_until)
+            ).values_list("emi_number", "id", "payment_date")
+        }
+
+    # Mark which payments have been made (only for the rows we return)
+    schedule = []
+    for entry in loan.iter_amortization_schedule(first_emi, last_emi):
+        paid = entry["emi_number"] <= payments_made
+        row = {**entry, "paid": paid}
+        if paid:
+            payment = payments.get(entry["emi_number"])
+            if payment:
+                row["payment_date"] = payment[1].isoformat()
+                row["payment_id"] = payment[0]
+            else:
+                row["payment_date"] = None
+        schedule.append(row)
+
+    response = Response(
         {
             "loan_id": loan.id,
             "amount": float(loan.amount),
@@ -384,18 +554,23 @@ def get_loan_schedule(request, pk):
             "interest_rate": loan.interest_rate,
             "payments_made": payments_made,
             "payments_remaining": loan.tenure - payments_made,
+            "from": first_emi,
+            "to": min(last_emi, loan.tenure),
             "schedule": schedule,
         }
     )
+    response["ETag"] = etag
+    return response
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_response("next_payment")
 def get_next_payment(request, pk):
-    """Get next due payment details"""
+    """Get next due payment details (supports If-None-Match)"""
     loan = get_object_or_404(Loan, id=pk)
 
-    if loan.user != request.user and not request.user.is_staff:
+    if loan.user_id != request.user.id and not request.user.is_staff:
         return Response({"error": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
 
     if loan.status != "APPROVED":
@@ -404,11 +579,17 @@ def get_next_payment(request, pk):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    # Conditional GET: the next EMI only moves with the loan's state
+    etag = loan_etag(loan)
+    not_modified = not_modified_response(request, etag)
+    if not_modified:
+        return not_modified
+
     next_payment = loan.get_next_payment_details()
-    payments_made = loan.payments.filter(status="SUCCESS").count()
+    payments_made = loan.paid_emi_count
 
     if next_payment:
-        return Response(
+        response = Response(
             {
                 "loan_id": loan.id,
                 "next_payment": next_payment,
@@ -419,7 +600,7 @@ def get_next_payment(request, pk):
             }
         )
     else:
-        return Response(
+        response = Response(
             {
                 "message": "No payments due - loan may be completed or not active",
                 "loan_status": loan.status,
@@ -427,29 +608,54 @@ def get_next_payment(request, pk):
                 "total_tenure": loan.tenure,
             }
         )
+    response["ETag"] = etag
+    return response
 
 
 # Get all payments for a loan
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_response("loan_payments")
 def get_loan_payments(request, pk):
-    """Get all payments for a specific loan"""
-    loan = get_object_or_404(Loan, id=pk)
+    """
+    Get all payments for a specific loan (archived loans included).
+    With ?paginate=cursor, returns one page of payments in EMI order plus
+    next/previous links instead.
+    """
+    loan = Loan.objects.filter(id=pk).first()
+    payment_serializer = PaymentSerializer
+    if loan is None:
+        loan = get_object_or_404(ArchivedLoan, id=pk)
+        payment_serializer = ArchivedPaymentSerializer
 
-    if loan.user != request.user and not request.user.is_staff:
+    if loan.user_id != request.user.id and not request.user.is_staff:
         return Response(
             {"error": "Not authorized to view these payments"},
             status=status.HTTP_403_FORBIDDEN,
         )
 
     payments = loan.payments.all().order_by("emi_number")
-    serializer = PaymentSerializer(payments, many=True)
+
+    paginator = PaymentCursorPagination()
+    page = paginator.paginate_queryset(payments, request)
+    if page is not None:
+        return Response(
+            {
+                "loan_id": loan.id,
+                "successful_payments": loan.paid_emi_count,
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+                "payments": payment_serializer(page, many=True).data,
+            }
+        )
+
+    serializer = payment_serializer(payments, many=True)
 
     return Response(
         {
             "loan_id": loan.id,
             "total_payments": payments.count(),
-            "successful_payments": payments.filter(status="SUCCESS").count(),
+            "successful_payments": loan.paid_emi_count,
             "payments": serializer.data,
         }
     )